@@ -0,0 +1,115 @@
+"""
+Benchmark of the line searches of bfgs on the example functions: the weak
+Wolfe line search by bisection (the default), the weak Wolfe line search
+with safeguarded interpolation (interpolate=True, see linesch_ww) and the
+strong Wolfe line search (strongwolfe=True, see linesch_sw), and, for the
+problems which are sums of maxima of affine functions (l1 and tv), the
+weak Wolfe line search by breakpoints of a MaxAffineOracle (see
+maxaffine.py).
+
+For each problem, size and line search, full BFGS is run from nstart
+points drawn by setx0 from a fixed seed, and the number of function
+evaluations, of line searches (iterations) and of evaluations per line
+search, and the final function value and termination code of each run
+are reported. The relative change in evaluations with respect to
+bisection is given for the cases whose worst run reaches (nearly) the f
+of the worst run with bisection.
+
+Usage:
+
+    PYTHONPATH=. python benchmarks/bench_linesearch.py
+    PYTHONPATH=. python benchmarks/bench_linesearch.py --sizes 10,100,1000
+
+(or install pyHANSO first, see README.md)
+
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import argparse
+import numpy as np
+
+from hanso.bfgs import bfgs
+from hanso.setx0 import setx0
+from hanso.oracle import Oracle
+from hanso.instrument import Stats
+from hanso.maxaffine import max_affine_l1, max_affine_tv
+from bench_solvers import PROBLEMS
+
+# name -> params of bfgs
+LINESEARCHES = (("bisection", dict()),
+                ("interpolation", dict(interpolate=True)),
+                ("strong", dict(strongwolfe=True)),
+                )
+
+# problems which are max-of-affine objectives -> their MaxAffineOracle
+MAX_AFFINE = dict(l1=max_affine_l1, tv=max_affine_tv)
+
+
+def run_case(problem, nvar, params, seed=42, nstart=5, maxit=500):
+    """
+    Run full BFGS on a problem with the given line search params (or
+    with its MaxAffineOracle, if params is None).
+
+    Returns
+    -------
+    nfeval, niter, f, info: int, int, 1D array and list of ints
+        number of evaluations and of line searches, and final function
+        values and termination codes of the runs
+
+    """
+
+    func, grad, _, _ = PROBLEMS[problem]
+    np.random.seed(seed)
+    x0 = setx0(nvar, nstart)
+    if params is None:
+        oracle, params = MAX_AFFINE[problem](nvar), dict()
+    else:
+        oracle = Oracle(func, grad=grad)
+    stats = Stats()
+    _, f, _, _, _, info = bfgs(oracle, x0=x0, maxit=maxit, verbose=0,
+                               output_records=0, stats=stats,
+                               **params)[:6]
+    return oracle.nfeval, stats.get('nlinesearch', 0), np.atleast_1d(f), \
+        list(info)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the line searches of bfgs on the example "
+        "functions")
+    parser.add_argument("--problems", default=",".join(sorted(PROBLEMS)))
+    parser.add_argument("--sizes", default="10,100")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--nstart", type=int, default=5)
+    parser.add_argument("--maxit", type=int, default=500)
+    args = parser.parse_args()
+
+    print "%-10s %6s %-13s %7s %6s %8s %10s %9s  %s" % (
+        "func", "nvar", "linesearch", "nfeval", "niter", "per ls",
+        "worst f", "change", "f (info) of each run")
+    for problem in args.problems.split(","):
+        fixed_nvar = PROBLEMS[problem][3]
+        sizes = [fixed_nvar] if fixed_nvar else [
+            int(nvar) for nvar in args.sizes.split(",")]
+        for nvar in sizes:
+            reference = None
+            linesearches = LINESEARCHES
+            if problem in MAX_AFFINE:
+                linesearches += (("breakpoints", None),)
+            for name, params in linesearches:
+                nfeval, niter, f, info = run_case(
+                    problem, nvar, params, seed=args.seed,
+                    nstart=args.nstart, maxit=args.maxit)
+                worst = np.max(f)
+                if reference is None:
+                    reference = nfeval, worst
+                change = "-"
+                if worst <= reference[1] + 1e-6 * max(1., abs(reference[1])):
+                    change = "%+.0f%%" % (
+                        100. * (nfeval - reference[0]) / reference[0])
+                print "%-10s %6i %-13s %7i %6i %8.2f %10.2e %9s  %s" % (
+                    problem, nvar, name, nfeval, niter,
+                    1. * nfeval / max(niter, 1), worst, change,
+                    " ".join("%.1e(%i)" % (fj, code)
+                             for fj, code in zip(f, info)))
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of the qpspecial backends ("closed", "wolfe" and "ipm")
+on bundles of gradients captured from real bfgs1run traces on the
+example functions.
+
+Usage:
+
+    PYTHONPATH=. python benchmarks/bench_qpspecial.py
+
+(or install pyHANSO first, see README.md)
+
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import time
+import numpy as np
+
+from hanso import bundleqp
+from hanso.bfgs1run import bfgs1run
+from hanso.qpspecial import qpspecial
+from hanso.example_functions import l1, grad_l1, tv, grad_tv
+
+
+def capture_bundles(func, grad, nvar, maxit=300, ngrad=None, seed=42):
+    """
+    Run bfgs1run on func, and return all the bundles of gradients it
+    passes to qpspecial (in Gram matrix form).
+
+    """
+
+    bundles = []
+    _qpspecial = bundleqp.qpspecial
+
+    def _capture(G, **kwargs):
+        bundles.append(np.array(G))
+        return _qpspecial(G, **kwargs)
+
+    bundleqp.qpspecial = _capture
+    try:
+        rng = np.random.RandomState(seed)
+        bfgs1run(func, rng.randn(nvar), grad=grad, maxit=maxit,
+                 ngrad=ngrad, evaldist=1e-3, gradnormtol=1e-10, verbose=0)
+    finally:
+        bundleqp.qpspecial = _qpspecial
+    return bundles
+
+
+def bench(bundles, solvers=("closed", "wolfe", "ipm", "auto")):
+    """
+    Solve each bundle with each backend, from a cold start.
+
+    Returns
+    -------
+    results: dict
+        solver -> (number of bundles solved, total time, total iterations,
+        worst objective excess over the best backend)
+
+    """
+
+    results = dict((solver, [0, 0., 0, 0.]) for solver in solvers)
+    for G in bundles:
+        Q = np.dot(G.T, G)
+        q = {}
+        for solver in solvers:
+            if solver == "closed" and G.shape[1] > 3:
+                continue
+            t0 = time.time()
+            _, _, q[solver], info = qpspecial(G, Q=Q, verbose=0,
+                                              solver=solver)
+            results[solver][0] += 1
+            results[solver][1] += time.time() - t0
+            results[solver][2] += info[1]
+        qmin = min(q.values())
+        for solver in q:
+            results[solver][3] = max(results[solver][3], q[solver] - qmin)
+    return results
+
+
+if __name__ == "__main__":
+    problems = [("l1", l1, grad_l1, 50, 10),
+                ("l1", l1, grad_l1, 200, 60),
+                ("tv", tv, grad_tv, 100, 30),
+                ]
+    print "%-5s %6s %6s %8s %-7s %8s %10s %8s %10s" % (
+        "func", "nvar", "ngrad", "bundles", "solver", "solved", "time (s)",
+        "iters", "excess")
+    for name, func, grad, nvar, ngrad in problems:
+        bundles = capture_bundles(func, grad, nvar, ngrad=ngrad)
+        for solver, (nsolved, duration, nit, excess) in sorted(
+            bench(bundles).items()):
+            print "%-5s %6i %6i %8i %-7s %8i %10.4f %8i %10.2e" % (
+                name, nvar, ngrad, len(bundles), solver, nsolved, duration,
+                nit, excess)
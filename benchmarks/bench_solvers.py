@@ -0,0 +1,313 @@
+"""
+Benchmark suite of the solvers (full and limited-memory bfgs, full bfgs
+with its runs in lockstep, gradsamp and hanso) on the example functions
+(l1, l2, nesterov, tv and rosenbrock), at sizes nvar from 10 up to 10^5.
+
+For each problem, size and solver, the suite records the time and number
+of function evaluations needed to reach the target f* + tol * (f(x0) - f*)
+(f* = 0 for all the example functions), the final function value, the
+number of iterations (i.e of line searches), the number of evaluations,
+the peak memory of the quasi-Newton state (see instrument.Stats) and the
+peak resident memory of the process which made the run. Starting points
+are drawn by setx0 from a fixed seed, and every case runs in its own
+process (so that a case cannot pollute the memory figures of another, and
+a crash is recorded rather than fatal).
+
+The results are written as JSON, one record per case sorted by problem,
+size and solver, so that two result files (e.g of two versions of
+pyHANSO) can be diffed, or compared with --compare.
+
+Usage:
+
+    PYTHONPATH=. python benchmarks/bench_solvers.py -o results.json
+    PYTHONPATH=. python benchmarks/bench_solvers.py --sizes 10,100,1000,10000
+    PYTHONPATH=. python benchmarks/bench_solvers.py --compare old.json new.json
+
+(or install pyHANSO first, see README.md). The default sizes (10 and 100)
+run in a few minutes.
+
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import sys
+import json
+import platform
+import resource
+import argparse
+import multiprocessing
+import numpy as np
+import scipy
+
+from hanso.bfgs import bfgs
+from hanso.gradsamp import gradsamp
+from hanso.hanso import hanso
+from hanso.setx0 import setx0
+from hanso.oracle import Oracle
+from hanso.instrument import Stats, clock
+from hanso.example_functions import (l1, grad_l1, l2, gradl2, nesterov,
+                                     grad_nesterov, tv, grad_tv,
+                                     rosenbrock_banana,
+                                     grad_rosenbrock_banana)
+
+# name -> (func, grad, optimal value, fixed nvar or None)
+PROBLEMS = {"l1": (l1, grad_l1, 0., None),
+            "l2": (l2, gradl2, 0., None),
+            "nesterov": (nesterov, grad_nesterov, 0., None),
+            "tv": (tv, grad_tv, 0., None),
+            "rosenbrock": (rosenbrock_banana, grad_rosenbrock_banana, 0., 2),
+            }
+
+SOLVERS = ("bfgs", "lbfgs", "lockstep", "gradsamp", "hanso")
+
+# full BFGS stores nvar x nvar floats: above this size, it is skipped, and
+# hanso falls back to limited memory
+MAX_FULL_NVAR = 5000
+
+
+class _Trace(object):
+    """
+    Function wrapper recording when (and after how many evaluations) the
+    target value is first reached.
+
+    """
+
+    def __init__(self, func, target):
+        self.func = func
+        self.target = target
+        self.start = clock()
+        self.nfeval = 0
+        self.time_to_target = None
+        self.nfeval_to_target = None
+
+    def __call__(self, x):
+        f = self.func(x)
+        self.nfeval += 1
+        if self.time_to_target is None and f <= self.target:
+            self.time_to_target = clock() - self.start
+            self.nfeval_to_target = self.nfeval
+        return f
+
+
+def run_case(problem, nvar, solver, seed=42, nstart=1, maxit=500,
+             cpumax=60., tol=1e-6, nvec=10):
+    """
+    Run a solver on a problem, from nstart points drawn by setx0 with the
+    given seed.
+
+    Returns
+    -------
+    result: dict
+        the measurements (see module docstring)
+
+    """
+
+    func, grad, fopt, _ = PROBLEMS[problem]
+    np.random.seed(seed)
+    x0 = setx0(nvar, nstart)
+    f0 = min(func(x0[:, j]) for j in xrange(nstart))
+    target = fopt + tol * (f0 - fopt)
+    trace = _Trace(func, target)
+    oracle = Oracle(trace, grad=grad)
+    stats = Stats()
+    full = nvar <= MAX_FULL_NVAR
+
+    result = dict(problem=problem, nvar=nvar, solver=solver, seed=seed,
+                  nstart=nstart, maxit=maxit, f0=f0, target=target)
+    start = clock()
+    if solver in ("bfgs", "lbfgs", "lockstep"):
+        if solver != "lbfgs" and not full:
+            result['skipped'] = "nvar > %i for full BFGS" % MAX_FULL_NVAR
+            return result
+        result['nvec'] = nvec if solver == "lbfgs" else 0
+        _, f, _, _, _, info = bfgs(
+            oracle, x0=x0, maxit=maxit, nvec=result['nvec'], cpumax=cpumax,
+            verbose=0, output_records=0, stats=stats,
+            lockstep=solver == "lockstep")[:6]
+        result['info'] = list(info)
+    elif solver == "gradsamp":
+        f = gradsamp(oracle, x0, cpumax=cpumax, verbose=0, stats=stats)[1]
+    elif solver == "hanso":
+        result['nvec'] = 0 if full else nvec
+        f = hanso(oracle, x0=x0, maxit=maxit, cpumax=cpumax, verbose=0,
+                  sampgrad=True, nvec=result['nvec'], output_records=1,
+                  stats=stats)[1]
+    else:
+        raise ValueError("Unknown solver: %s (expecting one of %s)" % (
+                solver, SOLVERS))
+    result['time'] = clock() - start
+
+    result['f'] = float(np.min(f))
+    result['reached'] = trace.time_to_target is not None
+    result['time_to_target'] = trace.time_to_target
+    result['nfeval_to_target'] = trace.nfeval_to_target
+    result['nfeval'] = oracle.nfeval
+    result['niter'] = stats.get('nlinesearch', 0)
+    result['nqp'] = stats.get('nqp', 0)
+    result['peakmem'] = stats.get('peakmem', 0)
+    result['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['phases'] = stats.get('time', {})
+    return result
+
+
+def _run_case_process(queue, args, kwargs):
+    try:
+        queue.put(run_case(*args, **kwargs))
+    except Exception, e:
+        queue.put(dict(zip(("problem", "nvar", "solver"), args),
+                       error="%s: %s" % (e.__class__.__name__, e)))
+
+
+def run_suite(problems=None, sizes=(10, 100), solvers=SOLVERS, verbose=1,
+              **kwargs):
+    """
+    Run all the cases, each in its own process.
+
+    Parameters
+    ----------
+    problems: list of strings, optional (default all of PROBLEMS)
+        names of the problems
+
+    sizes: list of ints, optional (default (10, 100))
+        values of nvar (ignored by the problems of fixed size)
+
+    solvers: list of strings, optional (default SOLVERS)
+        names of the solvers
+
+    **kwargs: param-value dict
+        passed to run_case (seed, nstart, maxit, cpumax, tol, nvec)
+
+    Returns
+    -------
+    results: list of dicts
+        one result per case (see run_case); cases which failed have an
+        'error' entry instead of the measurements
+
+    """
+
+    problems = sorted(PROBLEMS) if problems is None else problems
+    cases = []
+    for problem in problems:
+        fixed_nvar = PROBLEMS[problem][3]
+        for nvar in ([fixed_nvar] if fixed_nvar else sizes):
+            for solver in solvers:
+                cases.append((problem, nvar, solver))
+
+    results = []
+    for case in cases:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run_case_process,
+                                          args=(queue, case, kwargs))
+        process.start()
+        result = queue.get()
+        process.join()
+        if verbose:
+            print >> sys.stderr, _format(result)
+        results.append(result)
+    return sorted(results, key=lambda r: (r['problem'], r['nvar'],
+                                          r['solver']))
+
+
+def _format(result):
+    line = "%-10s %7i %-8s " % (result['problem'], result['nvar'],
+                                result['solver'])
+    if 'error' in result:
+        return line + "error: " + result['error']
+    if 'skipped' in result:
+        return line + "skipped: " + result['skipped']
+    return line + "f = %9.2e  time = %8.3fs  to target = %8s  nfeval = %6i" \
+        "  niter = %5i  maxrss = %6ikB" % (
+        result['f'], result['time'], "%.3fs" % result['time_to_target']
+        if result['reached'] else "-", result['nfeval'], result['niter'],
+        result['maxrss'])
+
+
+def environment():
+    """
+    Versions of the software the benchmark was run with.
+
+    """
+
+    return dict(python=platform.python_version(), numpy=np.__version__,
+                scipy=scipy.__version__, platform=platform.platform())
+
+
+def compare(old, new, threshold=1.5):
+    """
+    Compare two results of run_suite, case by case.
+
+    Returns
+    -------
+    lines: list of strings
+        one line per case common to both, with the ratios new / old of
+        the time to target and of the number of evaluations; cases which
+        regressed (ratio above threshold, or target no longer reached)
+        are flagged
+
+    """
+
+    def _key(result):
+        return result['problem'], result['nvar'], result['solver']
+
+    old = dict((_key(r), r) for r in old)
+    lines = []
+    for result in new:
+        key = _key(result)
+        if key not in old:
+            continue
+        before = old[key]
+        if 'f' not in result or 'f' not in before:
+            continue
+        if before['reached'] and not result['reached']:
+            lines.append("%-10s %7i %-8s REGRESSION: target no longer "
+                         "reached" % key)
+            continue
+        if not (before['reached'] and result['reached']):
+            continue
+        time_ratio = result['time_to_target'] / max(
+            before['time_to_target'], 1e-6)
+        nfeval_ratio = 1. * result['nfeval_to_target'] / \
+            before['nfeval_to_target']
+        flag = " REGRESSION" if max(time_ratio, nfeval_ratio) > threshold \
+            else ""
+        lines.append("%-10s %7i %-8s time x%.2f  nfeval x%.2f%s" % (
+                key + (time_ratio, nfeval_ratio, flag)))
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pyHANSO solvers on the example functions")
+    parser.add_argument("-o", "--output", help="JSON file for the results "
+                        "(default: standard output)")
+    parser.add_argument("--problems", default=",".join(sorted(PROBLEMS)))
+    parser.add_argument("--sizes", default="10,100",
+                        help="values of nvar, e.g 10,100,1000,10000,100000")
+    parser.add_argument("--solvers", default=",".join(SOLVERS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--nstart", type=int, default=1)
+    parser.add_argument("--maxit", type=int, default=500)
+    parser.add_argument("--cpumax", type=float, default=60.,
+                        help="time budget per case, in seconds")
+    parser.add_argument("--tol", type=float, default=1e-6)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = [json.load(open(filename))['results']
+                    for filename in args.compare]
+        lines = compare(old, new)
+        print "\n".join(lines)
+        sys.exit(any(line.endswith("REGRESSION") or "REGRESSION:" in line
+                     for line in lines))
+
+    params = dict(seed=args.seed, nstart=args.nstart, maxit=args.maxit,
+                  cpumax=args.cpumax, tol=args.tol)
+    results = run_suite(problems=args.problems.split(","),
+                        sizes=[int(nvar) for nvar in args.sizes.split(",")],
+                        solvers=args.solvers.split(","), **params)
+    output = open(args.output, "w") if args.output else sys.stdout
+    json.dump(dict(environment=environment(), params=params,
+                   results=results), output, indent=1, sort_keys=True)
+    output.write("\n")
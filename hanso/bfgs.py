@@ -4,28 +4,118 @@
 """
 
 import time
+import Queue
+import multiprocessing
 import numpy as np
 from scipy import linalg
 from bfgs1run import bfgs1run
+from bfgslockstep import bfgs_lockstep
 from setx0 import setx0
+from oracle import make_oracle
+from instrument import Stats, oracle_counters
+from checkpoint import NullCheckpoint, RoundCheckpoint, Paused, check_x0
+
+
+def _bfgs1run_worker(args):
+    """
+    Make a single run of bfgs1run. Intended to be mapped over the
+    starting points by bfgs, possibly in a worker process.
+
+    The time budget is passed as an absolute deadline (cpufinish), so that
+    all runs share the same budget regardless of when they are started.
+    Execution records which are not wanted by the caller are not recorded
+    at all, or dropped here before they are sent back to the parent
+    process. The final state of the run (see WarmStart) is sent back too,
+    if a warm start was given.
+
+    """
+
+    run, func, x0, grad, cpufinish, output_records, kwargs = args
+    stats = Stats()
+    if output_records < 2:
+        kwargs = dict(kwargs, records=None)
+    results = bfgs1run(func, x0, grad=grad, cpumax=cpufinish - time.time(),
+                       run=run, stats=stats, **kwargs)
+    return (run, _drop_records(results, output_records), stats,
+            kwargs.get('warm_start'))
+
+
+def _drop_records(results, output_records):
+    """
+    Drop the execution records of results (as returned by bfgs1run) which
+    are not wanted by the caller of bfgs.
+
+    """
+
+    results = list(results)
+    if output_records < 2:
+        results[9:12] = None, None, None  # fevalrec, xrec, Hrec
+    if output_records < 1:
+        results[6:9] = None, None, None  # X, G, w
+    return tuple(results)
+
+
+def _bfgs1run_process(queue, args):
+    """
+    Target of the worker processes spawned by bfgs: run _bfgs1run_worker
+    and send its results (or the exception it raised) back to the parent
+    process.
+
+    """
+
+    try:
+        queue.put(_bfgs1run_worker(args))
+    except Exception, e:
+        queue.put((args[0], e, None, None))
+
+
+def _collect(queue, running):
+    """
+    Next results sent back by the worker processes of bfgs (see
+    _bfgs1run_process), polling the workers meanwhile.
+
+    Raises
+    ------
+    RuntimeError
+        if a worker died without sending its results (e.g killed by a
+        signal, or by an exception which is not an Exception)
+
+    """
+
+    while True:
+        # a worker which is dead before the get has flushed its results
+        dead = [run for run, process in running.items()
+                if not process.is_alive()]
+        try:
+            return queue.get(timeout=1.)
+        except Queue.Empty:
+            if dead:
+                run = dead[0]
+                raise RuntimeError(
+                    "bfgs: the worker process of bfgs1run %i died (exit code"
+                    " %s) without sending its results" % (
+                        run, running[run].exitcode))
 
 
 def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
          verbose=1, funcrtol=1e-20, gradnormtol=1e-6, fvalquit=-np.inf,
          xnormquit=np.inf, cpumax=np.inf, strongwolfe=False, wolfe1=0,
          wolfe2=.5, quitLSfail=1, ngrad=None, evaldist=1e-6, H0=None, scale=1,
-         output_records=2
-         ):
+         Hpacked=False, Hdtype=np.float64, output_records=2, records=None,
+         n_jobs=1, stats=None, checkpoint=None, warm_start=None,
+         lockstep=False, halving=None, halving_keep=.5, dedup=None,
+         dedup_dist=1e-2, speculate=1, executor=None, interpolate=False):
     """
     Make a single run of BFGS from one starting point. Intended to be
     called from bfgs.
 
     Parameters
     ----------
-    func: callable function on 1D arrays of length nvar
-        function being optimized
+    func: callable function on 1D arrays of length nvar, or Oracle
+        function being optimized. If grad is None, func(x) must return
+        the function value and the gradient at x, as a tuple (f, g)
 
-    grad: callable function
+    grad: callable function, optional (default None)
         gradient of func
 
     x0: 2D array of shape (nvar, nstart), optional (default None)
@@ -62,13 +152,19 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
         for full BFGS: initial inverse Hessian approximation (must be
         positive definite, but this is not checked), this could be draw
         drawn from a Wishart distribution;
-        for limited memory BFGS: same, but applied every iteration
-        (must be sparse in this case)
+        for limited memory BFGS: same, but applied every iteration; may
+        also be a float or a 1D array (diagonal), see bfgs1run
 
     scale: boolean, optional (default True)
         for full BFGS: 1 to scale H0 at first iteration, 0 otherwise
         for limited memory BFGS: 1 to scale H0 every time, 0 otherwise
 
+    Hpacked: boolean, optional (default False)
+        param passed to bfgs1run function
+
+    Hdtype: numpy dtype, optional (default np.float64)
+        param passed to bfgs1run function
+
     cpumax: float, optional (default inf)
         quit if cpu time in secs exceeds this (applies to total running
         time)
@@ -95,6 +191,103 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
         1: return H and w records from low-level bfgs1run calls
         2: return all execution records from low-level bfgs1run calls
 
+    records: record sink, optional (default None)
+        where the records fevalrec, xrec and Hrec of each run go, if
+        output_records is 2: by default, they are discarded; use a
+        MemorySink to keep (some of) them in memory, or a MemmapSink to
+        stream them to disk, in which case the returned records are
+        read lazily from there (see records.py). With n_jobs > 1, a
+        MemmapSink avoids sending the records back from the workers
+
+    n_jobs: int, optional (default 1)
+        number of worker processes among which the starting points are
+        spread; -1 means as many as there are CPUs. With n_jobs > 1, func
+        and grad must be picklable (e.g module-level functions), each
+        worker evaluates them through its own copy of the oracle, the
+        cpumax budget is shared by all the workers, and the outstanding
+        runs are cancelled as soon as one run reaches fvalquit or
+        xnormquit. Results are returned in the order of the columns of
+        x0, exactly as in the sequential case. If a worker dies without
+        sending its results (e.g killed), a RuntimeError is raised
+
+    stats: Stats, optional (default None)
+        if provided, the statistics of each run of bfgs1run (see
+        bfgs1run) are appended to its 'runs' list, and totaled into it
+        (see Stats). This includes the evaluations made in the worker
+        processes
+
+    checkpoint: Checkpoint, optional (default None)
+        if provided, the starting points and the results of the completed
+        runs are saved, and each run is checkpointed by bfgs1run; calling
+        bfgs again with the same checkpoint resumes where it was
+        interrupted, with the same results as an uninterrupted call (see
+        checkpoint.py)
+
+    warm_start: WarmStart, optional (default None)
+        if provided, every run starts from it (see bfgs1run), e.g from the
+        final state of the solve of a related problem; the final state of
+        the best run is then left in it
+
+    lockstep: boolean, optional (default False)
+        if set, all the runs are advanced together, one trial point of each
+        line search per round, the points of a round being evaluated with
+        a single call to the `batch` method of the oracle, and the
+        directions and BFGS updates of all the runs being computed by
+        batched products on their stacked inverse Hessian approximations
+        (see bfgs_lockstep). This is an alternative to n_jobs (which is
+        then ignored), for cheap vectorized oracles (see Oracle) and small
+        or medium nvar; it only supports full BFGS with weak Wolfe line
+        search by bisection, unpacked storage of H, no warm start and no
+        speculation, and the runs are only checkpointed once they are all
+        done
+
+    halving: int, optional (default None)
+        if set, the runs are raced by successive halving, rather than each
+        given the full maxit budget: they are interleaved in rounds of
+        `halving` iterations, after each of which only the best fraction
+        halving_keep of the runs still going (by current f, and then by
+        dnorm) carry on to the next round. The other runs are pruned: they
+        stop, with info 10, and their inverse Hessian approximation is
+        released (H is None in the results); so are all the other runs
+        when one of them reaches fvalquit or xnormquit. The runs are made
+        sequentially (n_jobs is ignored), and only checkpointed once they
+        are all done
+
+    halving_keep: float, optional (default .5)
+        fraction of the runs kept after each round of halving
+
+    dedup: int, optional (default None)
+        if set, the runs are interleaved in rounds of `dedup` iterations
+        (`halving` iterations, if halving is set too), after each of which
+        the runs which entered the basin of a minimizer already found, or
+        of another run, are merged into it: a run still going is merged
+        into a run which already terminated (other than with info 5, 10 or
+        11), or into a run still going, whose x is within distance
+        dedup_dist * max(1, norm(x)) of its own x, if its own f is larger
+        (the nearest such run). Merged runs stop, with info 11, and their
+        inverse Hessian approximation is released (H is None in the
+        results); the (run, into) pairs are appended to the 'merged' list
+        of stats. The runs are made sequentially (n_jobs is ignored), and
+        only checkpointed once they are all done
+
+    dedup_dist: float, optional (default 1e-2)
+        distance below which runs are merged, relative to the norm of the
+        x of the run being merged (see dedup)
+
+    speculate: int, optional (default 1)
+        number of trial steps the line searches evaluate together, for
+        expensive oracles (see linesch_ww); the runs are the same as with
+        1, whatever the executor
+
+    executor: string or pool, optional (default None)
+        how the trial steps are evaluated together: None for a batch (see
+        Oracle.batch), "thread" or "process" for a pool of `speculate`
+        workers per line search, or a pool of your own (see linesch_ww)
+
+    interpolate: boolean, optional (default False)
+        param passed to bfgs1run function: safeguarded interpolation
+        rather than bisection in the weak Wolfe line searches
+
     Returns
     -------
     x: D array of same length nvar = len(x0)
@@ -115,7 +308,9 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
        for details
 
     inforecs: list of int
-        reason for termination; see bfgs1run for details
+        reason for termination; see bfgs1run for details (10: pruned, or
+        cancelled, by the halving scheduler; 11: merged into another run,
+        see dedup)
 
     pobj: list of lists of tuples of the form (duration of iteration,
     final func value)
@@ -138,7 +333,9 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
 
     fevalrecs: list of nstart 1D arrays, each of length iter
         records of all function evaluations in the line searches;
-        one array per run of bfgs1run; see bfgs1run for details
+        one array per run of bfgs1run; see bfgs1run for details (these
+        records, and the next two ones, are empty unless a record sink
+        which keeps them is given)
 
     xrecs: list of nstart 2D arrays, each of length (iter, nvar)
         record of x iterates
@@ -173,13 +370,15 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
 
     """
 
-    def _fg(x):
-        return func(x) if grad is None else func(x), grad(x)
-
     def _log(msg, level=0):
         if verbose > level:
             print msg
 
+    # all the runs share the same function/gradient oracle
+    oracle = make_oracle(func, grad)
+    checkpoint = NullCheckpoint() if checkpoint is None else checkpoint
+    state = checkpoint.load()
+
     # sanitize x0
     if x0 is None:
         assert not nvar is None, (
@@ -187,7 +386,9 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
         assert not nstart is None, (
             "No value specified for x0, expecting a value for nstart")
 
-        x0 = setx0(nvar, nstart)
+        # the random starting points of a resumed call are those of the
+        # interrupted one
+        x0 = setx0(nvar, nstart) if state is None else state['x0']
     else:
         assert nvar is None, (
             "Value specified for x0, expecting no value for nvar")
@@ -201,7 +402,12 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
 
         nvar, nstart = x0.shape
 
-    cpufinish = time.time() + cpumax
+    check_x0(state, x0, 'bfgs')
+    cpufinish = checkpoint.cpufinish(cpumax)
+    # run -> results, stats and final state (see WarmStart)
+    done = {} if state is None else state['done']
+    if state is None:
+        checkpoint.save(x0=x0, done=done)
     pobj = []
     _f = []
     itrecs = []
@@ -209,6 +415,7 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
     _d = []
     _x = []
     _H = []
+    warms = []
     if output_records:
         xrecs = []
         fevalrecs = []
@@ -216,79 +423,263 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
         Xrecs = []
         Grecs = []
         wrecs = []
-    for run in xrange(nstart):
-        _log("Staring bfgs1run %i/%i..." % (
-                run + 1, nstart))
-        if verbose > 0 & nstart > 1:
-            _log('bfgs: starting point %d' % (run + 1))
-        cpumax = cpufinish - time.time()
-        if output_records > 1:
-            x, f, d, HH, it, info, X, G, w, fevalrec, xrec, Hrec, times = \
-                bfgs1run(func, x0[..., run], grad=grad, maxit=maxit,
-                         wolfe1=wolfe1, wolfe2=wolfe2, funcrtol=funcrtol,
-                         gradnormtol=gradnormtol, fvalquit=fvalquit,
-                         xnormquit=xnormquit, cpumax=cpumax,
-                         strongwolfe=strongwolfe, nvec=nvec,  verbose=verbose,
-                         quitLSfail=quitLSfail, ngrad=ngrad, evaldist=evaldist,
-                         H0=H0, scale=scale)
-            _x.append(x)
-            _f.append(x)
-            _d.append(d)
-            itrecs.append(it)
-            inforecs.append(info)
+
+    def _commit(results, runstats, warm):
+        x, f, d, HH, it, info, X, G, w, fevalrec, xrec, Hrec, times = results
+        warms.append(warm)
+        _x.append(x)
+        _f.append(f)
+        _d.append(d)
+        itrecs.append(it)
+        inforecs.append(info)
+        if output_records > 0:
             Xrecs.append(X)
             Grecs.append(G)
             wrecs.append(w)
+        if output_records > 1:
             fevalrecs.append(fevalrec)
             xrecs.append(xrec)
             Hrecs.append(Hrec)
-        elif output_records > 0:
-            x, f, d, HH, it, info, X, G, w, _, _, _, times = bfgs1run(
-                func, x0[..., run], grad=grad, maxit=maxit, wolfe1=wolfe1,
-                wolfe2=wolfe2, funcrtol=funcrtol, gradnormtol=gradnormtol,
-                fvalquit=fvalquit, xnormquit=xnormquit, cpumax=cpumax,
-                strongwolfe=strongwolfe, nvec=nvec, verbose=verbose,
-                quitLSfail=quitLSfail, ngrad=ngrad, evaldist=evaldist, H0=H0,
-                scale=scale)
-            _x.append(x)
-            _f.append(f)
-            _d.append(d)
-            itrecs.append(it)
-            inforecs.append(info)
-            Xrecs.append(X)
-            Grecs.append(G)
-            wrecs.append(w)
-        else:  # avoid computing unnecessary arrays
-            x, f, d, HH, it, info, _, _, _, _, _, _, times = bfgs1run(
-                func, x0[..., run], grad=grad, maxit=maxit, wolfe1=wolfe1,
-                wolfe2=wolfe2, funcrtol=funcrtol, gradnormtol=gradnormtol,
-                fvalquit=fvalquit, xnormquit=xnormquit, cpumax=cpumax,
-                strongwolfe=strongwolfe, nvec=nvec, verbose=verbose,
-                quitLSfail=quitLSfail, ngrad=ngrad, evaldist=evaldist, H0=H0,
-                scale=scale)
-            _x.append(x)
-            _f.append(f)
-            _d.append(d)
-            itrecs.append(it)
-            inforecs.append(info)
-
-        _log('... done (bfgs1run %i/%i).' % (run + 1, nstart))
-        _log("\r\n")
-
-        # HH should be exactly symmetric as of version 2.02, but does no harm
-        _H.append((HH + HH.T) / 2.)
 
-        # commit times
-        run_pobj = []
-        for duration, f in times:
-            run_pobj.append((duration, f))
-        pobj.append(run_pobj)
+        # HH is exactly symmetric (bfgs1run only updates its upper triangle
+        # in place), so there's no need to symmetrize it
+        _H.append(HH)
 
-        # check that we'ven't exploded the time budget
-        if time.time() > cpufinish or f < fvalquit or linalg.norm(
-            x, 2) > xnormquit:
-            break
-    # end of for loop
+        # commit times
+        pobj.append(list(times))
+
+        if stats is not None:
+            stats.merge(runstats)
+            stats.append('runs', runstats)
+
+    def _stop(results):
+        # the time budget is exploded, or a run reached fvalquit/xnormquit
+        x, f = results[:2]
+        return time.time() > cpufinish or f < fvalquit or linalg.norm(
+            x, 2) > xnormquit
+
+    def _kwargs(run):
+        return dict(bfgs1run_kwargs,
+                    checkpoint=checkpoint.child('run%i' % run),
+                    warm_start=None if warm_start is None else
+                    warm_start.copy())
+
+    bfgs1run_kwargs = dict(
+        maxit=maxit, wolfe1=wolfe1, wolfe2=wolfe2, funcrtol=funcrtol,
+        gradnormtol=gradnormtol, fvalquit=fvalquit, xnormquit=xnormquit,
+        strongwolfe=strongwolfe, nvec=nvec, verbose=verbose,
+        quitLSfail=quitLSfail, ngrad=ngrad, evaldist=evaldist, H0=H0,
+        scale=scale, Hpacked=Hpacked, Hdtype=Hdtype, records=records,
+        speculate=speculate, executor=executor, interpolate=interpolate)
+
+    if n_jobs < 0:
+        n_jobs = max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
+    n_jobs = min(n_jobs, nstart)
+
+    if lockstep and (halving or dedup):
+        raise ValueError("lockstep is incompatible with halving and dedup")
+    if halving and not 0 < halving_keep <= 1:
+        raise ValueError("halving_keep must be in (0, 1], got %s" % (
+                halving_keep))
+
+    if lockstep:
+        if nvec > 0 or strongwolfe or Hpacked or warm_start is not None \
+                or speculate > 1 or interpolate:
+            raise ValueError(
+                "lockstep only supports full BFGS with weak Wolfe line "
+                "search by bisection, unpacked H, no warm start and no "
+                "speculation")
+        pending = [run for run in xrange(nstart) if run not in done]
+        if pending and not any(_stop(results)
+                               for results, _, _ in done.values()):
+            _log("Advancing %i bfgs run(s) in lockstep..." % len(pending))
+            kwargs = dict(bfgs1run_kwargs)
+            for key in ('nvec', 'strongwolfe', 'Hpacked', 'speculate',
+                        'executor', 'interpolate'):
+                del kwargs[key]
+            if output_records < 2:
+                kwargs['records'] = None
+            runs = bfgs_lockstep(oracle, x0[:, pending],
+                                 cpumax=cpufinish - time.time(),
+                                 runs=pending, **kwargs)
+            for run, (results, runstats) in zip(pending, runs):
+                done[run] = (_drop_records(results, output_records),
+                             runstats, None)
+            checkpoint.save(x0=x0, done=done)
+            _log('... done (lockstep).')
+        for run in sorted(done.keys()):
+            _commit(*done[run])
+    elif halving or dedup:
+        # rounds: each run is paused after every `halving` (or `dedup`)
+        # iterations (see RoundCheckpoint), and resumed if it was neither
+        # merged into another run (dedup) nor pruned (successive halving)
+        pending = [run for run in xrange(nstart) if run not in done]
+        if any(_stop(results) for results, _, _ in done.values()):
+            pending = []
+        rounds = dict((run, RoundCheckpoint(halving or dedup))
+                      for run in pending)
+        runstats = dict((run, Stats()) for run in pending)
+        runwarms = dict((run, None if warm_start is None else
+                      warm_start.copy()) for run in pending)
+        kwargs = dict(bfgs1run_kwargs)
+        if output_records < 2:
+            kwargs['records'] = None
+
+        def _resume(run, **params):
+            return bfgs1run(oracle, x0[..., run], run=run,
+                            stats=runstats[run], checkpoint=rounds[run],
+                            warm_start=runwarms[run], **dict(kwargs, **params))
+
+        def _finish(run, results):
+            rounds[run].clear()
+            done[run] = (_drop_records(results, output_records),
+                         runstats[run], runwarms[run])
+
+        def _prune(run, info=10):
+            # resuming a paused run with no iteration left to make returns
+            # its current state (that at x0, if it was never started)
+            state = rounds[run].state
+            results = list(_resume(run, maxit=0 if state is None else
+                                   state['it'] + 1, verbose=0))
+            results[3] = None  # H
+            results[5] = info
+            _finish(run, results)
+
+        def _basin(run, others):
+            # the nearest of the other runs (with a lower f) whose x is
+            # close enough to that of run, or None
+            x, f = rounds[run].state['x'], rounds[run].state['f']
+            radius = dedup_dist * max(1., linalg.norm(x, 2))
+            into, nearest = None, np.inf
+            for other, (y, g) in others.items():
+                dist = linalg.norm(x - y, 2)
+                if f > g and dist <= radius and dist < nearest:
+                    into, nearest = other, dist
+            return into
+
+        going = pending
+        stop = False
+        while going and not stop:
+            _log("Round of %i iterations: %i bfgs run(s) going..." % (
+                    halving or dedup, len(going)))
+            paused = []
+            for i, run in enumerate(going):
+                counters = oracle_counters(oracle)
+                try:
+                    results = _resume(run, cpumax=cpufinish - time.time())
+                except Paused:
+                    # bfgs1run only records its evaluations when it returns
+                    runstats[run].record_oracle(oracle, counters)
+                    paused.append(run)
+                    continue
+                _finish(run, results)
+                if _stop(results):
+                    # the runs not resumed yet in this round are pruned too,
+                    # so that every start still gets its results
+                    for other in going[i + 1:]:
+                        _prune(other)
+                    stop = True
+                    break
+
+            # best runs first, by current f and then dnorm
+            ranked = sorted(paused, key=lambda run: (
+                    rounds[run].state['f'], rounds[run].state['dnorm']))
+            if dedup and not stop:
+                # minimizers found so far, and then the better runs
+                others = dict((other, done[other][0][:2]) for other in done
+                              if done[other][0][5] not in (5, 10, 11))
+                kept = []
+                for run in ranked:
+                    into = _basin(run, others)
+                    if into is None:
+                        others[run] = (rounds[run].state['x'],
+                                       rounds[run].state['f'])
+                        kept.append(run)
+                        continue
+                    _log("... merging bfgs run %i into run %i (f = %g)" % (
+                            run + 1, into + 1, rounds[run].state['f']))
+                    runstats[run].append('merged', (run, into))
+                    _prune(run, info=11)
+                ranked = kept
+            nkeep = len(ranked) if not halving else int(
+                np.ceil(halving_keep * len(ranked)))
+            nkeep = 0 if stop else nkeep
+            for run in ranked[nkeep:]:
+                _log("... pruning bfgs run %i (f = %g)" % (
+                        run + 1, rounds[run].state['f']))
+                _prune(run)
+            going = sorted(ranked[:nkeep])
+        checkpoint.save(x0=x0, done=done)
+        for run in sorted(done.keys()):
+            _commit(*done[run])
+    elif n_jobs == 1:
+        for run in xrange(nstart):
+            if run in done:  # completed before the checkpoint
+                results, runstats, warm = done[run]
+            else:
+                _log("Staring bfgs1run %i/%i..." % (
+                        run + 1, nstart))
+                if verbose > 0 & nstart > 1:
+                    _log('bfgs: starting point %d' % (run + 1))
+                _, results, runstats, warm = _bfgs1run_worker((
+                        run, oracle, x0[..., run], None, cpufinish,
+                        output_records, _kwargs(run)))
+                done[run] = results, runstats, warm
+                checkpoint.save(x0=x0, done=done)
+                _log('... done (bfgs1run %i/%i).' % (run + 1, nstart))
+                _log("\r\n")
+            _commit(results, runstats, warm)
+
+            # check that we'ven't exploded the time budget
+            if _stop(results):
+                break
+        # end of for loop
+    else:
+        # spread the starting points across n_jobs worker processes;
+        # all the workers share the same deadline cpufinish. One process is
+        # forked per run (rather than using a multiprocessing.Pool), so that
+        # outstanding runs can be killed without waiting for them
+        _log("Dispatching %i bfgs1run(s) to %i worker processes..." % (
+                nstart, n_jobs))
+        queue = multiprocessing.Queue()
+        collected = done
+        pending = [run for run in xrange(nstart) if run not in collected]
+        if any(_stop(results) for results, _, _ in collected.values()):
+            pending = []
+        running = {}
+        try:
+            while pending or running:
+                while pending and len(running) < n_jobs:
+                    run = pending.pop(0)
+                    running[run] = multiprocessing.Process(
+                        target=_bfgs1run_process, args=(queue, (
+                                run, oracle, x0[..., run], None,
+                                cpufinish, output_records,
+                                _kwargs(run))))
+                    running[run].start()
+                run, results, runstats, warm = _collect(queue, running)
+                running.pop(run).join()
+                if isinstance(results, Exception):
+                    raise results
+                _log('... done (bfgs1run %i/%i).' % (run + 1, nstart))
+                collected[run] = results, runstats, warm
+                checkpoint.save(x0=x0, done=collected)
+                if _stop(results):
+                    # cancel outstanding starts
+                    break
+        finally:
+            for process in running.values():
+                process.terminate()
+                process.join()
+
+        # commit runs in the order of the columns of x0, exactly as if
+        # they had been done sequentially
+        for run in sorted(collected.keys()):
+            _commit(*collected[run])
+
+    if warm_start is not None and _f:
+        # hand the final state of the best run over to the next solve
+        warm_start.update(warms[np.argmin(_f)])
 
     # we're done: now collect and return outputs to caller
     _x = np.array(_x).T
@@ -305,6 +696,7 @@ def bfgs(func, x0=None, grad=None, nvar=None, nstart=None, maxit=100, nvec=0,
 
 if __name__ == '__main__':
     import matplotlib.pyplot as plt
+    from records import MemorySink
 
     func_names = [
         'Nesterov',
@@ -337,7 +729,7 @@ if __name__ == '__main__':
             # run BFGS
             fevalrecs = bfgs(func, grad=grad, nvar=nvar, nstart=nstart,
                              strongwolfe=strongwolfe,
-                             maxit=10,
+                             maxit=10, records=MemorySink(('feval',)),
                              verbose=2
                              )[-4]
 
@@ -12,22 +12,40 @@ import numpy as np
 from scipy import linalg
 
 from hgprod import hgprod
-from qpspecial import qpspecial
+from ringbuffer import RingBuffer
+from symmatrix import SymMatrix
+from bundleqp import BundleQP
 from linesch_ww import linesch_ww
+from linesch_sw import linesch_sw
+from oracle import make_oracle
+from records import NullSink
+from checkpoint import NullCheckpoint, check_x0
+from instrument import Stats, clock, oracle_counters
 
 
 def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
              gradnormtol=1e-4, fvalquit=-np.inf, xnormquit=np.inf,
              cpumax=np.inf, strongwolfe=False, wolfe1=0, wolfe2=.5,
-             quitLSfail=1, ngrad=None, evaldist=1e-4, H0=None, scale=1):
+             quitLSfail=1, ngrad=None, evaldist=1e-4, H0=None, scale=1,
+             Hpacked=False, Hdtype=np.float64, records=None, run=0,
+             stats=None, checkpoint=None, warm_start=None, speculate=1,
+             executor=None, interpolate=False):
     """
     Make a single run of BFGS (with inexact line search) from one starting
     point. Intended to be called from bfgs.
 
     Parameters
     ----------
-    func : callable func(x)
-        function to minimise.
+    func : callable func(x), or Oracle
+        function to minimise (see Oracle). For a composite objective
+        loss(A * x) + penalty(x), pass a CompositeOracle: each iteration
+        then costs a single product by A and by A' (see composite.py). If
+        the gradient costs as much as f, pass a lazy Oracle (possibly with
+        a jvp): the line searches then form it only at the steps they
+        return. For a sum of maxima of affine functions (e.g the l1 norm,
+        total variation or the hinge loss), pass a MaxAffineOracle: the
+        weak Wolfe line search then steps straight to a breakpoint (see
+        maxaffine.py)
 
     x0: 1D array of len nvar, optional (default None)
         intial point
@@ -55,6 +73,7 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
         Strong Wolfe line search is not recommended for use with
         BFGS; it is very complicated and bad if f is nonsmooth;
         however, it can be useful to simulate an exact line search
+        (see linesch_sw)
 
     fvalquit: float, optional (default -inf)
         param passed to bfgs1run function
@@ -71,17 +90,33 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
         they are evaluated at points  approximately  within
         distance evaldist of x
 
+    nvec: int, optional (default 0)
+        0 for full BFGS, otherwise number of (s, y) pairs kept for limited
+        memory BFGS; these are stored in preallocated ring buffers, so that
+        memory is O(nvec * nvar)
+
     H0: 2D array of shape (nvar, nvar), optional (default identity matrix)
         for full BFGS: initial inverse Hessian approximation (must be
         positive definite, but this is not checked), this could be draw
-        drawn from a Wishart distribution;
-        for limited memory BFGS: same, but applied every iteration
-        (must be sparse in this case)
+        drawn from a Wishart distribution; may also be a float (multiple
+        of the identity) or a 1D array of length nvar (diagonal);
+        for limited memory BFGS: same, but applied every iteration, and
+        defaults to 1. so that no nvar x nvar matrix is ever formed
 
     scale: boolean, optional (default True)
         for full BFGS: 1 to scale H0 at first iteration, 0 otherwise
         for limited memory BFGS: 1 to scale H0 every time, 0 otherwise
 
+    Hpacked: boolean, optional (default False)
+        for full BFGS: if set, only the upper triangle of H is stored,
+        packed into a 1D array (see SymMatrix); this halves the memory.
+        In any case, H is updated in place by a symmetric rank-two BLAS
+        update, so that no nvar x nvar temporary is allocated
+
+    Hdtype: numpy dtype, optional (default np.float64)
+        for full BFGS: precision in which H is stored, np.float64 or
+        np.float32 (which halves the memory)
+
     cpumax: float, optional (default inf)
         quit if cpu time in secs exceeds this (applies to total running
         time)
@@ -98,6 +133,48 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
         optimality tolerance on smallest vector in their convex hull;
         see also next two options
 
+    records: record sink, optional (default None)
+        where to send the execution records fevalrec, xrec and Hrec: a
+        NullSink (default: records are discarded), a MemorySink or a
+        MemmapSink (see records.py)
+
+    run: int, optional (default 0)
+        index of this run, used by the record sink (e.g to name files)
+
+    stats: Stats, optional (default None)
+        if provided, run statistics are recorded in it (see Stats): the
+        time spent in the oracle, the line searches, the QPs and the BFGS
+        updates, the numbers of evaluations, bisections, expansions, QP
+        iterations and updates, the bundle sizes, and peakmem, the peak
+        number of bytes held by the quasi-Newton state (H, or the limited
+        memory pairs) and the saved gradients
+
+    checkpoint: Checkpoint, optional (default None)
+        if provided, the state of the run is saved every checkpoint.every
+        iterations, and the run resumes from the last saved state, if any
+        (see checkpoint.py)
+
+    warm_start: WarmStart, optional (default None)
+        if provided and not empty, the run starts from its limited memory
+        pairs (or its inverse Hessian approximation, see WarmStart), and
+        from its bundle of points within distance evaldist of x0 (their
+        gradients are re-evaluated in a single batch), e.g the final state
+        of the solve of a related problem; in any case, the final state of
+        the run is left in it (see WarmStart)
+
+    speculate: int, optional (default 1)
+        number of trial steps the weak Wolfe line searches evaluate
+        together (see linesch_ww); the iterates are the same as with 1
+
+    executor: string or pool, optional (default None)
+        how they are evaluated (see linesch_ww); pass a pool rather than a
+        string to reuse it across the line searches
+
+    interpolate: boolean, optional (default False)
+        if set, the weak Wolfe line searches choose their steps inside the
+        bracket by safeguarded interpolation rather than bisection (see
+        linesch_ww); the strong Wolfe line search always does
+
     Returns
     -------
     x: 1D array of same length nvar = len(x0)
@@ -110,7 +187,8 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
        final smallest vector in convex hull of saved gradients
 
     H: 2D array of shape (nvar, nvar)
-       final inverse Hessian approximation
+       final inverse Hessian approximation (for limited memory BFGS, the
+       final scaled H0)
 
     iter: int
        number of iterations
@@ -127,6 +205,9 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
          7: line search bracketed minimizer but Wolfe conditions not satisfied
          8: line search did not bracket minimizer: f may be unbounded below
          9: relative tolerance on function value met on last iteration
+         10: pruned by the halving scheduler of bfgs (only set by bfgs)
+         11: merged into a run which explored the same basin (see the
+             dedup parameter of bfgs; only set by bfgs)
 
     X: 2D array of shape (iter, nvar)
         iterates where saved gradients were evaluated
@@ -137,75 +218,139 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
     w: 1D array
         weights defining convex combination d = G*w
 
-    fevalrec: 1D array of length iter
-        record of all function evaluations in the line searches
+    fevalrec: sequence of iter 1D arrays
+        record of all function evaluations in the line searches (empty
+        unless kept by the record sink)
 
-    xrec: 2D array of length (iter, nvar)
-        record of x iterates
+    xrec: sequence of iter 1D arrays of length nvar
+        record of x iterates (empty unless kept by the record sink)
 
-    Hrec: 2D array of shape (iter, nvar)
-       record of H (Hessian) iterates
+    Hrec: sequence of iter 2D arrays of shape (nvar, nvar)
+       record of H (Hessian) iterates (empty unless kept by the record
+       sink)
 
     times: list of floats
         time consumed in each iteration
 
-    Raises
-    ------
-    ImportError
-
     """
 
-    def _fg(x):
-        return func(x) if grad is None else (func(x), grad(x))
-
     def _log(msg, level=0):
         if verbose > level:
             print msg
 
+    oracle = make_oracle(func, grad)
+    stats = Stats() if stats is None else stats
+    ostart = oracle_counters(oracle)
+
     # sanitize input
     x0 = np.array(x0).ravel()
     nvar = np.prod(x0.shape)
-    H0 = np.eye(nvar) if H0 is None else H0
+    if H0 is None:
+        # limited memory BFGS never forms an nvar x nvar matrix, and full
+        # BFGS forms only H itself
+        H0 = 1.
     ngrad = min(100, min(2 * nvar, nvar + 10)) if ngrad is None else ngrad
     x = np.array(x0)
-    H = np.array(H0)
+    if nvec == 0:
+        H = SymMatrix(nvar, H0, packed=Hpacked, dtype=Hdtype)
+    else:
+        H = np.array(H0)
 
     # initialize auxiliary variables
-    S = []
-    Y = []
-    xrec = []
-    fevalrec = []
-    Hrec = []
-    X = np.array([x]).T
-    nG = 1
+    if nvec > 0:
+        # (s, y) pairs for limited memory BFGS, and the corresponding
+        # 1 / s'y, allocated once and for all
+        S = RingBuffer(nvar, nvec)
+        Y = RingBuffer(nvar, nvec)
+        rho = np.empty(nvec)
+    checkpoint = NullCheckpoint() if checkpoint is None else checkpoint
+    state = checkpoint.load()
+    check_x0(state, x0, 'bfgs1run')
+    if state is None:  # the recorder of a resumed run is in its state
+        recorder = (NullSink() if records is None else records).open(
+            run, nvar, maxit, H0=H0)
+
+    # saved gradients (and the points where they were evaluated), for the
+    # termination test: allocated once and for all
+    Xb = RingBuffer(nvar, ngrad)
+    Gb = RingBuffer(nvar, ngrad)
+    qp = BundleQP(ngrad)  # Gram matrix of the saved gradients, and last w
     w = 1
 
     # prepare for timing
-    cpufinish = time.time() + cpumax
+    cpufinish = checkpoint.cpufinish(cpumax)
     time0 = time.time()
     times = []
 
-    # first evaluation
-    f, g = _fg(x)
-    # times.append((time.time() - time0, f))
-
-    # check that all is still well
-    d = np.array(g)
-    G = np.array([g]).T
-    if np.isnan(f) or np.isinf(f):
-        _log('bfgs1run: f is infinite or nan at initial iterate')
-        info = 5
-        return  x, f, d, H, 0, info, X, G, w, fevalrec, xrec, Hrec, times
-    if np.any(np.isnan(g)) or np.any(np.isinf(g)):
-        _log('bfgs1run: grad is infinite or nan at initial iterate')
-        info = 5
-        return  x, f, d, H, 0, info, X, G, w, fevalrec, xrec, Hrec, times
+    # start from the inverse Hessian approximation (or the limited memory
+    # pairs) of a related problem, rather than from H0
+    warm = warm_start is not None and not warm_start.empty
+    Hscaled = False
+    if warm and state is None:
+        if nvec == 0 and warm_start.hessian and warm_start.H is not None:
+            H = warm_start.inverse_hessian(packed=Hpacked, dtype=Hdtype)
+            Hscaled = True
+        elif nvec > 0 and warm_start.S is not None:
+            npairs = warm_start.S.shape[1]
+            for j in xrange(max(npairs - nvec, 0), npairs):
+                S.append(warm_start.S[:, j])
+                rho[Y.append(warm_start.Y[:, j])] = warm_start.rho[j]
+            H = warm_start.Hdiag
+
+    if state is not None:
+        # resume after the last checkpointed iteration
+        (x, f, g, d, dnorm, f_old, H, Xb, Gb, qp, w, nG, times, it,
+         recorder) = [state[key] for key in (
+                'x', 'f', 'g', 'd', 'dnorm', 'f_old', 'H', 'Xb', 'Gb', 'qp',
+                'w', 'nG', 'times', 'it', 'recorder')]
+        start = it + 1
+        if nvec > 0:
+            S, Y, rho = state['lbfgs']
+        time0 -= state['elapsed']
+        oracle.restore_cache(state['oracle'])
+        _log('bfgs1run: resuming after iteration %d, f = %g' % (it, f))
+    else:
+        if warm:
+            # the previous bundle, if close enough, for the termination
+            # test (x itself is appended below, as the newest point)
+            _warm_bundle(oracle, warm_start.X, x, evaldist, ngrad, Xb, Gb)
+
+        # first evaluation
+        f, g = oracle(x)
+        # times.append((time.time() - time0, f))
+
+        # check that all is still well
+        d = np.array(g)
+        Xb.append(x)
+        slot = Gb.append(g)
+        if Gb.size > 1:
+            qp.fit(Gb.view())
+        else:
+            qp.update(Gb.view(), slot)
+        nG = Gb.size
+        stats.maximum('peakmem', _nbytes(
+                H, Xb, Gb, qp.Q, *((S, Y, rho) if nvec else ())))
+        if np.isnan(f) or np.isinf(f):
+            _log('bfgs1run: f is infinite or nan at initial iterate')
+            info = 5
+            stats.record_oracle(oracle, ostart)
+            return  ((x, f, d, _export(H), 0, info, Xb.view(), Gb.view(),
+                      w) + recorder.close() + (times,))
+        if np.any(np.isnan(g)) or np.any(np.isinf(g)):
+            _log('bfgs1run: grad is infinite or nan at initial iterate')
+            info = 5
+            stats.record_oracle(oracle, ostart)
+            return  ((x, f, d, _export(H), 0, info, Xb.view(), Gb.view(),
+                      w) + recorder.close() + (times,))
+
+        dnorm = linalg.norm(g, 2)  # initialize dnorm stopping criterion
+        f_old = f
+        it = start = 0
 
     # enter: main loop
-    dnorm = linalg.norm(g, 2)  # initialize dnorm stopping criterion
-    f_old = f
-    for it in xrange(maxit):
-        p = -np.dot(H, g) if nvec == 0 else -hgprod(H, g, S, Y)
+    for it in xrange(start, maxit):
+        p = -H.dot(g) if nvec == 0 else -hgprod(
+            H, g, S.data, Y.data, order=S.order(), rho=rho)
         gtp = np.dot(g.T, p)
         if gtp >= 0 or np.any(np.isnan(gtp)):
             _log(
@@ -214,30 +359,16 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
                     it + 1, f, dnorm, gtp))
             info = 6
             times.append((time.time() - time0, f))
-            return x, f, d, H, it, info, X, G, w, fevalrec, xrec, Hrec, times
+            break
 
         gprev = np.array(g)  # for BFGS update
         if strongwolfe:
             # strong Wolfe line search is not recommended except to simulate
             # exact line search
             _log("Starting inexact line search (strong Wolfe) ...")
-
-            # have we coded strong Wolfe line search ?
-            try:
-                from linesch_sw import linesch_sw
-            except ImportError:
-                raise ImportError(
-                    '"linesch_sw" is not in path: it can be obtained from the'
-                    ' NLCG distribution')
-
             alpha, x, f, g, fail, _, _, fevalrecline = linesch_sw(
-                func, x, p, grad=grad, wolfe1=wolfe1, wolfe2=wolfe2,
-                fvalquit=fvalquit, verbose=verbose)
-
-            # function values are not returned in strongwolfe, so set
-            # fevalrecline to nan
-            # fevalrecline = np.nan
-
+                oracle, x, p, func0=f, grad0=g, wolfe1=wolfe1, wolfe2=wolfe2,
+                fvalquit=fvalquit, verbose=verbose, stats=stats)
             _log("... done.")
             # exact line search: increase alpha slightly to get to other side
             # of an discontinuity in nonsmooth case
@@ -247,52 +378,51 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
                 _log(' exact line sch simulation: slightly increasing step '
                      'from %g to %g' % (alpha, alpha + increase), level=1)
 
-                f, g = func(x), grad(x)
+                f, g = oracle(x)
         else:
             _log("Starting inexact line search (weak Wolfe) ...")
             alpha, x, f, g, fail, _, _, fevalrecline = linesch_ww(
-                func, x, p, grad=grad, wolfe1=wolfe1, wolfe2=wolfe2,
-                fvalquit=fvalquit, verbose=verbose)
+                oracle, x, p, func0=f, grad0=g, wolfe1=wolfe1, wolfe2=wolfe2,
+                fvalquit=fvalquit, verbose=verbose, stats=stats,
+                speculate=speculate, executor=executor,
+                interpolate=interpolate)
             _log("... done.")
 
         # for the optimal check: discard the saved gradients iff the
         # new point x is not sufficiently close to the previous point
         # and replace them with new gradient
         if alpha * linalg.norm(p, 2) > evaldist:
-            nG = 1
-            G = np.array([g]).T
-            X = np.array([x]).T
+            Xb.reset()
+            Gb.reset()
+            qp.reset()
         # otherwise add new gradient to set of saved gradients,
-        # discarding oldest
+        # discarding oldest (in place)
         # if alread have ngrad saved gradients
-        elif nG < ngrad:
-            nG += 1
-            G = np.vstack((g, G.T)).T
-            X = np.vstack((x, X.T)).T
-        else:  # nG = ngrad
-            G = np.vstack((g, G[..., :ngrad - 1].T)).T
-            X = np.vstack((x, X[..., :ngrad - 1].T)).T
+        Xb.append(x)
+        slot = Gb.append(g)
+        qp.update(Gb.view(), slot)  # O(nG * nvar), instead of O(nG^2 * nvar)
+        nG = Gb.size
 
         # optimality check: compute smallest vector in convex hull
         # of qualifying gradients: reduces to norm of latest gradient
         # if ngrad = 1, and the set
-        # must always have at least one gradient: could gain efficiency
-        # here by updating previous QP solution
+        # must always have at least one gradient: the QP is warm-started
+        # from the previous solution. Note that the saved
+        # gradients are passed in ring buffer order, not chronologically
         if nG > 1:
             _log("Computing shortest l2-norm vector in convex hull of "
-                 "cached gradients: G = %s ..." % G.T)
-            w, d, _, _ = qpspecial(G, verbose=verbose)
+                 "cached gradients: G = %s ..." % Gb.view().T)
+            w, d, _, _ = qp.solve(Gb.view(), verbose=verbose, stats=stats)
             _log("... done.")
         else:
             w = 1
             d = np.array(g)
 
         dnorm = linalg.norm(d, 2)
+        stats.maximum('peakmem', _nbytes(
+                H, Xb, Gb, qp.Q, *((S, Y, rho) if nvec else ())))
 
-        # XXX these recordings shoud be optional!
-        xrec.append(x)
-        fevalrec.append(fevalrecline)
-        Hrec.append(H)
+        recorder.append(x, fevalrecline, H)
 
         if verbose > 1:
             nfeval = len(fevalrecline)
@@ -305,15 +435,15 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
                  ' %d iteration(s)' % (it + 1))
             info = 2
             times.append((time.time() - time0, f))
-            return x, f, d, H, it, info, X, G, w, fevalrec, xrec, Hrec, times
+            break
 
         # this is not checked inside the line search
         elif linalg.norm(x, 2) > xnormquit:
             _log('bfgs1run: norm(x) exceeds specified limit, quitting after'
                  ' %d iteration(s)' % (it + 1))
             info = 3
-            times.append(time.time() - time0, f)
-            return  x, f, d, H, it, info, X, G, w, fevalrec, xrec, Hrec, times
+            times.append((time.time() - time0, f))
+            break
 
         # line search failed (Wolfe conditions not both satisfied)
         if fail == 1:
@@ -326,8 +456,7 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
                             it + 1, f, dnorm)))
                 info = 7
                 times.append((time.time() - time0, f))
-                return  (x, f, d, H, it, info, X, G, w, fevalrec, xrec,
-                         Hrec, times)
+                break
 
         # function apparently unbounded below
         elif fail == -1:
@@ -335,7 +464,7 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
                  'iteration(s), f = %g' % (it + 1, f))
             info = 8
             times.append((time.time() - time0, f))
-            return  x, f, d, H, it, info, X, G, w, fevalrec, xrec, Hrec
+            break
 
         # are we trapped in a local minimum ?
         relative_change = np.abs(1 - 1. * f_old / f) if f != f_old else 0
@@ -345,8 +474,7 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
                  ' f = %g' % (relative_change, funcrtol, it + 1, f))
             info = 9
             times.append((time.time() - time0, f))
-            return  (x, f, d, H, it, info, X, G, w, fevalrec, xrec,
-                     Hrec, times)
+            break
 
         # check near-stationarity
         if dnorm <= gradnormtol:
@@ -360,75 +488,138 @@ def bfgs1run(func, x0, grad=None, maxit=100, nvec=0, verbose=1, funcrtol=1e-6,
                     '%d iteration(s), f = %g' % (it + 1, f))
             info = 0
             times.append((time.time() - time0, f))
-            return  x, f, d, H, it, info, X, G, w, fevalrec, xrec, Hrec, times
+            break
 
         if time.time() > cpufinish:
             _log('bfgs1run: cpu time limit exceeded, quitting after %d '
                  'iteration(s) %d' % (it + 1))
             info = 4
             times.append((time.time() - time0, f))
-            return  x, f, d, H, it, info, X, G, w, fevalrec, xrec, Hrec, times
+            break
 
         s = (alpha * p).reshape((-1, 1))
         y = g - gprev
-        sty = np.dot(s.T, y)  # successful line search ensures this is positive
+        # successful line search ensures this is positive
+        sty = float(np.dot(s.T, y))
         assert sty > 0
+        tupdate = clock()
         if nvec == 0:  # perform rank two BFGS update to the inverse Hessian H
             if sty > 0:
-                if it == 0 and scale:
+                Hscale = 1.
+                if it == 0 and scale and not Hscaled:
                     # for full BFGS, Nocedal and Wright recommend
                     # scaling I before the first update only
-                    H = (1. * sty / np.dot(y.T, y)) * H
+                    Hscale = 1. * sty / np.dot(y.T, y)
+                    H.scale(Hscale)
                 # for formula, see Nocedal and Wright's book
                 # M = I - rho*s*y', H = M*H*M' + rho*s*s', so we have
                 # H = H - rho*s*y'*H - rho*H*y*s' + rho^2*s*y'*H*y*s'
                 # + rho*s*s' note that the last two terms combine:
                 # (rho^2*y'Hy + rho)ss'
                 rho = 1. / sty
-                Hy = np.dot(H, y).reshape((-1, 1))
-                rhoHyst = rho * np.dot(Hy, s.T)
-                # old version: update may not be symmetric because of rounding
-                # H = H - rhoHyst' - rhoHyst + rho*s*(y'*rhoHyst) + rho*s*s';
-                # new in version 2.02: make H explicitly symmetric
-                # also saves one outer product
-                # in practice, makes little difference, except H=H' exactly
+                Hy = H.dot(y)
                 ytHy = np.dot(y.T,
                               Hy)  # could be < 0 if H not numerically pos def
                 sstfactor = np.max([rho * rho * ytHy + rho, 0])
-                sscaled = np.sqrt(sstfactor) * s
-                H = H - (rhoHyst.T + rhoHyst) + np.dot(sscaled, sscaled.T)
-                # alternatively add the update terms together first: does
-                # not seem to make significant difference
-                # update = sscaled*sscaled' - (rhoHyst' + rhoHyst);
-                # H = H + update;
+                # the whole update is the symmetric rank-two term
+                # s*u' + u*s', with u = sstfactor/2*s - rho*Hy, which is
+                # applied in place (H stays exactly symmetric, since only
+                # its upper triangle is stored)
+                s = s.ravel()
+                H.syr2(1., s, .5 * sstfactor * s - rho * Hy)
+                recorder.update(s, y, scale=Hscale)
             # should not happen unless line search fails, and in that
             # case should normally have quit
             else:
                 _log('bfgs1run: sty <= 0, skipping BFGS update at iteration '
                      '%d ' % it, level=1)
         else:  # save s and y vectors for limited memory update
-            s = alpha * p
-            y = g - gprev
-            if it < nvec:
-                S = np.vstack((S.T, s)).T if len(S) else s
-                Y = np.vstack((Y.T, y)).T if len(Y) else y
-            # could be more efficient here by avoiding moving the columns
-            else:
-                S = np.vstack((S[..., 1:nvec].T, s)).T
-                Y = np.vstack((Y[..., 1:nvec].T, y)).T
+            # the oldest pair (if any) is evicted in place: no column moves
+            S.append(alpha * p)
+            rho[Y.append(y)] = 1. / sty
             if scale:
                 # recommended by Nocedal-Wright
-                H = np.dot(np.dot(s.T, y), np.dot(np.dot(y.T, y), H0))
+                H = (1. * sty / np.dot(y.T, y)) * H0
+        stats.add('nupdate')
+        stats.add_time('update', clock() - tupdate)
 
         f_old = f
         times.append((time.time() - time0, f))
+        if checkpoint.due(it):
+            checkpoint.save(
+                x0=x0, x=x, f=f, g=g, d=d, dnorm=dnorm, f_old=f_old, H=H,
+                Xb=Xb, Gb=Gb, qp=qp, w=w, nG=nG, times=times, it=it,
+                recorder=recorder, lbfgs=(S, Y, rho) if nvec > 0 else None,
+                elapsed=time.time() - time0, oracle=oracle.cache_state())
+    else:
+        _log('bfgs1run: %d iteration(s) reached, f = %g, dnorm = %5.1e' % (
+                maxit, f, dnorm))
+
+        info = 1  # quit since max iterations reached
     # end of 'for loop'
 
-    _log('bfgs1run: %d iteration(s) reached, f = %g, dnorm = %5.1e' % (
-            maxit, f, dnorm))
+    # return the saved gradients (and points, and weights) newest first
+    order = Gb.order()[::-1]
+    X = Xb.data[:, order]
+    G = Gb.data[:, order]
+    if nG > 1:
+        w = w[order]
+    if warm_start is not None:
+        # hand the final state over to the next solve
+        warm_start.f = f
+        warm_start.X = X[:, ::-1]
+        if nvec == 0:
+            warm_start.H = H
+        else:
+            order = S.order()
+            warm_start.S = S.data[:, order]
+            warm_start.Y = Y.data[:, order]
+            warm_start.rho = rho[order]
+            warm_start.Hdiag = H
+    stats.record_oracle(oracle, ostart)
+    return  ((x, f, d, _export(H), it, info, X, G, w) + recorder.close() +
+             (times,))
+
+
+def _warm_bundle(oracle, X, x, evaldist, ngrad, Xb, Gb):
+    """
+    Re-evaluate the points of X (a previous bundle, oldest first) which
+    are within distance evaldist of x (but not x itself), in a single
+    batch, and append them and their gradients to the ring buffers Xb and
+    Gb, leaving room for x.
+
+    """
+
+    dist = np.sqrt(((X - x.reshape((-1, 1))) ** 2).sum(axis=0))
+    X = X[:, (dist <= evaldist) & (dist > 0)]
+    X = X[:, X.shape[1] - min(X.shape[1], ngrad - 1):]
+    if X.shape[1] == 0:
+        return
+    _, G = oracle.batch(X)
+    for j in xrange(X.shape[1]):
+        Xb.append(X[:, j])
+        Gb.append(G[:, j])
+
+
+def _export(H):
+    """
+    Final inverse Hessian approximation, as returned by bfgs1run: for full
+    BFGS, the full symmetric matrix (made in place from the storage of H,
+    unless this is packed or in single precision).
+
+    """
+
+    return H.toarray(copy=False) if isinstance(H, SymMatrix) else H
+
+
+def _nbytes(*arrays):
+    """
+    Total number of bytes held by the given arrays (or ring buffers).
+
+    """
+
+    return sum(getattr(a, 'nbytes', np.asarray(a).nbytes) for a in arrays)
 
-    info = 1  # quit since max iterations reached
-    return  x, f, d, H, it, info, X, G, w, fevalrec, xrec, Hrec, times
 
 if __name__ == '__main__':
     nvar = 300
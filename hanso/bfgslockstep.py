@@ -0,0 +1,373 @@
+"""
+:Synopsis: BFGS from several starting points at once, advanced in lockstep
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import time
+
+import numpy as np
+from scipy import linalg
+
+from ringbuffer import RingBuffer
+from bundleqp import BundleQP
+from oracle import make_oracle
+from records import NullSink
+from instrument import Stats, clock
+
+
+def bfgs_lockstep(func, x0, grad=None, maxit=100, verbose=1, funcrtol=1e-6,
+                  gradnormtol=1e-4, fvalquit=-np.inf, xnormquit=np.inf,
+                  cpumax=np.inf, wolfe1=0, wolfe2=.5, quitLSfail=1,
+                  ngrad=None, evaldist=1e-4, H0=None, scale=1,
+                  Hdtype=np.float64, records=None, runs=None):
+    """
+    Make runs of full BFGS (with weak Wolfe line search) from several
+    starting points, all advanced together. Intended to be called from
+    bfgs (see its `lockstep` parameter).
+
+    The iterates are the columns of an (nvar, nstart) array, and the
+    inverse Hessian approximations are stacked into an (nstart, nvar,
+    nvar) array, so that the search directions of all the runs are
+    computed by a single batched matrix-vector product, and their BFGS
+    updates by a few batched products. Each round evaluates one trial
+    point of the line search of each run which is still going, with a
+    single call to the `batch` method of the oracle: with a vectorized
+    oracle (see Oracle), this is a single call to func and grad. Runs
+    which terminate drop out of the rounds.
+
+    Each run makes exactly the same steps (up to rounding) as bfgs1run
+    from the same starting point: the line searches are those of
+    linesch_ww, and the termination tests and info codes are those of
+    bfgs1run. The runs are not cancelled when one of them reaches fvalquit
+    or xnormquit.
+
+    Parameters
+    ----------
+    func : callable func(x), or Oracle
+        function to minimise (see Oracle); this pays off with a vectorized
+        oracle, on cheap functions of small or medium nvar
+
+    x0: 2D array of shape (nvar, nstart)
+        starting points, one per column
+
+    H0: float, 1D array of length nvar or 2D array of shape (nvar, nvar),
+    optional (default 1.)
+        initial inverse Hessian approximation (see bfgs1run)
+
+    Hdtype: numpy dtype, optional (default np.float64)
+        precision in which the inverse Hessian approximations are stored
+
+    records: record sink, optional (default None)
+        where to send the execution records of each run (see bfgs1run)
+
+    runs: list of nstart ints, optional (default None)
+        indices of the runs, used by the record sink (e.g to name files);
+        by default 0, 1, ..., nstart - 1
+
+    Other parameters are those of bfgs1run.
+
+    Returns
+    -------
+    runs: list of nstart (results, stats) pairs
+        results is the tuple returned by bfgs1run for the corresponding
+        run, and stats the statistics of the run (see Stats); the oracle
+        time of each round is shared evenly among the points it evaluates
+
+    """
+
+    def _log(msg, level=0):
+        if verbose > level:
+            print msg
+
+    oracle = make_oracle(func, grad)
+    x0 = np.array(x0, dtype=float)
+    if x0.ndim == 1:
+        x0 = x0.reshape((-1, 1))
+    nvar, nstart = x0.shape
+    H0 = 1. if H0 is None else H0
+    ngrad = min(100, min(2 * nvar, nvar + 10)) if ngrad is None else ngrad
+    records = NullSink() if records is None else records
+    cpufinish = time.time() + cpumax
+    time0 = time.time()
+
+    # state of the runs, one column (or slice) per run
+    X = x0.copy()
+    H = np.empty((nstart, nvar, nvar), dtype=Hdtype)
+    H[:] = H0 if np.ndim(H0) == 2 else np.diag(
+        np.ones(nvar) * H0)
+    P = np.zeros((nvar, nstart))  # search directions
+    D = np.zeros((nvar, nstart))  # smallest vectors in the convex hulls
+    dnorm = np.zeros(nstart)
+    f_old = np.zeros(nstart)
+    it = np.zeros(nstart, dtype=int)
+    info = -np.ones(nstart, dtype=int)  # -1 while the run is going
+    w = [1] * nstart
+    Xb = [RingBuffer(nvar, ngrad) for _ in xrange(nstart)]
+    Gb = [RingBuffer(nvar, ngrad) for _ in xrange(nstart)]
+    qp = [BundleQP(ngrad) for _ in xrange(nstart)]
+    runs = range(nstart) if runs is None else runs
+    recorders = [records.open(run, nvar, maxit, H0=H0) for run in runs]
+    times = [[] for _ in xrange(nstart)]
+    stats = [Stats() for _ in xrange(nstart)]
+
+    # state of the line searches (see linesch_ww)
+    gtp = np.zeros(nstart)  # directional derivatives at t = 0
+    t = np.ones(nstart)
+    alpha = np.zeros(nstart)
+    beta = np.zeros(nstart)
+    Xalpha = np.zeros((nvar, nstart))
+    falpha = np.zeros(nstart)
+    Galpha = np.zeros((nvar, nstart))
+    nbisect = np.zeros(nstart, dtype=int)
+    nexpand = np.zeros(nstart, dtype=int)
+    nbisectmax = np.zeros(nstart)
+    nexpandmax = np.zeros(nstart)
+    fevalrec = [[] for _ in xrange(nstart)]
+
+    def _evaluate(runs, points):
+        start = clock()
+        F, G = oracle.batch(points)
+        seconds = (clock() - start) / len(runs)
+        for run in runs:
+            stats[run].add('nfeval')
+            stats[run].add('ngeval')
+            stats[run].add_time('oracle', seconds)
+        return F, G
+
+    def _stop(run, code):
+        info[run] = code
+        times[run].append((time.time() - time0, F[run]))
+
+    def _search(runs):
+        # new search directions, and start of their line searches
+        P[:, runs] = -np.matmul(H[runs], G[:, runs].T[:, :, np.newaxis]
+                                )[:, :, 0].T
+        gtp[runs] = np.einsum('ij,ij->j', G[:, runs], P[:, runs])
+        for run in runs:
+            if gtp[run] >= 0 or np.isnan(gtp[run]):
+                _log('bfgs_lockstep: run %d: not descent direction, quitting'
+                     ' after %d iteration(s), f = %g, dnorm = %5.1e' % (
+                        run, it[run] + 1, F[run], dnorm[run]))
+                _stop(run, 6)
+        runs = [run for run in runs if info[run] < 0]
+        pnorm = np.sqrt((P[:, runs] ** 2).sum(axis=0))
+        t[runs] = 1.  # important to try steplength one first
+        alpha[runs] = 0.
+        beta[runs] = np.inf
+        Xalpha[:, runs] = X[:, runs]
+        falpha[runs] = F[runs]
+        Galpha[:, runs] = G[:, runs]
+        nbisect[runs] = 0
+        nexpand[runs] = 0
+        # the same arbitrary limits as linesch_ww
+        nbisectmax[runs] = np.maximum(30, np.round(np.log2(1e5 * pnorm)))
+        nexpandmax[runs] = np.maximum(10, np.round(np.log2(1e5 / pnorm)))
+        for run in runs:
+            fevalrec[run] = []
+
+    # first evaluation
+    F, G = _evaluate(range(nstart), X)
+    G = np.array(G)
+    for run in xrange(nstart):
+        Xb[run].append(X[:, run])
+        slot = Gb[run].append(G[:, run])
+        qp[run].update(Gb[run].view(), slot)
+        D[:, run] = G[:, run]
+        f_old[run] = F[run]
+        if np.isnan(F[run]) or np.isinf(F[run]) or np.any(
+                np.isnan(G[:, run])) or np.any(np.isinf(G[:, run])):
+            _log('bfgs_lockstep: run %d: f or grad is infinite or nan at '
+                 'initial iterate' % run)
+            info[run] = 5
+            continue
+        dnorm[run] = linalg.norm(G[:, run], 2)
+        if maxit == 0:
+            info[run] = 1
+    _search([run for run in xrange(nstart) if info[run] < 0])
+
+    while np.any(info < 0):
+        # one trial point per line search
+        runs = np.where(info < 0)[0]
+        tline = clock()
+        Xt = X[:, runs] + t[runs] * P[:, runs]
+        Ft, Gt = _evaluate(runs, Xt)
+        gtd = np.einsum('ij,ij->j', Gt, P[:, runs])
+        for j, run in enumerate(runs):
+            fevalrec[run].append(Ft[j])
+
+        # the weak Wolfe conditions, as in linesch_ww
+        reached = Ft < fvalquit
+        toofar = ~reached & ((Ft >= F[runs] + wolfe1 * t[runs] * gtp[runs]) |
+                          np.isnan(Ft))
+        tooshort = ~reached & ~toofar & ((gtd <= wolfe2 * gtp[runs]) |
+                                      np.isnan(gtd))
+        wolfe = ~reached & ~toofar & ~tooshort
+        beta[runs[toofar | wolfe]] = t[runs[toofar | wolfe]]
+        accept = ~toofar
+        alpha[runs[accept]] = t[runs[accept]]
+        Xalpha[:, runs[accept]] = Xt[:, accept]
+        falpha[runs[accept]] = Ft[accept]
+        Galpha[:, runs[accept]] = Gt[:, accept]
+
+        # next trial steps: bisection, or expansion
+        fail = np.where(reached | wolfe, 0, 2)
+        bracketed = beta[runs] < np.inf
+        bisect = (fail == 2) & bracketed & (nbisect[runs] <
+                                            nbisectmax[runs])
+        expand = (fail == 2) & ~bracketed & (nexpand[runs] <
+                                             nexpandmax[runs])
+        fail[(fail == 2) & bracketed & ~bisect] = 1
+        fail[(fail == 2) & ~bracketed & ~expand] = -1
+        nbisect[runs[bisect]] += 1
+        t[runs[bisect]] = (alpha[runs[bisect]] + beta[runs[bisect]]) / 2.
+        nexpand[runs[expand]] += 1
+        t[runs[expand]] = 2 * alpha[runs[expand]]
+        seconds = (clock() - tline) / len(runs)
+
+        # completed line searches
+        updated = []
+        for j, run in enumerate(runs):
+            stats[run].add_time('linesearch', seconds)
+            if fail[j] == 2:
+                continue
+            stats[run].add('nlinesearch')
+            stats[run].add('nbisect', nbisect[run])
+            stats[run].add('nexpand', nexpand[run])
+            if fail[j] == 1 and verbose > 1:
+                _log('Line search failed to satisfy weak Wolfe conditions'
+                     ' although point satisfying conditions was bracketed')
+            elif fail[j] == -1 and verbose > 1:
+                _log('Line search failed to bracket point satisfying weak '
+                     'Wolfe conditions; function may be unbounded below')
+            gprev = G[:, run].copy()
+            X[:, run] = Xalpha[:, run]
+            F[run] = falpha[run]
+            G[:, run] = Galpha[:, run]
+            x, f, g = X[:, run], F[run], G[:, run]
+
+            # the saved gradients, and the optimality check, as in
+            # bfgs1run
+            if alpha[run] * linalg.norm(P[:, run], 2) > evaldist:
+                Xb[run].reset()
+                Gb[run].reset()
+                qp[run].reset()
+            Xb[run].append(x)
+            slot = Gb[run].append(g)
+            qp[run].update(Gb[run].view(), slot)
+            nG = Gb[run].size
+            if nG > 1:
+                w[run], D[:, run], _, _ = qp[run].solve(
+                    Gb[run].view(), verbose=verbose, stats=stats[run])
+            else:
+                w[run] = 1
+                D[:, run] = g
+            dnorm[run] = linalg.norm(D[:, run], 2)
+            stats[run].maximum('peakmem', H[run].nbytes + Xb[run].nbytes +
+                               Gb[run].nbytes + qp[run].Q.nbytes)
+            recorders[run].append(x, fevalrec[run], H[run])
+            if verbose > 1:
+                _log('bfgs_lockstep: run %d: iter %d: nfevals = %d, step = '
+                     '%5.1e, f = %g, nG = %d, dnorm = %5.1e' % (
+                        run, it[run], len(fevalrec[run]), alpha[run], f, nG,
+                        dnorm[run]), level=1)
+
+            relative_change = np.abs(1 - 1. * f_old[run] / f) if (
+                f != f_old[run]) else 0
+            if f < fvalquit:
+                _log('bfgs_lockstep: run %d: reached target objective, '
+                     'quitting after %d iteration(s)' % (run, it[run] + 1))
+                _stop(run, 2)
+            elif linalg.norm(x, 2) > xnormquit:
+                _log('bfgs_lockstep: run %d: norm(x) exceeds specified '
+                     'limit, quitting after %d iteration(s)' % (
+                        run, it[run] + 1))
+                _stop(run, 3)
+            elif fail[j] == 1 and quitLSfail:
+                _log('bfgs_lockstep: run %d: line search failed. Quitting '
+                     'after %d iteration(s), f = %g, dnorm = %5.1e' % (
+                        run, it[run] + 1, f, dnorm[run]))
+                _stop(run, 7)
+            elif fail[j] == -1:
+                _log('bfgs_lockstep: run %d: f may be unbounded below, '
+                     'quitting after %d iteration(s), f = %g' % (
+                        run, it[run] + 1, f))
+                _stop(run, 8)
+            elif relative_change < funcrtol:
+                _log('bfgs_lockstep: run %d: relative change in func over '
+                     'last iteration (%g) below tolerance (%g), quitting '
+                     'after %d iteration(s), f = %g' % (
+                        run, relative_change, funcrtol, it[run] + 1, f))
+                _stop(run, 9)
+            elif dnorm[run] <= gradnormtol:
+                _log('bfgs_lockstep: run %d: norm of smallest vector in '
+                     'convex hull of gradients below tolerance, quitting '
+                     'after %d iteration(s), f = %g' % (run, it[run] + 1, f))
+                _stop(run, 0)
+            elif time.time() > cpufinish:
+                _log('bfgs_lockstep: run %d: cpu time limit exceeded, '
+                     'quitting after %d iteration(s)' % (run, it[run] + 1))
+                _stop(run, 4)
+            else:
+                updated.append((run, gprev))
+
+        if not updated:
+            continue
+
+        # BFGS updates of the runs which carry on (see bfgs1run)
+        tupdate = clock()
+        runs = np.array([run for run, _ in updated])
+        S = alpha[runs] * P[:, runs]
+        Y = G[:, runs] - np.array([gprev for _, gprev in updated]).T
+        sty = np.einsum('ij,ij->j', S, Y)
+        if scale:
+            # for full BFGS, Nocedal and Wright recommend scaling I before
+            # the first update only
+            first = (it[runs] == 0) & (sty > 0)
+            Hscale = np.where(first, sty / np.einsum('ij,ij->j', Y, Y), 1.)
+            H[runs[first]] *= Hscale[first, np.newaxis, np.newaxis].astype(
+                Hdtype)
+        else:
+            Hscale = np.ones(len(runs))
+        ok = sty > 0
+        rho = 1. / np.where(ok, sty, 1.)
+        HY = np.matmul(H[runs], Y.T[:, :, np.newaxis])[:, :, 0].T
+        ytHy = np.einsum('ij,ij->j', Y, HY)
+        sstfactor = np.maximum(rho * rho * ytHy + rho, 0)
+        U = .5 * sstfactor * S - rho * HY
+        # H += s * u' + u * s', for the runs whose update is well defined
+        H[runs[ok]] += (S[:, ok].T[:, :, np.newaxis] *
+                        U[:, ok].T[:, np.newaxis, :] +
+                        U[:, ok].T[:, :, np.newaxis] *
+                        S[:, ok].T[:, np.newaxis, :]).astype(Hdtype)
+        seconds = (clock() - tupdate) / len(runs)
+        for k, run in enumerate(runs):
+            if ok[k]:
+                recorders[run].update(S[:, k], Y[:, k], scale=Hscale[k])
+                stats[run].add('nupdate')
+            else:
+                _log('bfgs_lockstep: run %d: sty <= 0, skipping BFGS update '
+                     'at iteration %d ' % (run, it[run]), level=1)
+            stats[run].add_time('update', seconds)
+            f_old[run] = F[run]
+            times[run].append((time.time() - time0, F[run]))
+            if it[run] + 1 == maxit:
+                _log('bfgs_lockstep: run %d: %d iteration(s) reached, f = %g,'
+                     ' dnorm = %5.1e' % (run, maxit, F[run], dnorm[run]))
+                info[run] = 1  # quit since max iterations reached
+            else:
+                it[run] += 1
+        _search([run for run in runs if info[run] < 0])
+
+    # return the saved gradients (and points, and weights) newest first,
+    # as bfgs1run does
+    results = []
+    for run in xrange(nstart):
+        order = Gb[run].order()[::-1]
+        wrun = w[run][order] if Gb[run].size > 1 else w[run]
+        results.append(((X[:, run].copy(), F[run], D[:, run].copy(),
+                         H[run].astype(float), it[run], info[run],
+                         Xb[run].data[:, order], Gb[run].data[:, order],
+                         wrun) + recorders[run].close() + (times[run],),
+                        stats[run]))
+    return results
@@ -0,0 +1,156 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import numpy as np
+
+from qpspecial import qpspecial
+
+
+class BundleQP(object):
+    """
+    Stateful wrapper around qpspecial, for bundles of gradients which
+    change by a few columns between successive solves.
+
+    The Gram matrix Q = G' * G of the bundle is maintained by row/column
+    updates: inserting, replacing or deleting a gradient costs
+    O(size * nvar), instead of the O(size^2 * nvar) needed to recompute Q
+    from scratch. Each solve is warm-started from the weights w found by
+    the previous solve.
+
+    Parameters
+    ----------
+    capacity: int, optional (default 100)
+        initial number of gradients which the bundle can hold; Q is
+        reallocated if more are inserted
+
+    solver: string, optional (default "auto")
+        qpspecial backend
+
+    """
+
+    def __init__(self, capacity=100, solver="auto"):
+        self.Q = np.zeros((capacity, capacity))
+        self.w = np.zeros(capacity)
+        self.size = 0
+        self.solver = solver
+
+    def _grow(self, size):
+        capacity = len(self.w)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        Q = np.zeros((capacity, capacity))
+        Q[:self.size, :self.size] = self.Q[:self.size, :self.size]
+        w = np.zeros(capacity)
+        w[:self.size] = self.w[:self.size]
+        self.Q = Q
+        self.w = w
+
+    def reset(self):
+        """
+        Empty the bundle.
+
+        """
+
+        self.size = 0
+
+    def fit(self, G, w=None):
+        """
+        Recompute the Gram matrix from scratch for the bundle G (a 2D
+        array with one gradient per column). The weights used for the next
+        warm start are w if given, otherwise the previous weights if the
+        bundle size did not change.
+
+        """
+
+        G = np.asarray(G)
+        n = G.shape[1]
+        if n != self.size:
+            self._grow(n)
+            self.w[:n] = 0.
+        if w is not None and np.size(w) == n:
+            self.w[:n] = np.ravel(w)
+        self.Q[:n, :n] = np.dot(G.T, G)
+        self.size = n
+
+    def update(self, G, j):
+        """
+        Column j of the bundle G was replaced by a new gradient, or
+        appended to it (in which case j == G.shape[1] - 1): update row and
+        column j of the Gram matrix. The new gradient has weight 0 (or 1
+        if it is alone in the bundle).
+
+        """
+
+        G = np.asarray(G)
+        n = G.shape[1]
+        assert n in (self.size, self.size + 1), (n, self.size)
+        self._grow(n)
+        q = np.dot(G.T, G[:, j])
+        self.Q[j, :n] = q
+        self.Q[:n, j] = q
+        self.w[j] = 0. if n > 1 else 1.
+        self.size = n
+
+    def insert(self, G, j):
+        """
+        A new gradient was inserted in the bundle, at column j of G (the
+        columns previously at positions j, j + 1, ... were shifted to the
+        right): update the Gram matrix accordingly. The new gradient has
+        weight 0 (or 1 if it is alone in the bundle).
+
+        """
+
+        G = np.asarray(G)
+        n = self.size + 1
+        assert G.shape[1] == n, (G.shape, n)
+        self._grow(n)
+        # shift the rows and columns at and after j
+        Q, w = self.Q, self.w
+        Q[j + 1:n, j + 1:n] = Q[j:n - 1, j:n - 1].copy()
+        Q[j + 1:n, :j] = Q[j:n - 1, :j].copy()
+        Q[:j, j + 1:n] = Q[:j, j:n - 1].copy()
+        w[j + 1:n] = w[j:n - 1].copy()
+        q = np.dot(G.T, G[:, j])
+        Q[j, :n] = q
+        Q[:n, j] = q
+        w[j] = 0. if n > 1 else 1.
+        self.size = n
+
+    def delete(self, j):
+        """
+        Column j was removed from the bundle (the columns after j being
+        shifted to the left): update the Gram matrix accordingly.
+
+        """
+
+        n = self.size - 1
+        Q, w = self.Q, self.w
+        Q[j:n, :j] = Q[j + 1:n + 1, :j].copy()
+        Q[:j, j:n] = Q[:j, j + 1:n + 1].copy()
+        Q[j:n, j:n] = Q[j + 1:n + 1, j + 1:n + 1].copy()
+        w[j:n] = w[j + 1:n + 1].copy()
+        self.size = n
+
+    def solve(self, G, maxit=100, verbose=1, stats=None):
+        """
+        Solve the QP of qpspecial for the current bundle G, warm-started
+        from the previous solution. G must be consistent with the updates
+        made so far.
+
+        Returns
+        -------
+        Same as qpspecial.
+
+        """
+
+        n = self.size
+        assert np.shape(G)[1] == n, (np.shape(G), n)
+        x0 = self.w[:n].reshape((-1, 1))  # ignored if all zero
+        x, d, q, info = qpspecial(G, maxit=maxit, x=x0, verbose=verbose,
+                                  Q=self.Q[:n, :n], solver=self.solver,
+                                  stats=stats)
+        self.w[:n] = np.ravel(x)
+        return x, d, q, info
@@ -0,0 +1,221 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+Checkpoints of the solvers, to resume long runs (e.g after the worker
+running them was pre-empted).
+
+A Checkpoint is passed to hanso, bfgs or gradsamp via their `checkpoint`
+parameter. Each level of the solvers (hanso, bfgs and each of its runs of
+bfgs1run, gradsamp and each of its runs of gradsamp1run, and each sampling
+radius of gradsampfixed) has its own file in the checkpoint directory,
+named after its position in the call tree (e.g checkpoint.bfgs.run3.pkl),
+holding what it needs to carry on: bfgs1run and gradsampfixed save their
+iteration state (x, f, g, H or the limited memory pairs, the saved
+gradients and the QP weights, the iteration counter, ...) every `every`
+iterations, and the other levels save the results of their completed runs
+or phases. Each file also holds the state of the numpy random number
+generator and the time spent so far.
+
+When a solver is called again with the same checkpoint (e.g by running the
+same script again), each level picks up from its file, if there is one.
+Provided that func is deterministic, that the parameters are the same and
+that the cpumax budget (which counts the time spent before the resume) is
+not exhausted, the results are bit-identical to those of an uninterrupted
+run. The statistics (see Stats) of the runs which were in progress only
+cover the work done since the resume.
+
+"""
+
+import os
+import time
+import cPickle as pickle
+import numpy as np
+
+
+class NullCheckpoint(object):
+    """
+    No checkpointing (default).
+
+    """
+
+    def child(self, name):
+        return NullCheckpoint()
+
+    def due(self, it):
+        return False
+
+    def load(self):
+        self._start = time.time()
+        return None
+
+    def cpufinish(self, cpumax):
+        return self._start + cpumax
+
+    def save(self, **state):
+        pass
+
+
+class Checkpoint(NullCheckpoint):
+    """
+    Checkpoints of the solvers, in a directory (see module docstring).
+
+    Parameters
+    ----------
+    directory: string
+        where to write the checkpoint files; created if need be. A
+        directory holds the checkpoints of a single problem: reusing it for
+        another one resumes the wrong runs (this is caught, with a
+        ValueError, when the starting points differ)
+
+    every: int, optional (default 10)
+        bfgs1run and gradsampfixed save their state every so many
+        iterations; each save costs a write of O(nvar * ngrad) floats
+        (plus nvar^2 for the H of full BFGS)
+
+    name: string, optional (default "checkpoint")
+        name of the file of this level (without the .pkl extension)
+
+    """
+
+    def __init__(self, directory, every=10, name="checkpoint"):
+        self.directory = directory
+        self.every = every
+        self.name = name
+        self._spent = 0.
+
+    @property
+    def filename(self):
+        return os.path.join(self.directory, self.name + ".pkl")
+
+    def child(self, name):
+        """
+        Checkpoint of a sub-level, e.g child("run3") for the fourth run.
+
+        """
+
+        return Checkpoint(self.directory, every=self.every,
+                          name="%s.%s" % (self.name, name))
+
+    def due(self, it):
+        """
+        Whether the state should be saved after iteration it (counted
+        from 0).
+
+        """
+
+        return self.every > 0 and (it + 1) % self.every == 0
+
+    def load(self):
+        """
+        Load the state of this level, restoring the state of the random
+        number generator, and start its clock (see `cpufinish`).
+
+        Returns
+        -------
+        state: dict, or None
+            the keyword arguments of the last call to `save`, or None if
+            there is no checkpoint yet
+
+        """
+
+        super(Checkpoint, self).load()
+        self._spent = 0.
+        if not os.path.isfile(self.filename):
+            return None
+        with open(self.filename, 'rb') as fd:
+            state = pickle.load(fd)
+        self._spent = state.pop('spent')
+        np.random.set_state(state.pop('random_state'))
+        return state
+
+    def cpufinish(self, cpumax):
+        """
+        Deadline of this level, for a budget of cpumax seconds which
+        includes the time spent before the last save.
+
+        """
+
+        return super(Checkpoint, self).cpufinish(cpumax) - self._spent
+
+    def save(self, **state):
+        """
+        Save the state of this level (e.g x=x, f=f, ...), atomically: the
+        file is written aside and then renamed, so that an interruption
+        leaves the previous checkpoint intact.
+
+        """
+
+        state['spent'] = self._spent + time.time() - self._start
+        state['random_state'] = np.random.get_state()
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:  # created meanwhile by another worker
+                if not os.path.isdir(self.directory):
+                    raise
+        tmp = self.filename + ".tmp"
+        with open(tmp, 'wb') as fd:
+            pickle.dump(state, fd, pickle.HIGHEST_PROTOCOL)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.rename(tmp, self.filename)
+
+
+class Paused(Exception):
+    """
+    Raised by RoundCheckpoint.save, to pause a run.
+
+    """
+
+
+class RoundCheckpoint(NullCheckpoint):
+    """
+    In-memory checkpoint of a single run of bfgs1run, which pauses it every
+    `every` iterations: the state is kept (not copied) and Paused is raised
+    out of the run, which is resumed exactly where it was paused by calling
+    bfgs1run again with the same checkpoint (see the `halving` and `dedup`
+    schedulers of bfgs). Unlike Checkpoint, the random number generator is
+    left alone, and cpumax is the budget of each call.
+
+    Parameters
+    ----------
+    every: int
+        number of iterations between pauses
+
+    """
+
+    def __init__(self, every):
+        self.every = every
+        self.state = None
+
+    def due(self, it):
+        return (it + 1) % self.every == 0
+
+    def load(self):
+        super(RoundCheckpoint, self).load()
+        return self.state
+
+    def save(self, **state):
+        self.state = state
+        raise Paused()
+
+    def clear(self):
+        """
+        Forget the state (e.g of a run which won't be resumed), releasing
+        its memory.
+
+        """
+
+        self.state = None
+
+
+def check_x0(state, x0, name):
+    """
+    Raise ValueError if the checkpointed state was made from another
+    starting point than x0.
+
+    """
+
+    if state is not None and not np.array_equal(state['x0'], x0):
+        raise ValueError("%s: the checkpoint was made from another starting"
+                         " point" % name)
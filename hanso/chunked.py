@@ -0,0 +1,135 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from scipy.sparse.linalg import LinearOperator
+
+
+class ChunkedMatrix(LinearOperator):
+    """
+    Matrix too large for memory (e.g a memory-mapped .npy file), seen as a
+    LinearOperator whose products are computed by streaming blocks of
+    rows, so that only a few blocks are held in memory at a time. The next
+    block is read from disk by a background thread while the current one
+    is being multiplied (numpy releases the GIL in both the copy and the
+    BLAS call, so reading and computing overlap).
+
+    Parameters
+    ----------
+    A: 2D array of shape (m, n), or string
+        the matrix, typically an np.memmap, or the path of a .npy file,
+        which is then memory-mapped read-only
+
+    memory: int, optional (default 2 ** 26, i.e 64MB)
+        memory budget for the blocks in flight, in bytes; this sets the
+        number of rows per block, unless chunksize is given
+
+    chunksize: int, optional (default None)
+        number of rows per block
+
+    prefetch: boolean, optional (default True)
+        if set, read the next block in the background
+
+    Notes
+    -----
+    The products are computed in double precision, whatever the storage
+    type of A (e.g np.float32, which halves the amount of data read).
+
+    """
+
+    def __init__(self, A, memory=2 ** 26, chunksize=None, prefetch=True):
+        if isinstance(A, basestring):
+            A = np.load(A, mmap_mode='r')
+        if A.ndim != 2:
+            raise ValueError("Expecting a 2D array, got shape %s" % (
+                    A.shape,))
+        super(ChunkedMatrix, self).__init__(np.float64, A.shape)
+        self.data = A
+        m, n = A.shape
+        if chunksize is None:
+            # the block being multiplied, the one being read and the one
+            # not yet released by the caller, in double precision
+            chunksize = memory // (3 * max(n, 1) * 8)
+        self.chunksize = int(min(max(chunksize, 1), max(m, 1)))
+        self.prefetch = prefetch
+        self._pool = None
+
+    def __getstate__(self):
+        # the thread pool can't be pickled (e.g for a worker process)
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def _read(self, start):
+        stop = min(start + self.chunksize, self.shape[0])
+        return start, stop, np.array(self.data[start:stop], dtype=np.float64)
+
+    def blocks(self):
+        """
+        Iterate over the blocks of rows, as (start, stop, block) tuples,
+        where block is an in-memory copy of rows start to stop - 1.
+
+        """
+
+        starts = range(0, self.shape[0], self.chunksize)
+        if not self.prefetch or len(starts) < 2:
+            for start in starts:
+                yield self._read(start)
+            return
+        if self._pool is None:
+            self._pool = ThreadPool(1)
+        pending = self._pool.apply_async(self._read, (starts[0],))
+        for k in xrange(len(starts)):
+            block = pending.get()
+            if k + 1 < len(starts):
+                pending = self._pool.apply_async(self._read,
+                                                 (starts[k + 1],))
+            yield block
+            del block  # don't hold on to it while the next one is read
+
+    def _matvec(self, x):
+        x = np.ravel(x)
+        y = np.empty(self.shape[0])
+        for start, stop, block in self.blocks():
+            y[start:stop] = np.dot(block, x)
+        return y
+
+    def _rmatvec(self, z):
+        z = np.ravel(z)
+        r = np.zeros(self.shape[1])
+        for start, stop, block in self.blocks():
+            r += np.dot(block.T, z[start:stop])
+        return r
+
+    def _matmat(self, X):
+        X = np.asarray(X)
+        Y = np.empty((self.shape[0], X.shape[1]))
+        for start, stop, block in self.blocks():
+            Y[start:stop] = np.dot(block, X)
+        return Y
+
+    def rmatmat(self, Z):
+        """
+        Product A' * Z, in a single pass over A.
+
+        """
+
+        Z = np.asarray(Z)
+        R = np.zeros((self.shape[1], Z.shape[1]))
+        for start, stop, block in self.blocks():
+            R += np.dot(block.T, Z[start:stop])
+        return R
+
+    def close(self):
+        """
+        Stop the prefetching thread.
+
+        """
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,356 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+Composite objectives f(x) = loss(A * x) + penalty(x), where A is a linear
+map (e.g the design of a regression problem), loss is smooth and penalty
+is nonsmooth (l1, TV, ...).
+
+"""
+
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+from scipy.sparse.linalg import LinearOperator
+
+from oracle import Oracle
+from instrument import clock
+from example_functions import l1, grad_l1, tv, grad_tv
+
+
+class CompositeOracle(Oracle):
+    """
+    Oracle of a composite objective f(x) = loss(A * x) + penalty(x).
+
+    Evaluating f and its gradient at a point costs one product by A and
+    one by A', but the solvers seldom need that: along a line search
+    x0 + t * d, the line searches (see linesch_ww) ask for a
+    CompositeLine (see `along`), which forms A * d once and gets
+    A * (x0 + t * d) = A * x0 + t * A * d, so that each trial step costs
+    O(m + nvar), the directional derivative being
+    loss'(A * x)' * (A * d) + penalty'(x)' * d. Only the gradient at the
+    accepted step is formed, with one product by A'. The products A * x
+    of the last points are cached, so that each iteration of a solver
+    costs one product by A and one by A'.
+
+    Parameters
+    ----------
+    A: 2D array of shape (m, nvar), sparse matrix or LinearOperator
+        the linear map, only accessed through products; for a matrix
+        larger than memory, use a ChunkedMatrix on its memory-mapped file
+
+    loss: callable loss(z)
+        smooth loss of z = A * x, returning its value and its gradient
+        (a 1D array of length m); e.g squared_loss(b)
+
+    penalty: callable penalty(x), optional (default None)
+        nonsmooth penalty, returning its value and a subgradient; e.g
+        l1_penalty(lambd), tv_penalty(lambd), or their sum_penalties
+
+    cache_size: int, optional (default 3)
+        number of points whose function value, gradient and product by A
+        are kept (see Oracle)
+
+    refresh: int, optional (default 50)
+        A * x is recomputed from scratch (rather than updated along the
+        line searches) after this many updates, to keep the rounding
+        errors in check
+
+    Attributes
+    ----------
+    nmatvec, nrmatvec: int
+        number of products by A and A'
+
+    """
+
+    def __init__(self, A, loss, penalty=None, cache_size=3, refresh=50):
+        super(CompositeOracle, self).__init__(None, cache_size=cache_size)
+        self.A = A
+        self.loss = loss
+        self.penalty = penalty
+        self.refresh = refresh
+        self.nmatvec = 0
+        self.nrmatvec = 0
+        self._zcache = OrderedDict()  # key of x -> (A * x, age)
+
+    def _dot(self, x):
+        self.nmatvec += 1
+        return self.A.dot(x)
+
+    def _rdot(self, z):
+        self.nrmatvec += 1
+        if isinstance(self.A, LinearOperator):
+            return self.A.rmatvec(z)
+        return self.A.T.dot(z)
+
+    def _penalty(self, x):
+        if self.penalty is None:
+            return 0., 0.
+        return self.penalty(x)
+
+    def _z(self, x, key=None):
+        """
+        A * x and its age (number of updates since it was computed from
+        scratch), from the cache if possible.
+
+        """
+
+        key = self._key(x) if key is None else key
+        if key in self._zcache:
+            return self._zcache[key]
+        return self._dot(x), 0
+
+    def _remember(self, key, z, age, fg=None):
+        if self.cache_size == 0:
+            return
+        for cache, value in ((self._zcache, (z, age)), (self._cache, fg)):
+            if value is None:
+                continue
+            if key not in cache and len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+            cache[key] = value
+
+    def _evaluate(self, x):
+        start = clock()
+        key = self._key(x)
+        z, age = self._z(x, key=key)
+        lval, lgrad = self.loss(z)
+        pval, pgrad = self._penalty(x)
+        fg = lval + pval, self._rdot(lgrad) + pgrad
+        self._remember(key, z, age)
+        self.time += clock() - start
+        return fg
+
+    def batch(self, X):
+        """
+        Function values and gradients at the columns of X (see Oracle),
+        with one product of A by X and one of A' by the gradients of the
+        loss.
+
+        """
+
+        start = clock()
+        X = np.asarray(X, dtype=float)
+        n = X.shape[1]
+        self.ncall += n
+        self.nfeval += n
+        self.ngeval += n
+        Z = self.A.dot(X)
+        F = np.empty(n)
+        L = np.empty(Z.shape)
+        P = np.zeros(X.shape)
+        for j in xrange(n):
+            lval, L[:, j] = self.loss(Z[:, j])
+            pval, P[:, j] = self._penalty(X[:, j])
+            F[j] = lval + pval
+        self.nmatvec += n
+        if hasattr(self.A, 'rmatmat'):
+            G = self.A.rmatmat(L)  # e.g a single pass of a ChunkedMatrix
+        elif isinstance(self.A, LinearOperator):
+            G = np.array([self.A.rmatvec(L[:, j]) for j in xrange(n)]).T
+        else:
+            G = self.A.T.dot(L)
+        self.nrmatvec += n
+        self.time += clock() - start
+        return F, G + P
+
+    def copy(self):
+        return CompositeOracle(self.A, self.loss, penalty=self.penalty,
+                               cache_size=self.cache_size,
+                               refresh=self.refresh)
+
+    def cache_state(self):
+        # the products by A along the line searches depend on whether
+        # A * x was cached, so resumed runs need it to be bit-identical
+        state = super(CompositeOracle, self).cache_state()
+        state['zcache'] = self._zcache.copy()
+        return state
+
+    def restore_cache(self, state):
+        super(CompositeOracle, self).restore_cache(state)
+        self._zcache = state['zcache'].copy()
+
+    def merge(self, other):
+        super(CompositeOracle, self).merge(other)
+        self.nmatvec += getattr(other, 'nmatvec', 0)
+        self.nrmatvec += getattr(other, 'nrmatvec', 0)
+
+    def along(self, x0, d):
+        """
+        The restriction of the objective to the line x0 + t * d, as a
+        CompositeLine.
+
+        """
+
+        return CompositeLine(self, x0, d)
+
+
+class CompositeLine(object):
+    """
+    Restriction t -> f(x0 + t * d) of a composite objective to a line,
+    evaluated incrementally (see CompositeOracle), with the protocol of
+    OracleLine: `value(t)` and `slope(t)` return the function value and
+    the directional derivative at x0 + t * d (both from the same products,
+    so the slope is free), and `gradient(t)` the full gradient there.
+
+    The trial points are computed as x0 + t * d, exactly as the line
+    searches do, so that the accepted point is found in the cache of the
+    oracle afterwards.
+
+    """
+
+    def __init__(self, oracle, x0, d):
+        start = clock()
+        self.oracle = oracle
+        self.x0 = np.asarray(x0, dtype=float)
+        self.d = np.asarray(d, dtype=float)
+        z0, age = oracle._z(self.x0)
+        if age >= oracle.refresh:
+            z0, age = oracle._dot(self.x0), 0
+        self.z0 = z0
+        self.age = age + 1
+        self.Ad = oracle._dot(self.d)
+        self._t = None
+        oracle.time += clock() - start
+
+    def _at(self, t):
+        """
+        Evaluate the loss and penalty at x0 + t * d (the last point is
+        remembered).
+
+        """
+
+        if t != self._t:
+            x = self.x0 + t * self.d
+            z = self.z0 + t * self.Ad
+            lval, lgrad = self.oracle.loss(z)
+            pval, pgrad = self.oracle._penalty(x)
+            self._t = t
+            self._point = x, z, lval + pval, lgrad, pgrad
+        return self._point
+
+    def value(self, t):
+        """
+        Function value at x0 + t * d.
+
+        """
+
+        start = clock()
+        oracle = self.oracle
+        oracle.ncall += 1
+        oracle.nfeval += 1
+        f = self._at(t)[2]
+        oracle.time += clock() - start
+        return f
+
+    def slope(self, t):
+        """
+        Directional derivative at x0 + t * d.
+
+        """
+
+        start = clock()
+        _, _, _, lgrad, pgrad = self._at(t)
+        gtd = np.dot(lgrad, self.Ad) + np.dot(pgrad, self.d)
+        self.oracle.time += clock() - start
+        return gtd
+
+    def __call__(self, t):
+        """
+        Function value and directional derivative at x0 + t * d.
+
+        """
+
+        return self.value(t), self.slope(t)
+
+    def gradient(self, t):
+        """
+        Gradient at x0 + t * d (one product by A'). The point, its function
+        value, gradient and image by A are then cached by the oracle.
+
+        """
+
+        start = clock()
+        oracle = self.oracle
+        x, z, f, lgrad, pgrad = self._at(t)
+        key = oracle._key(x)
+        if key in oracle._cache:
+            g = oracle._cache[key][1]
+        else:
+            oracle.ngeval += 1
+            g = oracle._rdot(lgrad) + pgrad
+            oracle._remember(key, z, self.age, fg=(f, g))
+        oracle.time += clock() - start
+        return g
+
+
+def _squared_loss(b, z):
+    r = z - b
+    return .5 * np.dot(r, r), r
+
+
+def squared_loss(b):
+    """
+    Least-squares loss .5 * ||z - b||^2, for CompositeOracle.
+
+    """
+
+    return partial(_squared_loss, b)
+
+
+def _l1_penalty(lambd, x):
+    return lambd * l1(x), lambd * grad_l1(x)
+
+
+def l1_penalty(lambd=1.):
+    """
+    Penalty lambd * l1(x), for CompositeOracle.
+
+    """
+
+    return partial(_l1_penalty, lambd)
+
+
+def _tv_penalty(lambd, x):
+    return lambd * tv(x), lambd * grad_tv(x)
+
+
+def tv_penalty(lambd=1.):
+    """
+    Penalty lambd * tv(x), for CompositeOracle.
+
+    """
+
+    return partial(_tv_penalty, lambd)
+
+
+def _sum_penalties(penalties, x):
+    value, grad = 0., 0.
+    for p in penalties:
+        pval, pgrad = p(x)
+        value, grad = value + pval, grad + pgrad
+    return value, grad
+
+
+def sum_penalties(*penalties):
+    """
+    Sum of penalties, for CompositeOracle (0 if there are none, e.g when
+    all their weights are 0).
+
+    """
+
+    return partial(_sum_penalties, penalties)
+
+
+if __name__ == '__main__':
+    import cPickle as pickle
+    rng = np.random.RandomState(42)
+    A, b = rng.randn(50, 20), rng.randn(50)
+    oracle = CompositeOracle(A, squared_loss(b), penalty=sum_penalties(
+            l1_penalty(.1), tv_penalty(.1)))
+    # the losses and penalties are picklable, and so are the oracles built
+    # from them (e.g for bfgs with n_jobs > 1, or executor="process")
+    clone = pickle.loads(pickle.dumps(oracle, pickle.HIGHEST_PROTOCOL))
+    x = rng.randn(20)
+    (f, g), (fc, gc) = oracle(x), clone(x)
+    print f, fc
+    assert f == fc and np.array_equal(g, gc)
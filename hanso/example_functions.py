@@ -4,16 +4,15 @@
 """
 
 import numpy as np
-from scipy import linalg
 
 
 def l2(x):
     """
-    l2-norm squared
+    l2-norm squared; x can also be a 2D array of points, one per column
 
     """
 
-    return .5 * linalg.norm(x, 2) ** 2
+    return .5 * np.sum(np.asarray(x) ** 2, axis=0)
 
 
 def gradl2(x):
@@ -22,11 +21,11 @@ def gradl2(x):
 
 def l1(x):
     """
-    l1-norm
+    l1-norm; x can also be a 2D array of points, one per column
 
     """
 
-    return 1. * linalg.norm(x, 1)
+    return 1. * np.sum(np.abs(x), axis=0)
 
 
 def grad_l1(x):
@@ -66,9 +65,10 @@ def grad_nesterov(x, **kwargs):
     X1 = x[:-1]
     Z = X2 - X1 ** 2 + 1.
     z = x[-1] - x[-2] ** 2 + 1.
-    I = np.eye(len(x))
+    e0 = np.zeros(len(x) - 1)  # first row of the identity, but for the end
+    e0[0] = 1.
 
-    return np.hstack((-2 * X1 * Z / np.abs(Z) + 2 * (X1 - 1) * I[0, :-1],
+    return np.hstack((-2 * X1 * Z / np.abs(Z) + 2 * (X1 - 1) * e0,
                        z / np.abs(z)))
 
 
@@ -3,10 +3,15 @@
 
 """
 
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
+from oracle import make_oracle
+from instrument import Stats, clock
 
 
-def getbundle(func, x0, grad=None, g0=None, samprad=1e-4, n=None):
+def getbundle(func, x0, grad=None, g0=None, samprad=1e-4, n=None,
+              executor=None, n_jobs=1, chunksize=10, stats=None):
     """
     Get bundle of n-1 gradients at points near x, in addition to g,
     which is gradient at x and goes in first column
@@ -14,10 +19,12 @@ def getbundle(func, x0, grad=None, g0=None, samprad=1e-4, n=None):
 
     Parameters
     ----------
-    func: callable function on 1D arrays of length nvar
-        function being optimized
+    func: callable function on 1D arrays of length nvar, or Oracle
+        function being optimized (see Oracle). The n - 1 sampled points
+        are evaluated as one batch: with a vectorized Oracle, this is a
+        single call
 
-    grad: callable function
+    grad: callable function, optional (default None)
         gradient of func
 
     x0: 1D array of len nvar, optional (default None)
@@ -32,6 +39,30 @@ def getbundle(func, x0, grad=None, g0=None, samprad=1e-4, n=None):
     n: int, optional (default min(100, 2 * nvar, nvar + 10))
         number of points and gradients to sample
 
+    executor: string or pool, optional (default None)
+        if set, the n - 1 sampled points are split into chunks of
+        `chunksize` points, which are sampled and evaluated in parallel:
+        "thread" (for oracles which release the GIL, e.g inside numpy or
+        scipy) or "process" (for pure-Python oracles, which must then be
+        picklable) create a pool of n_jobs workers for the duration of
+        the call (see `bundle_pool`); an existing pool, or any object with
+        a `map` method, is used as is. Each chunk draws its points from
+        its own random stream, seeded from the global numpy stream, so
+        that the bundle depends neither on n_jobs nor on the order in
+        which the chunks are scheduled (but it differs from the bundle
+        obtained with executor=None)
+
+    n_jobs: int, optional (default 1)
+        number of workers, if executor is a string; -1 means as many as
+        there are CPUs
+
+    chunksize: int, optional (default 10)
+        number of points per chunk, if executor is set
+
+    stats: Stats, optional (default None)
+        if provided, the number of bundles and the time spent sampling
+        them are recorded in it (see Stats)
+
     Returns
     -------
     xbundle: 2D array of shape (nvar, n)
@@ -46,44 +77,133 @@ def getbundle(func, x0, grad=None, g0=None, samprad=1e-4, n=None):
 
     """
 
-    def _fg(x):
-        return func(x) if grad is None else (func(x), grad(x))
+    def _record():
+        stats.add('nbundle')
+        stats.add_time('bundle', clock() - start)
 
+    start = clock()
+    stats = Stats() if stats is None else stats
+    oracle = make_oracle(func, grad)
     x0 = np.ravel(x0)
     nvar = len(x0)
     n = min(100, min(2 * nvar, nvar + 10)) if n is None else n
     xbundle = np.ndarray((nvar, n))
     gbundle = np.ndarray((nvar, n))
     xbundle[..., 0] = x0
-    gbundle[..., 0] = g0 if not g0 is None else _fg(x0)[1]
-    for k in xrange(1, n):  # note the 1
-        xpert = x0 + samprad * (np.random.rand(nvar) - 0.5
-                               )  # uniform distribution
-        f, g = _fg(xpert)
-        count = 0
-        # in particular, disallow infinite function values
-        while np.isnan(f) or np.isinf(f) or np.any(
-            np.isnan(g)) or np.any(np.isinf(g)):
-            xpert = (x0 + xpert) / 2.     # contract back until feasible
-            f, g = func(xpert), grad(xpert)
-            count = count + 1
-            if count > 100:  # should never happen, but just in case
-                raise RuntimeError(
-                    'getbundle: too many contractions needed to find finite'
-                    ' func and grad values')
-
-        xbundle[..., k] = xpert
-        gbundle[..., k] = g
-
+    gbundle[..., 0] = g0 if not g0 is None else oracle(x0)[1]
+    if n < 2:
+        _record()
+        return xbundle, gbundle
+
+    if executor is None:
+        # uniform distribution; drawn in one go, but row k of the draw is
+        # what the k-th of n - 1 successive calls to np.random.rand(nvar)
+        # would give
+        xpert = x0[:, np.newaxis] + samprad * (
+            np.random.rand(n - 1, nvar).T - 0.5)
+        xbundle[..., 1:], gbundle[..., 1:] = _evaluate(oracle, x0, xpert)
+        _record()
+        return xbundle, gbundle
+
+    # one task per chunk, with its own random stream: chunk k is seeded
+    # with (seed, k), whoever runs it
+    seed = np.random.randint(2 ** 31 - 1)
+    starts = range(1, n, chunksize)
+    tasks = [(oracle.copy(), x0, samprad, min(chunksize, n - start),
+              (seed, k), executor == "process")
+             for k, start in enumerate(starts)]
+    pool = bundle_pool(executor, n_jobs) if isinstance(
+        executor, basestring) else executor
+    try:
+        results = pool.map(_sample_chunk, tasks)
+    finally:
+        if pool is not executor:
+            pool.close()
+            pool.join()
+    for start, (xpert, gpert, worker_oracle) in zip(starts, results):
+        stop = start + xpert.shape[1]
+        xbundle[..., start:stop] = xpert
+        gbundle[..., start:stop] = gpert
+        oracle.merge(worker_oracle)
+
+    _record()
     return xbundle, gbundle
 
 
+def bundle_pool(executor, n_jobs=1):
+    """
+    Create a pool of n_jobs workers for getbundle: a thread pool if
+    executor is "thread", or a process pool if executor is "process".
+    The pool can be reused across calls to getbundle (the caller must
+    then close it).
+
+    """
+
+    if n_jobs < 0:
+        n_jobs = max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
+    if executor == "thread":
+        return ThreadPool(n_jobs)
+    elif executor == "process":
+        return multiprocessing.Pool(n_jobs)
+    else:
+        raise ValueError("Unknown executor: %s" % executor)
+
+
+def _sample_chunk(args):
+    """
+    Task run by the workers of getbundle: sample npts points in the
+    samprad-ball around x0, from the random stream seeded with seed, and
+    evaluate them. In worker processes, the global numpy stream is seeded
+    too, so that oracles which draw random numbers are reproducible.
+
+    """
+
+    oracle, x0, samprad, npts, seed, reseed = args
+    if reseed:
+        np.random.seed(seed)
+    rng = np.random.RandomState(seed)
+    xpert = x0[:, np.newaxis] + samprad * (
+        rng.rand(npts, len(x0)).T - 0.5)
+    xpert, gpert = _evaluate(oracle, x0, xpert)
+    return xpert, gpert, oracle
+
+
+def _evaluate(oracle, x0, xpert):
+    """
+    Evaluate the points xpert (one per column) as a batch, contracting
+    them back towards x0 until the function value and gradient are
+    finite.
+
+    """
+
+    f, g = oracle.batch(xpert)
+
+    # in particular, disallow infinite function values
+    bad = ~(np.isfinite(f) & np.all(np.isfinite(g), axis=0))
+    count = 0
+    while np.any(bad):
+        # contract back until feasible, re-evaluating only the points which
+        # are still infeasible
+        xpert[:, bad] = (x0[:, np.newaxis] + xpert[:, bad]) / 2.
+        fbad, gbad = oracle.batch(xpert[:, bad])
+        f[bad] = fbad
+        g[:, bad] = gbad
+        bad[bad] = ~(np.isfinite(fbad) & np.all(np.isfinite(gbad), axis=0))
+        count = count + 1
+        if count > 100:  # should never happen, but just in case
+            raise RuntimeError(
+                'getbundle: too many contractions needed to find finite'
+                ' func and grad values')
+
+    return xpert, g
+
+
 if __name__ == '__main__':
     import matplotlib.pyplot as plt
     from example_functions import (l1 as func,
                                    grad_l1 as grad)
 
-    _, gbundle = getbundle(func, grad, [1e-6, -1e-6], n=100)
+    _, gbundle = getbundle(func, [1e-6, -1e-6], grad=grad, n=100)
     plt.scatter(*gbundle)
     plt.title("Bundle of gradients around the origin for the l1-norm")
     plt.xlabel("gradient w.r.t x1")
@@ -7,9 +7,13 @@ import time
 import numpy as np
 from scipy import linalg
 from gradsamp1run import gradsamp1run
+from oracle import make_oracle
+from getbundle import bundle_pool
+from checkpoint import NullCheckpoint, check_x0
 
 
 def gradsamp(func, x0, grad=None, maxit=10, cpumax=np.inf, verbose=1,
+             executor=None, n_jobs=1, checkpoint=None, stats=None,
              **kwargs):
     """
     GRADSAMP Gradient sampling algorithm for nonsmooth, nonconvex
@@ -27,8 +31,8 @@ def gradsamp(func, x0, grad=None, maxit=10, cpumax=np.inf, verbose=1,
 
     Parameters
     ----------
-    func : callable func(x)
-        function to minimise.
+    func : callable func(x), or Oracle
+        function to minimise (see Oracle).
 
     x0: 1D array of len nvar or 2D array of shape (nvar, nstart),
     optional (default None)
@@ -39,6 +43,24 @@ def gradsamp(func, x0, grad=None, maxit=10, cpumax=np.inf, verbose=1,
         value and the gradient (``f, g = func(x, *args)``), unless
         `approx_grad` is True in which case `func` returns only ``f``.
 
+    executor: string or pool, optional (default None)
+        executor for the evaluation of the gradient bundles: "thread" or
+        "process" to create a pool of n_jobs workers, used by all the runs
+        (see getbundle)
+
+    n_jobs: int, optional (default 1)
+        number of workers, if executor is a string
+
+    checkpoint: Checkpoint, optional (default None)
+        if provided, the results of the completed runs are saved, and
+        each run is checkpointed by gradsamp1run; calling gradsamp again
+        with the same checkpoint resumes where it was interrupted (see
+        checkpoint.py)
+
+    stats: Stats, optional (default None)
+        if provided, the evaluations, bundles, QPs and line searches of
+        all the runs are recorded in it, by gradsampfixed (see Stats)
+
     See for example bfgs1run for the meaning of the other params.
 
     See Also
@@ -47,15 +69,17 @@ def gradsamp(func, x0, grad=None, maxit=10, cpumax=np.inf, verbose=1,
 
     """
 
-    def _fg(x):
-        return func(x) if grad is None else (func(x), grad(x))
-
     def _log(msg, level=0):
         if verbose > level:
             print msg
 
+    oracle = make_oracle(func, grad)
+
     _, nstart = x0.shape
-    cpufinish = time.time() + cpumax
+    checkpoint = NullCheckpoint() if checkpoint is None else checkpoint
+    state = checkpoint.load()
+    check_x0(state, x0, 'gradsamp')
+    cpufinish = checkpoint.cpufinish(cpumax)
 
     f = []
     g = []
@@ -64,42 +88,60 @@ def gradsamp(func, x0, grad=None, maxit=10, cpumax=np.inf, verbose=1,
     X = []
     G = []
     w = []
-    for run in xrange(nstart):
-        if verbose > 0 & nstart > 1:
-            _log('gradsamp: starting point %d ' % run)
-        f0, g0 = _fg(x0[..., run])
-        if np.isnan(f0) or f0 == np.inf or maxit == 0:
-            if np.isnan(f0) and verbose > 0:
-                _log('gradsamp: function is NaN at initial point')
-
-            elif f0 == np.inf and verbose > 0:
-                _log('gradsamp: function is infinite at initial point')
-
-            # useful if just want to evaluate func
-            elif maxit == 0 and verbose > 0:
-                _log('gradsamp: max iteration limit is 0, returning '
-                     'initial point')
-            f.append(f0)
-            x.append(x0[..., run])
-            g.append(g0)
-            dnorm.append(linalg.norm(g0, 2))
-            X.append(x[..., run])
-            G.append(g0)
-            w.append(1)
-        else:
-            cpumax = cpufinish - time.time()  # time left
-            xtmp, ftmp, gtmp, dnormtmp, Xtmp, Gtmp, wtmp = \
-                gradsamp1run(func, x0[..., run], grad=grad, f0=f0, g0=g0,
-                             **kwargs)
-            x.append(xtmp)
-            f.append(ftmp)
-            g.append(gtmp)
-            dnorm.append(dnormtmp)
-            X.append(Xtmp)
-            G.append(Gtmp)
-            w.append(wtmp)
-        if time.time() > cpufinish:
-            break
+    start = 0
+    if state is not None:  # resume with the next run
+        start = state['run'] + 1
+        x, f, g, dnorm, X, G, w = [state[key] for key in (
+                'x', 'f', 'g', 'dnorm', 'X', 'G', 'w')]
+    # the pool of workers for the gradient bundles is shared by all the
+    # runs and sampling radii
+    pool = bundle_pool(executor, n_jobs) if isinstance(
+        executor, basestring) else executor
+    try:
+        for run in xrange(start, nstart):
+            if verbose > 0 & nstart > 1:
+                _log('gradsamp: starting point %d ' % run)
+            f0, g0 = oracle(x0[..., run])
+            if np.isnan(f0) or f0 == np.inf or maxit == 0:
+                if np.isnan(f0) and verbose > 0:
+                    _log('gradsamp: function is NaN at initial point')
+
+                elif f0 == np.inf and verbose > 0:
+                    _log('gradsamp: function is infinite at initial point')
+
+                # useful if just want to evaluate func
+                elif maxit == 0 and verbose > 0:
+                    _log('gradsamp: max iteration limit is 0, returning '
+                         'initial point')
+                f.append(f0)
+                x.append(x0[..., run])
+                g.append(g0)
+                dnorm.append(linalg.norm(g0, 2))
+                X.append(x0[..., run])
+                G.append(g0)
+                w.append(1)
+            else:
+                cpumax = cpufinish - time.time()  # time left
+                xtmp, ftmp, gtmp, dnormtmp, Xtmp, Gtmp, wtmp = \
+                    gradsamp1run(oracle, x0[..., run], f0=f0, g0=g0,
+                                 verbose=verbose, executor=pool,
+                                 checkpoint=checkpoint.child('run%i' % run),
+                                 stats=stats, **kwargs)
+                x.append(xtmp)
+                f.append(ftmp)
+                g.append(gtmp)
+                dnorm.append(dnormtmp)
+                X.append(Xtmp)
+                G.append(Gtmp)
+                w.append(wtmp)
+            checkpoint.save(x0=x0, run=run, x=x, f=f, g=g, dnorm=dnorm, X=X,
+                            G=G, w=w)
+            if time.time() > cpufinish:
+                break
+    finally:
+        if pool is not executor:
+            pool.close()
+            pool.join()
 
     return x, f, np.array(g).T, dnorm, np.array(X)[0], np.array(G)[0], w
 
@@ -6,10 +6,13 @@
 import time
 import numpy as np
 from gradsampfixed import gradsampfixed
+from oracle import make_oracle
+from checkpoint import NullCheckpoint, check_x0
 
 
 def gradsamp1run(func, x0, grad=None, f0=None, g0=None,
-                 samprad=[1e-4, 1e-5, 1e-6], cpumax=np.inf, **kwargs):
+                 samprad=[1e-4, 1e-5, 1e-6], cpumax=np.inf, checkpoint=None,
+                 **kwargs):
     """
     Repeatedly run gradient sampling minimization, for various sampling radii
     return info only from final sampling radius; intended to be called by
@@ -17,8 +20,8 @@ def gradsamp1run(func, x0, grad=None, f0=None, g0=None,
 
     Parameters
     ----------
-    func : callable func(x)
-        function to minimise.
+    func : callable func(x), or Oracle
+        function to minimise (see Oracle).
 
     x0: 1D array of len nvar, optional (default None)
         intial point
@@ -37,6 +40,11 @@ def gradsamp1run(func, x0, grad=None, f0=None, g0=None,
     samprad: 1D array of floats, optional (default [1e-4, 1e-5, 1e-6])
         radius around x0, for sampling gradients
 
+    checkpoint: Checkpoint, optional (default None)
+        if provided, the point reached with each sampling radius is saved,
+        and each radius is checkpointed by gradsampfixed (see
+        checkpoint.py)
+
     See for example bfgs1run for the meaning of the other params.
 
     See Also
@@ -45,13 +53,23 @@ def gradsamp1run(func, x0, grad=None, f0=None, g0=None,
 
     """
 
-    cpufinish = time.time() + cpumax
-
-    for choice in  xrange(len(samprad)):
+    oracle = make_oracle(func, grad)
+    checkpoint = NullCheckpoint() if checkpoint is None else checkpoint
+    state = checkpoint.load()
+    xstart = np.array(x0)
+    check_x0(state, xstart, 'gradsamp1run')
+    cpufinish = checkpoint.cpufinish(cpumax)
+
+    start = 0
+    if state is not None:  # resume with the next sampling radius
+        start = state['choice'] + 1
+        x0, f0, g0 = state['x'], state['f'], state['g']
+    for choice in  xrange(start, len(samprad)):
         cpumax = cpufinish - time.time()  # time left
         x, f, g, dnorm, X, G, w, quitall = gradsampfixed(
-            func, x0, grad=grad, f0=f0, g0=g0, samprad=samprad[choice],
-            cpumax=cpumax, **kwargs)
+            oracle, x0, f0=f0, g0=g0, samprad=samprad[choice],
+            cpumax=cpumax, checkpoint=checkpoint.child('radius%i' % choice),
+            **kwargs)
 
         # it's not always the case that x = X(:,1), for example when the max
         # number of iterations is exceeded: this is mentioned in the
@@ -65,6 +83,8 @@ def gradsamp1run(func, x0, grad=None, f0=None, g0=None,
         x0 = x
         f0 = f
         g0 = g
+        if choice + 1 < len(samprad):
+            checkpoint.save(x0=xstart, choice=choice, x=x, f=f, g=g)
 
     return x, f, g, dnorm, np.array(X), np.array(G), w
 
@@ -8,12 +8,16 @@ import numpy as np
 from scipy import linalg
 from linesch_ww import linesch_ww
 from getbundle import getbundle
-from qpspecial import qpspecial
+from bundleqp import BundleQP
+from oracle import make_oracle
+from checkpoint import NullCheckpoint, check_x0
+from instrument import Stats, oracle_counters
 
 
 def gradsampfixed(func, x0, grad=None, f0=None, g0=None, samprad=1e-4,
                   maxit=10, gradnormtol=1e-6, fvalquit=-np.inf,
-                  cpumax=np.inf, verbose=2, ngrad=None, **kwargs):
+                  cpumax=np.inf, verbose=2, ngrad=None, executor=None,
+                  stats=None, checkpoint=None, **kwargs):
     """"
     Gradient sampling minimization with fixed sampling radius
     intended to be called by gradsamp1run only
@@ -21,8 +25,8 @@ def gradsampfixed(func, x0, grad=None, f0=None, g0=None, samprad=1e-4,
 
     Parameters
     ----------
-    func : callable func(x)
-        function to minimise.
+    func : callable func(x), or Oracle
+        function to minimise (see Oracle).
 
     x0: 1D array of len nvar, optional (default None)
         intial point
@@ -41,6 +45,19 @@ def gradsampfixed(func, x0, grad=None, f0=None, g0=None, samprad=1e-4,
     samprad: float, optional (default 1e-4)
         radius around x0, for sampling gradients
 
+    executor: string or pool, optional (default None)
+        executor for the evaluation of the gradient bundles (see
+        getbundle)
+
+    stats: Stats, optional (default None)
+        if provided, statistics are recorded in it (see Stats)
+
+    checkpoint: Checkpoint, optional (default None)
+        if provided, the state of the run (including that of the random
+        number generator which samples the bundles) is saved every
+        checkpoint.every iterations, and the run resumes from the last
+        saved state, if any (see checkpoint.py)
+
     See for example bfgs1run for the meaning of the other params.
 
     See Also
@@ -49,34 +66,52 @@ def gradsampfixed(func, x0, grad=None, f0=None, g0=None, samprad=1e-4,
 
     """
 
-    def _fg(x):
-        return func(x) if grad is None else func(x), grad(x)
-
     def _log(msg, level=0):
         if verbose > level:
             print msg
 
+    oracle = make_oracle(func, grad)
+    stats = Stats() if stats is None else stats
+    ostart = oracle_counters(oracle)
+
     _log('gradsamp: sampling radius = %7.1e' % samprad)
 
+    checkpoint = NullCheckpoint() if checkpoint is None else checkpoint
+    state = checkpoint.load()
+    x0 = np.array(x0)
+    check_x0(state, x0, 'gradsampfixed')
     x = np.array(x0)
-    f0 = _fg(x0)[0] if f0 is None else f0
-    g0 = _fg(x0)[1] if g0 is None else g0
+    if f0 is None or g0 is None:
+        f, g = oracle(x0)
+        f0 = f if f0 is None else f0
+        g0 = g if g0 is None else g0
     f = f0
     g = g0
     X = x
     G = np.array([g]).T
     w = 1
     quitall = 0
-    cpufinish = time.time() + cpumax
+    cpufinish = checkpoint.cpufinish(cpumax)
     dnorm = np.inf
-    for it in xrange(maxit):
+    qp = BundleQP()  # to warm-start each QP from the previous solution
+    start = 0
+    if state is not None:
+        # resume after the last checkpointed iteration
+        x, f, g, dnorm, X, G, w, qp, it = [state[key] for key in (
+                'x', 'f', 'g', 'dnorm', 'X', 'G', 'w', 'qp', 'it')]
+        start = it + 1
+        oracle.restore_cache(state['oracle'])
+        _log('  resuming after iter %d, f = %g' % (it, f))
+    for it in xrange(start, maxit):
         # evaluate gradients at randomly generated points near x
         # first column of Xnew and Gnew are respectively x and g
-        Xnew, Gnew = getbundle(func, x, grad=grad, g0=g,
-                               samprad=samprad, n=ngrad)
+        Xnew, Gnew = getbundle(oracle, x, g0=g, samprad=samprad, n=ngrad,
+                               executor=executor, stats=stats)
 
-        # solve QP subproblem
-        wnew, dnew, _, _ = qpspecial(Gnew, verbose=verbose)
+        # solve QP subproblem: the bundle is resampled around the new x,
+        # so only the previous weights can be reused
+        qp.fit(Gnew)
+        wnew, dnew, _, _ = qp.solve(Gnew, verbose=verbose, stats=stats)
         dnew = -dnew  # this is a descent direction
         gtdnew = np.dot(g.T, dnew)   # gradient value at current point
         dnormnew = linalg.norm(dnew, 2)
@@ -89,11 +124,13 @@ def gradsampfixed(func, x0, grad=None, f0=None, g0=None, samprad=1e-4,
             # since dnormnew is first to satisfy tolerance, it must equal dnorm
             _log('  tolerance met at iter %d, f = %g, dnorm = %5.1e' % (
                     it, f, dnorm))
+            stats.record_oracle(oracle, ostart)
             return x, f, g, dnorm, X, G, w, quitall
         elif gtdnew >= 0 or np.isnan(gtdnew):
             # dnorm, not dnormnew, which may be bigger
             _log('  not descent direction, quit at iter %d, f = %g, '
                  'dnorm = %5.1e' % (it, f, dnorm))
+            stats.record_oracle(oracle, ostart)
             return x, f, g, dnorm, X, G, w, quitall
 
         # note that dnew is NOT normalized, but we set second Wolfe
@@ -103,14 +140,15 @@ def gradsampfixed(func, x0, grad=None, f0=None, g0=None, samprad=1e-4,
         wolfe1 = 0
         wolfe2 = 0
         alpha, x, f, g, fail, _, _, _ = linesch_ww(
-            func, x, dnew, grad=grad, func0=f, grad0=g, wolfe1=wolfe1,
-            wolfe2=wolfe2, fvalquit=fvalquit, verbose=verbose)
+            oracle, x, dnew, func0=f, grad0=g, wolfe1=wolfe1,
+            wolfe2=wolfe2, fvalquit=fvalquit, verbose=verbose, stats=stats)
         _log('  iter %d: step = %5.1e, f = %g, dnorm = %5.1e' % (
                 it, alpha, f, dnormnew), level=1)
 
         if f < fvalquit:
             _log('  reached target objective, quit at iter %d ' % iter)
             quitall = 1
+            stats.record_oracle(oracle, ostart)
             return x, f, g, dnorm, X, G, w, quitall
 
         # if fail == 1 # Wolfe conditions not both satisfied, DO NOT quit,
@@ -120,14 +158,21 @@ def gradsampfixed(func, x0, grad=None, f0=None, g0=None, samprad=1e-4,
             _log('  f may be unbounded below, quit at iter %d, f = %g' % (
                     it, f))
             quitall = 1
+            stats.record_oracle(oracle, ostart)
             return x, f, g, dnorm, X, G, w, quitall
 
         if time.time() > cpufinish:
             _log('  cpu time limit exceeded, quit at iter #d' % it)
             quitall = 1
+            stats.record_oracle(oracle, ostart)
             return x, f, g, dnorm, X, G, w, quitall
 
+        if checkpoint.due(it):
+            checkpoint.save(x0=x0, x=x, f=f, g=g, dnorm=dnorm, X=X, G=G, w=w,
+                            qp=qp, it=it, oracle=oracle.cache_state())
+
     _log('  %d iters reached, f = %g, dnorm = %5.1e' % (maxit, f, dnorm))
+    stats.record_oracle(oracle, ostart)
     return x, f, g, dnorm, np.array(X), np.array(G), w, quitall
 
 
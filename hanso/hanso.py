@@ -10,11 +10,15 @@ from setx0 import setx0
 from bfgs import bfgs
 from gradsamp import gradsamp
 from postprocess import postprocess
+from oracle import make_oracle
+from instrument import Stats
+from checkpoint import NullCheckpoint, check_x0
 
 
 def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
           funcrtol=1e-20, gradnormtol=1e-6, verbose=2, fvalquit=-np.inf,
-          cpumax=np.inf, maxit=100, **kwargs):
+          cpumax=np.inf, maxit=100, executor=None, stats=None,
+          checkpoint=None, **kwargs):
     """
     HANSO: Hybrid Algorithm for Nonsmooth Optimization
 
@@ -42,10 +46,14 @@ def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
 
     Parameters
     ----------
-    func: callable function on 1D arrays of length nvar
-        function being optimized
-
-    grad: callable function
+    func: callable function on 1D arrays of length nvar, or Oracle
+        function being optimized. If grad is None, func(x) must return
+        the function value and the gradient at x, as a tuple (f, g). An
+        Oracle may be passed to count the evaluations made by hanso, or
+        to evaluate the gradient bundles of the gradient sampling phase
+        in batches (vectorized Oracle)
+
+    grad: callable function, optional (default None)
         gradient of func
 
     fvalquit: float, optional (default -inf)
@@ -65,6 +73,25 @@ def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
         if set, the gradient-sampling will be used to continue the algorithm
         in case the BFGS fails
 
+    executor: string or pool, optional (default None)
+        executor for the gradient bundles of the gradient sampling phase:
+        "thread" or "process", with as many workers as n_jobs (see
+        getbundle); also used for the trial steps of the BFGS line
+        searches if speculate is set (see bfgs)
+
+    stats: Stats, optional (default None)
+        if provided, the statistics of both phases are recorded in it:
+        number of evaluations, line searches, QPs, etc., time spent in
+        each phase ('bfgs', 'gradsamp') and their sub-phases, and the
+        per-run statistics of bfgs (see Stats)
+
+    checkpoint: Checkpoint, optional (default None)
+        if provided, both phases are checkpointed (see bfgs and gradsamp),
+        e.g hanso(..., checkpoint=Checkpoint("/scratch/run1", every=10)):
+        if the call is interrupted, calling hanso again with the same
+        arguments resumes it, and returns the same results as an
+        uninterrupted call (see checkpoint.py)
+
     **kwargs: param-value dict
         optional parameters passed to bfgs backend. Possible key/values are:
         x0: 2D array of shape (nvar, nstart), optional (default None)
@@ -84,6 +111,34 @@ def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
         wolfe2: float, optional (default .5)
             param passed to bfgs1run function
 
+        n_jobs: int, optional (default 1)
+            number of worker processes among which bfgs spreads the
+            starting points; see bfgs for details
+
+        lockstep: boolean, optional (default False)
+            if set, bfgs advances all its runs together, with batched
+            evaluations (see bfgs)
+
+        halving: int, optional (default None)
+            if set, bfgs races its runs by successive halving, in rounds
+            of that many iterations (see bfgs)
+
+        interpolate: boolean, optional (default False)
+            if set, the BFGS line searches use safeguarded interpolation
+            rather than bisection (see bfgs)
+
+        speculate: int, optional (default 1)
+            number of trial steps the BFGS line searches evaluate
+            together (see bfgs)
+
+        dedup: int, optional (default None)
+            if set, bfgs merges runs which enter the basin of a better
+            one, checked every that many iterations (see bfgs)
+
+        warm_start: WarmStart, optional (default None)
+            state of the BFGS phase of a related problem to start from,
+            updated with that of this one; see bfgs and hanso_path
+
     Returns
     -------
     x: D array of same length nvar = len(x0)
@@ -147,6 +202,13 @@ def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
         if verbose > level:
             print msg
 
+    # the BFGS and gradient sampling phases share the same oracle, so that
+    # the point handed over from one to the other is not evaluated again
+    oracle = make_oracle(func, grad)
+    stats = Stats() if stats is None else stats
+    checkpoint = NullCheckpoint() if checkpoint is None else checkpoint
+    state = checkpoint.load()
+
     # sanitize x0
     if x0 is None:
         assert not nvar is None, (
@@ -154,7 +216,9 @@ def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
         assert not nstart is None, (
             "No value specified for x0, expecting a value for nstart")
 
-        x0 = setx0(nvar, nstart)
+        # the random starting points of a resumed call are those of the
+        # interrupted one
+        x0 = setx0(nvar, nstart) if state is None else state['x0']
     else:
         assert nvar is None, (
             "Value specified for x0, expecting no value for nvar")
@@ -168,14 +232,29 @@ def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
 
         nvar, nstart = x0.shape
 
-    cpufinish = time.time() + cpumax
+    check_x0(state, x0, 'hanso')
+    cpufinish = checkpoint.cpufinish(cpumax)
 
     # run BFGS step
     kwargs['output_records'] = 1
-    x, f, d, H, _, info, X, G, w, pobj = bfgs(
-        func, x0=x0, grad=grad, fvalquit=fvalquit, funcrtol=funcrtol,
-        gradnormtol=gradnormtol, cpumax=cpumax, maxit=maxit,
-        verbose=verbose, **kwargs)
+    if state is not None and 'bfgs' in state:
+        # completed before the checkpoint
+        results = state['bfgs']
+        stats.merge(state['stats'])
+    else:
+        if state is None:
+            checkpoint.save(x0=x0)
+        bfgs_stats = Stats()
+        with bfgs_stats.timer('bfgs'):
+            results = bfgs(
+                oracle, x0=x0, fvalquit=fvalquit, funcrtol=funcrtol,
+                gradnormtol=gradnormtol, cpumax=cpufinish - time.time(),
+                maxit=maxit, verbose=verbose, stats=bfgs_stats,
+                executor=executor, checkpoint=checkpoint.child('bfgs'),
+                **kwargs)
+        checkpoint.save(x0=x0, bfgs=results, stats=bfgs_stats)
+        stats.merge(bfgs_stats)
+    x, f, d, H, _, info, X, G, w, pobj = results
 
     # throw away all but the best result
     assert len(f) == np.array(x).shape[1], np.array(x).shape
@@ -243,8 +322,11 @@ def hanso(func, x0=None, grad=None, nvar=None, nstart=None, sampgrad=False,
         cpumax = cpufinish - time.time()  # time left
 
         # run gradsamp proper
-        x, f, g, dnorm, X, G, w = gradsamp(func, x0, grad=grad, maxit=maxit,
-                                           cpumax=cpumax)
+        with stats.timer('gradsamp'):
+            x, f, g, dnorm, X, G, w = gradsamp(
+                oracle, x0, maxit=maxit, cpumax=cpumax, verbose=verbose,
+                executor=executor, n_jobs=kwargs.get('n_jobs', 1),
+                stats=stats, checkpoint=checkpoint.child('gradsamp'))
 
         if f == f_BFGS:  # gradient sampling did not reduce f
             _log('hanso: gradient sampling did not reduce f below best point'
@@ -0,0 +1,151 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import numpy as np
+
+from hgprod import hgprod
+from symmatrix import SymMatrix
+
+
+class HessianHistory(object):
+    """
+    Compact record of the inverse Hessian approximations of a full BFGS
+    run (the Hrec of bfgs1run), stored as deltas: the initial H0, the
+    factor by which it is scaled before the first update, and the (s, y)
+    pair of each BFGS update. This costs O(nvar) per iteration, instead of
+    the nvar x nvar floats of a dense snapshot.
+
+    The recorded matrices are accessed lazily: Hrec[k] is a HessianSnapshot,
+    with matrix-free products by H_k, or which can be materialised as a
+    dense array.
+
+    Parameters
+    ----------
+    nvar: int
+        number of variables
+
+    H0: float, 1D array of length nvar or 2D array of shape (nvar, nvar),
+    optional (default 1.)
+        initial inverse Hessian approximation (see bfgs1run)
+
+    capacity: int, optional (default 100)
+        initial number of (s, y) pairs which can be stored; the storage is
+        doubled whenever it is full
+
+    """
+
+    def __init__(self, nvar, H0=1., capacity=100):
+        self.nvar = nvar
+        self.H0 = np.array(H0, dtype=float)
+        self.scale = 1.
+        self.nupdates = 0
+        self.S = np.empty((nvar, capacity), order='F')  # one pair per column
+        self.Y = np.empty((nvar, capacity), order='F')
+        self.rho = np.empty(capacity)
+        self._nupdates = []  # number of updates undergone by each snapshot
+
+    def update(self, s, y, scale=1.):
+        """
+        Record the BFGS update by the pair (s, y); scale is the factor by
+        which H was multiplied before the update (this is only allowed
+        before the first update, as done by bfgs1run).
+
+        """
+
+        if self.nupdates == 0:
+            self.scale = scale
+        elif scale != 1.:
+            raise ValueError("H can only be scaled before the first update")
+        k = self.nupdates
+        if k == len(self.rho):
+            self._grow(2 * k)
+        self.S[:, k] = np.ravel(s)
+        self.Y[:, k] = np.ravel(y)
+        self.rho[k] = 1. / np.dot(self.S[:, k], self.Y[:, k])
+        self.nupdates = k + 1
+
+    def _grow(self, capacity):
+        k = self.nupdates
+        for name in ('S', 'Y'):
+            new = np.empty((self.nvar, capacity), order='F')
+            new[:, :k] = getattr(self, name)[:, :k]
+            setattr(self, name, new)
+        self.rho = np.resize(self.rho, capacity)
+
+    def snapshot(self):
+        """
+        Record the current H (the one obtained after the updates recorded
+        so far), as the next entry of the history.
+
+        """
+
+        self._nupdates.append(self.nupdates)
+
+    def __len__(self):
+        return len(self._nupdates)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[j] for j in xrange(*k.indices(len(self)))]
+        return HessianSnapshot(self, self._nupdates[k])
+
+    def __iter__(self):
+        for k in xrange(len(self)):
+            yield self[k]
+
+    @property
+    def nbytes(self):
+        return (self.H0.nbytes + self.S.nbytes + self.Y.nbytes +
+                self.rho.nbytes)
+
+
+class HessianSnapshot(object):
+    """
+    Inverse Hessian approximation H_k obtained after the first k updates
+    of a HessianHistory, evaluated lazily.
+
+    """
+
+    def __init__(self, history, k):
+        self.history = history
+        self.k = k
+        self.shape = (history.nvar, history.nvar)
+
+    def _h0(self):
+        history = self.history
+        return history.H0 if self.k == 0 else history.scale * history.H0
+
+    def dot(self, v):
+        """
+        Product H_k * v, by the two-loop recursion over the first k pairs:
+        O(k * nvar) operations, no nvar x nvar matrix formed (unless H0
+        is one).
+
+        """
+
+        history = self.history
+        return hgprod(self._h0(), np.ravel(v), history.S[:, :self.k],
+                      history.Y[:, :self.k], rho=history.rho)
+
+    def toarray(self):
+        """
+        H_k as a dense (nvar, nvar) array, obtained by replaying the first
+        k BFGS updates in place, as done by bfgs1run: O(k * nvar^2).
+
+        """
+
+        history = self.history
+        H = SymMatrix(history.nvar, self._h0())
+        for j in xrange(self.k):
+            s = history.S[:, j]
+            y = history.Y[:, j]
+            rho = history.rho[j]
+            Hy = H.dot(y)
+            sstfactor = max(rho * rho * np.dot(y, Hy) + rho, 0)
+            H.syr2(1., s, .5 * sstfactor * s - rho * Hy)
+        return H.toarray(copy=False)
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.toarray(), dtype=dtype)
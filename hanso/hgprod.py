@@ -6,43 +6,83 @@
 import numpy as np
 
 
-def hgprod(H0, g, S, Y):
+def hgprod(H0, g, S, Y, order=None, rho=None):
     """
-    Computes the product required by the LM-BFGS method
-    See Nocedal and Wright
+    Computes the product required by the LM-BFGS method (two-loop
+    recursion). See Nocedal and Wright, Algorithm 7.4
+
+    Parameters
+    ----------
+    H0: float, 1D array of length nvar, or 2D array of shape (nvar, nvar)
+        initial inverse Hessian approximation: a scalar multiple of the
+        identity, a diagonal, or a full matrix
+
+    g: 1D array of length nvar
+        vector to be multiplied by the inverse Hessian approximation
+
+    S: 2D array of shape (nvar, m)
+        steps s = x_{k+1} - x_k, one per column
+
+    Y: 2D array of shape (nvar, m)
+        gradient differences y = g_{k+1} - g_k, one per column
+
+    order: 1D array of ints, optional (default range(m))
+        columns of S and Y to use, from oldest to newest pair; this allows
+        S and Y to be the data of ring buffers (see RingBuffer), without
+        moving their columns around
+
+    rho: 1D array of length m, optional (default None)
+        precomputed values of 1 / (s'y), indexed like the columns of S and
+        Y; computed on the fly if not provided
+
+    Returns
+    -------
+    r: 1D array of length nvar
+        the product H * g
 
     """
 
-    q = np.array(g)
-    r = np.dot(H0, q)
+    q = np.array(g, dtype=float)
 
     if len(S) == 0:
-        return r
+        return _h0prod(H0, q)
 
-    S = np.array(S)
-    Y = np.array(Y)
+    S = np.asarray(S)
+    Y = np.asarray(Y)
     S = S.reshape((-1, 1)) if S.ndim == 1 else S
     Y = Y.reshape((-1, 1)) if Y.ndim == 1 else Y
+    order = np.arange(S.shape[1]) if order is None else order
+
+    alpha = {}
+    if rho is None:
+        rho = dict((i, 1. / np.dot(S[..., i], Y[..., i])) for i in order)
 
-    N = S.shape[1]  # number of saved vector pairs (x, y)
-    alpha = np.ndarray(N)
-    rho = np.ndarray(N)
-    for i in xrange(N - 1, 0, -1):
-        s = S[..., i]
-        y = Y[..., i]
-        rho[i] = 1. / np.dot(s.T, y)
-        alpha[i] = rho[i] * np.dot(s.T, q)
-        q -= alpha[i] * y
-
-    for i in xrange(N):
-        s = S[..., i]
-        y = Y[..., i]
-        beta = rho[i] * np.dot(y.T, r)
-        r += (alpha[i] - beta) * s
+    for i in order[::-1]:  # newest to oldest pair
+        alpha[i] = rho[i] * np.dot(S[..., i], q)
+        q -= alpha[i] * Y[..., i]
+
+    r = _h0prod(H0, q)
+
+    for i in order:  # oldest to newest pair
+        beta = rho[i] * np.dot(Y[..., i], r)
+        r += (alpha[i] - beta) * S[..., i]
 
     return r
 
 
+def _h0prod(H0, q):
+    """
+    Product of the initial inverse Hessian approximation H0 (scalar,
+    diagonal, or full matrix) by the vector q.
+
+    """
+
+    if np.ndim(H0) < 2:
+        return H0 * q
+    else:
+        return np.dot(H0, q)
+
+
 if __name__ == '__main__':
     H0 = np.eye(2)
     g = np.array([1, -1])
@@ -0,0 +1,209 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+Instrumentation of the solvers (see Stats). The solvers keep returning the
+same tuples as before, which callers unpack by position: their statistics
+come back through the Stats passed as their `stats` parameter, which they
+fill in place.
+
+"""
+
+import sys
+import time
+import ctypes
+import ctypes.util
+
+# CLOCK_MONOTONIC of clock_gettime, per platform
+_CLOCK_MONOTONIC = dict(linux=1, darwin=6, freebsd=4)
+
+
+def _monotonic():
+    """
+    Monotonic clock, in seconds: time.perf_counter (python 3), or else
+    clock_gettime(CLOCK_MONOTONIC) of the C library, through ctypes. On
+    platforms which have neither (e.g python 2 on Windows), the wall clock
+    time.time, which is not monotonic (the timers then jump if the system
+    clock is set).
+
+    """
+
+    if hasattr(time, 'perf_counter'):
+        return time.perf_counter
+    clock_id = _CLOCK_MONOTONIC.get(sys.platform.rstrip('0123456789'))
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    for name in ('c', 'rt'):  # clock_gettime is in librt before glibc 2.17
+        try:
+            clock_gettime = ctypes.CDLL(ctypes.util.find_library(name),
+                                        use_errno=True).clock_gettime
+        except (OSError, AttributeError, TypeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        if clock_id is None or clock_gettime(clock_id,
+                                             ctypes.byref(timespec())):
+            break
+
+        def clock():
+            ts = timespec()  # (one per call, for the threads)
+            clock_gettime(clock_id, ctypes.byref(ts))
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+
+        return clock
+    return time.time
+
+clock = _monotonic()
+
+# keys which are maxima, not totals, when Stats are merged
+MAX_KEYS = ('peakmem', 'max_bundle_size')
+
+
+class Stats(dict):
+    """
+    Instrumentation of the solvers: a dict of counters and per-phase
+    timers, filled in place by the solvers it is passed to (via their
+    `stats` parameter). Recording costs a few dict operations per phase,
+    so the solvers always record (into a throwaway Stats if none is
+    given).
+
+    Keys (present once recorded)
+    ----------------------------
+    time: dict
+        seconds spent in each phase: 'oracle' (function and gradient
+        evaluations), 'linesearch', 'bundle' (getbundle), 'qp' (qpspecial),
+        'update' (BFGS update), and for hanso, 'bfgs' and 'gradsamp'. The
+        phases are nested: e.g the line search time includes the oracle
+        calls it makes
+
+    nfeval, ngeval: int
+        number of function and gradient evaluations
+
+    nbundle: int
+        number of gradient bundles sampled by getbundle
+
+    nlinesearch, nbisect, nexpand: int
+        number of line searches, and of bisections and expansions made by
+        them
+
+    nspeculative: int
+        number of trial steps evaluated ahead of time by the line searches,
+        but not needed (see linesch_ww)
+
+    nqp, qpiter: int
+        number of QPs solved by qpspecial, and total number of iterations
+        of its solvers
+
+    bundle_sizes: list of ints
+        size of the bundle of gradients of each QP
+
+    max_bundle_size: int
+        maximum thereof
+
+    nupdate: int
+        number of BFGS updates
+
+    peakmem: int
+        peak number of bytes held by the quasi-Newton state and the saved
+        gradients (bfgs1run)
+
+    merged: list of (run, into) pairs
+        runs merged into another run by bfgs (see its dedup parameter)
+
+    runs: list of Stats
+        per-run statistics (bfgs), which are also totaled in this Stats
+
+    """
+
+    def add(self, key, n=1):
+        """
+        Increment counter key by n.
+
+        """
+
+        self[key] = self.get(key, 0) + n
+
+    def maximum(self, key, value):
+        """
+        Set key to value, if larger.
+
+        """
+
+        self[key] = max(self.get(key, value), value)
+
+    def append(self, key, value):
+        """
+        Append value to list key.
+
+        """
+
+        self.setdefault(key, []).append(value)
+
+    def add_time(self, phase, seconds):
+        """
+        Add seconds to the timer of a phase.
+
+        """
+
+        timers = self.setdefault('time', {})
+        timers[phase] = timers.get(phase, 0.) + seconds
+
+    def timer(self, phase):
+        """
+        Context manager which times its block into the timer of phase.
+
+        """
+
+        return _Timer(self, phase)
+
+    def record_oracle(self, oracle, start):
+        """
+        Record the evaluations made by oracle since its counters were
+        `start` (as returned by `oracle_counters`).
+
+        """
+
+        nfeval, ngeval, seconds = oracle_counters(oracle)
+        self.add('nfeval', nfeval - start[0])
+        self.add('ngeval', ngeval - start[1])
+        self.add_time('oracle', seconds - start[2])
+
+    def merge(self, other):
+        """
+        Total the statistics of other (e.g of a run) into this Stats.
+
+        """
+
+        for key, value in other.items():
+            if key in MAX_KEYS:
+                self.maximum(key, value)
+            elif key == 'time':
+                for phase, seconds in value.items():
+                    self.add_time(phase, seconds)
+            elif isinstance(value, list):
+                self.setdefault(key, []).extend(value)
+            else:
+                self.add(key, value)
+
+
+def oracle_counters(oracle):
+    """
+    Evaluation counters of an oracle: (nfeval, ngeval, seconds).
+
+    """
+
+    return oracle.nfeval, oracle.ngeval, oracle.time
+
+
+class _Timer(object):
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add_time(self.phase, clock() - self.start)
+        return False
@@ -0,0 +1,256 @@
+"""
+:Synopsis: Line search enforcing strong Wolfe conditions (linesch_sw.m of
+the NLCG distribution, after Nocedal and Wright's Algorithms 3.5 and 3.6)
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import numpy as np
+from scipy import linalg
+from oracle import make_oracle
+from linesch_ww import interpolate_step
+from instrument import Stats, clock
+
+
+def linesch_sw(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
+               wolfe2=.5, fvalquit=-np.inf, verbose=1, stats=None):
+    """
+    LINESCH_SW Line search enforcing strong Wolfe conditions
+
+    Strong Wolfe requires sufficient decrease in the objective,
+    f(x0 + t d) < f0 + wolfe1 * t * grad0'*d, and a reduction in the
+    absolute value of the directional derivative,
+    |(grad f)(x0 + t d)'*d| <= wolfe2 * |grad0'*d|. Unlike weak Wolfe (see
+    linesch_ww), this bounds the directional derivative from above as
+    well as from below, so that the step lands near a local minimizer
+    along d: this is required by nonlinear conjugate gradient methods,
+    and simulates an exact line search when wolfe2 is small. It is not
+    recommended for BFGS on nonsmooth functions, where the directional
+    derivative jumps at the minimizer along d and the conditions may
+    have no solution: the search then returns a bracket.
+
+    The search first expands the step (t = 1, 2, 4, ...) until it brackets
+    a point satisfying the conditions, and then shrinks the bracket with
+    safeguarded cubic interpolation (see interpolate_step), bisecting
+    whenever the last step did not halve the bracket.
+
+    Parameters
+    ----------
+    func : callable func(x), or Oracle
+        function to minimise (see Oracle). If it is an oracle which can
+        restrict itself to the line x0 + t * d (e.g a lazy Oracle or a
+        CompositeOracle, see linesch_ww), the trial steps ask it for the
+        function value, and then for the directional derivative only if
+        the sufficient decrease condition holds
+
+    x0: 1D array of length nvar
+        intial point
+
+    d: 1D array of length nvar
+       search direction
+
+    grad : callable grad(x), optional (default None)
+        the gradient of `func` (see Oracle)
+
+    func0, grad0: float and 1D array of length nvar, optional
+        function value and gradient at x0, if known
+
+    wolfe1: float, optional (default 0)
+       Wolfe parameter for the sufficient decrease condition
+
+    wolfe2: float, optional (default .5)
+        Wolfe parameter for the STRONG condition on directional
+        derivative, where 0 <= wolfe1 <= wolfe2 <= 1; wolfe2 = 0 asks for
+        an exact line search, which is only met to within the bracket
+
+    fvalquit: float, optional (default -inf)
+        quit immediately if f drops below this value, regardless
+        of the Wolfe conditions
+
+    verbose: int, optional (default 1)
+        for no printing, 1 minimal (default), 2 verbose
+
+    stats: Stats, optional (default None)
+        if provided, the line search time, and the numbers of line
+        searches, of steps made inside the bracket (counted as
+        bisections) and of expansions are recorded in it (see Stats)
+
+    Returns
+    -------
+    alpha: float
+        steplength satisfying strong Wolfe conditions if one was found,
+        otherwise the end point of the bracket with the lowest f (possibly
+        0)
+
+    xalpha: 1D array of length nvar
+        x0 + alpha*d
+
+    falpha: float
+        f at the point x0 + alpha * d
+
+    gradalpha: 1D array of length nvar
+        grad f at the point x0 + alpha * d
+
+    fail: int
+        0 if both Wolfe conditions satisfied, or falpha < fvalquit
+        1 if one or both Wolfe conditions not satisfied but an
+            interval was found bracketing a point where both satisfied
+        -1 if no such interval was found, function may be unbounded
+            below
+
+    beta: float
+        same as alpha if it satisfies strong Wolfe conditions,
+        otherwise the other end point of the bracket (which may be smaller
+        than alpha; inf if no bracket was found)
+
+    gradbeta: 1D array of length nvar
+        grad f at the point x0 + beta d (vector of nans if beta is inf)
+
+    fevalrec: list
+        record of function evaluations
+
+    Raises
+    ------
+    RuntimeError
+
+    """
+
+    def _log(msg, level=0):
+        if verbose > level:
+            print msg
+
+    def _evaluate(t):
+        # function value, directional derivative (unless along a line,
+        # where it is only asked for if the step makes sufficient decrease)
+        # and (unless along a line) gradient at x0 + t * d
+        if line is None:
+            f, g = oracle(x0 + t * d)
+            gtd = np.dot(g.T, d)
+        else:
+            f = line.value(t)
+            gtd = line.slope(t) if _decrease(t, f) else np.nan
+            g = None  # see _gradient
+        fevalrec.append(f)
+        return f, gtd, g
+
+    def _gradient(t, g):
+        if line is None or t == np.inf:
+            return g
+        return grad0 if t == 0 else line.gradient(t)
+
+    def _done(fail):
+        stats.add('nlinesearch')
+        stats.add('nbisect', nbisect)
+        stats.add('nexpand', nexpand)
+        stats.add_time('linesearch', clock() - start)
+        galpha = _gradient(alpha, lo[3])
+        gbeta = _gradient(beta, hi[3])
+        return (alpha, x0 + alpha * d, lo[1], galpha, fail, beta, gbeta,
+                fevalrec)
+
+    start = clock()
+    stats = Stats() if stats is None else stats
+    oracle = make_oracle(func, grad)
+
+    x0 = np.array(x0, dtype=float)
+    d = np.array(d, dtype=float)
+    if func0 is None or grad0 is None:
+        f, g = oracle(x0)
+        func0 = f if func0 is None else func0
+        grad0 = g if grad0 is None else grad0
+
+    if wolfe1 < 0 or wolfe1 > wolfe2 or wolfe2 > 1:
+        _log('linesch_sw: Wolfe parameters do not satisfy'
+             ' 0 <= wolfe1 <= wolfe2 <= 1')
+
+    g0 = np.dot(grad0.T, d)
+    if g0 >= 0:
+        _log('linesch_sw: WARNING, not a descent direction')
+    dnorm = linalg.norm(d, 2)
+    if dnorm == 0:
+        raise RuntimeError('linesch_sw: d is zero')
+    line = oracle.along(x0, d) if hasattr(oracle, 'along') else None
+
+    # the same arbitrary limits as linesch_ww
+    nbisectmax = max(30, np.round(np.log2(1e5 * dnorm)))
+    nexpandmax = max(10, np.round(np.log2(1e5 / dnorm)))
+    nbisect = 0
+    nexpand = 0
+    fevalrec = []
+
+    # the ends of the bracket, as (t, f, directional derivative, gradient):
+    # lo has the lowest f among the steps with sufficient decrease, and
+    # the derivative at lo points towards hi
+    lo = (0, func0, g0, grad0)
+    hi = (np.inf, np.nan, np.nan, np.nan * np.ones(x0.shape))
+    alpha, beta = 0, np.inf
+
+    def _decrease(t, f):
+        # sufficient decrease condition (NOTE THE <, as in linesch_ww)
+        return f < func0 + wolfe1 * t * g0
+
+    # expansion phase
+    t = 1  # important to try steplength one first
+    while True:
+        f, gtd, g = _evaluate(t)
+        if f < fvalquit:
+            lo = (t, f, gtd, g)
+            alpha = beta = t
+            hi = lo
+            return _done(0)
+        if not _decrease(t, f) or np.isnan(f) or f >= lo[1]:
+            hi = (t, f, gtd, g)  # bracket [lo, t]
+            break
+        if np.abs(gtd) <= -wolfe2 * g0:
+            lo = hi = (t, f, gtd, g)
+            alpha = beta = t
+            return _done(0)
+        if gtd >= 0:
+            # passed a minimizer along d: bracket [t, lo], lo becoming hi
+            hi, lo = lo, (t, f, gtd, g)
+            break
+        lo = (t, f, gtd, g)
+        if nexpand >= nexpandmax:
+            alpha = lo[0]
+            if verbose > 1:
+                _log('Line search failed to bracket point satisfying strong'
+                     ' Wolfe conditions; function may be unbounded below')
+            return _done(-1)
+        nexpand += 1
+        t = 2 * t
+
+    # zoom phase: shrink the bracket, whose ends may be in either order
+    width = np.inf
+    while nbisect < nbisectmax:
+        nbisect += 1
+        t = None
+        if abs(hi[0] - lo[0]) <= .5 * width:
+            t = interpolate_step(lo[0], lo[1], lo[2], hi[0], hi[1], hi[2])
+        width = abs(hi[0] - lo[0])
+        if t is None:
+            t = (lo[0] + hi[0]) / 2.  # bisection
+        f, gtd, g = _evaluate(t)
+        if f < fvalquit:
+            lo = hi = (t, f, gtd, g)
+            alpha = beta = t
+            return _done(0)
+        if not _decrease(t, f) or np.isnan(f) or f >= lo[1]:
+            hi = (t, f, gtd, g)
+            continue
+        if np.abs(gtd) <= -wolfe2 * g0:
+            lo = hi = (t, f, gtd, g)
+            alpha = beta = t
+            return _done(0)
+        if gtd * (hi[0] - lo[0]) >= 0:
+            hi = lo
+        lo = (t, f, gtd, g)
+
+    alpha, beta = lo[0], hi[0]
+    if verbose > 1:
+        _log('Line search failed to satisfy strong Wolfe conditions'
+             ' although point satisfying conditions was bracketed')
+    return _done(1)
+
+if __name__ == '__main__':
+    from example_functions import l2, gradl2
+    print linesch_sw(l2, [1., 1.], [-1., -2.], gradl2)
@@ -6,10 +6,14 @@
 
 import numpy as np
 from scipy import linalg
+from oracle import make_oracle
+from getbundle import bundle_pool
+from instrument import Stats, clock
 
 
 def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
-               wolfe2=.5, fvalquit=-np.inf, verbose=1):
+               wolfe2=.5, fvalquit=-np.inf, verbose=1, stats=None,
+               speculate=1, executor=None, interpolate=False):
     """
     LINESCH_WW Line search enforcing weak Wolfe conditions, suitable
     for minimizing both smooth and nonsmooth functions
@@ -64,8 +68,17 @@ def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
     d: 1D array of length nvar
        search direction
 
-    func : callable func(x)
-        function to minimise.
+    func : callable func(x), or Oracle
+        function to minimise (see Oracle). If it is an oracle which can
+        restrict itself to the line x0 + t * d (whose `along` method
+        returns a line, e.g a lazy Oracle or a CompositeOracle), the trial
+        steps ask it for the function value, and then for the directional
+        derivative only if the sufficient decrease condition holds (or for
+        interpolate), and the gradients are only formed at the returned
+        steps alpha and beta. If the line can also compute the weak Wolfe
+        step itself (its `weak_wolfe` method, e.g a MaxAffineOracle, whose
+        objective is piecewise linear along lines), it is asked for it
+        instead of the search by expansion and bisection
 
     grad : callable grad(x, *args)
         the gradient of `func`.  If None, then `func` returns the function
@@ -94,6 +107,44 @@ def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
     verbose: int, optional (default 1)
         for no printing, 1 minimal (default), 2 verbose
 
+    stats: Stats, optional (default None)
+        if provided, the line search time, and the numbers of line searches,
+        bisections and expansions are recorded in it (see Stats)
+
+    speculate: int, optional (default 1)
+        number of trial steps evaluated together. If larger than 1, the
+        search evaluates, along with each trial step t, the steps it would
+        try next: t, 2t, 4t, ... while expanding, or the midpoints of the
+        successive bisections of [alpha, beta] (2^k - 1 of them, for k
+        bisections) while bisecting. It then walks through them as the
+        sequential search would, so that alpha, beta, fail and fevalrec
+        are the same as with speculate=1, at the cost of evaluations which
+        turn out to be unneeded (counted as 'nspeculative' in stats). This
+        pays off for expensive oracles, whose evaluations are made
+        concurrently (see executor). Ignored for oracles restricted to the
+        line (see func), whose trial steps form no gradient
+
+    executor: string or pool, optional (default None)
+        how the trial steps evaluated together are evaluated: None for a
+        single batch (see Oracle.batch), which pays off with a vectorized
+        oracle; "thread" (for oracles which release the GIL) or "process"
+        (for pure-Python oracles, which must then be picklable) create a
+        pool of `speculate` workers for the duration of the call (see
+        bundle_pool); an existing pool, or any object with a `map` method,
+        is used as is
+
+    interpolate: boolean, optional (default False)
+        if set, once a point satisfying the conditions is bracketed, the
+        next trial step is the minimizer of the cubic (or, failing that,
+        quadratic) interpolating f and its directional derivative at alpha
+        and beta (see interpolate_step), rather than the midpoint of
+        [alpha, beta]. The step is kept away from the ends of the bracket,
+        and a bisection is made whenever the last step did not halve the
+        bracket, so that the bracket still shrinks geometrically, as
+        required on nonsmooth functions. This saves evaluations where f is
+        smooth along d. The expansions are unchanged, and only they are
+        speculated (see speculate)
+
     Returns
     -------
     alpha: float
@@ -135,17 +186,64 @@ def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
 
     """
 
-    def _fg(x):
-        return func(x) if grad is None else (func(x), grad(x))
-
     def _log(msg, level=0):
         if verbose > level:
             print msg
 
+    def _gradients():
+        # gradients at alpha and beta, formed lazily along a line
+        if line is None:
+            return galpha, gbeta
+        return (grad0 if alpha == 0 else line.gradient(alpha),
+                gbeta if beta == np.inf else line.gradient(beta))
+
+    def _record():
+        stats.add('nlinesearch')
+        stats.add('nbisect', nbisect)
+        stats.add('nexpand', nexpand)
+        if speculate > 1:
+            stats.add('nspeculative', nspeculative - nfeval)
+        stats.add_time('linesearch', clock() - start)
+
+    def _ladder():
+        # t, and the steps the sequential search would try after it
+        if beta < np.inf and interpolate:
+            return [t]
+        if beta < np.inf:
+            depth = min(int(np.log2(speculate + 1)),
+                        int(nbisectmax) - nbisect + 1)
+            return _midpoints(alpha, beta, depth)
+        steps = [t]
+        while len(steps) < min(speculate, int(nexpandmax) - nexpand + 1):
+            steps.append(2 * steps[-1])
+        return steps
+
+    def _speculate():
+        # evaluate the ladder of steps from t together
+        steps = _ladder()
+        X = np.asfortranarray(np.array([x0 + s * d for s in steps]).T)
+        if pool is None:
+            F, G = oracle.batch(X)
+        else:
+            results = pool.map(_trial, [(oracle.copy(), X[:, j])
+                                        for j in xrange(len(steps))])
+            F = np.array([f for f, _, _ in results])
+            G = np.array([g for _, g, _ in results]).T
+            for _, _, worker_oracle in results:
+                oracle.merge(worker_oracle)
+        trials.update((s, (F[j], G[:, j])) for j, s in enumerate(steps))
+        return len(steps)
+
+    start = clock()
+    stats = Stats() if stats is None else stats
+    oracle = make_oracle(func, grad)
+
     x0 = np.array(x0)
     d = np.array(d)
-    func0 = _fg(x0)[0] if func0 is None else func0
-    grad0 = _fg(x0)[1] if grad0 is None else grad0
+    if func0 is None or grad0 is None:
+        f, g = oracle(x0)
+        func0 = f if func0 is None else func0
+        grad0 = g if grad0 is None else grad0
 
     if (wolfe1 < 0 or wolfe1 > wolfe2 or wolfe2 > 1
         ):  # allows wolfe1 = 0, wolfe2 = 0 and wolfe2 = 1
@@ -162,6 +260,11 @@ def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
     beta = np.inf
     gbeta = np.nan * np.ones(x0.shape)
     g0 = np.dot(grad0.T, d)
+    # directional derivatives at alpha and beta, f at beta, and width of
+    # the bracket when t was chosen, for interpolate
+    dalpha = g0
+    dbeta = fbeta = np.nan
+    width = np.inf
     if g0 >= 0:
         # error('linesch_ww_mod: g0 is nonnegative, indicating d not
         # a descent direction')
@@ -170,6 +273,8 @@ def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
     dnorm = linalg.norm(d, 2)
     if dnorm == 0:
         raise RuntimeError('linesch_ww_mod: d is zero')
+    line = oracle.along(x0, d) if hasattr(oracle, 'along') else None
+    speculate = 1 if line is not None else speculate
     t = 1  # important to try steplength one first
     nfeval = 0
     nbisect = 0
@@ -184,58 +289,99 @@ def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
                 1e5 / dnorm)))  # allows more if ||d|| small
     done = 0
     fevalrec = []
-    while not done:
-        x = x0 + t * d
-        nfeval = nfeval + 1
-        f, g = _fg(x)
-        fevalrec.append(f)
-        if f < fvalquit:  # nothing more to do, quit
-            fail = 0
-            alpha = t  # normally beta is inf
-            xalpha = x
-            falpha = f
-            galpha = g
-            return (alpha, xalpha, falpha, galpha, fail, beta,
-                    gbeta, fevalrec)
-
-        gtd = np.dot(g.T, d)
-
-        # the first condition must be checked first. NOTE THE >=.
-        if f >= func0 + wolfe1 * t * g0 or np.isnan(f):
-            # first condition violated, gone too far
-            beta = t
-            gbeta = g  # discard f
-        # now the second condition.  NOTE THE <=
-        elif gtd <= wolfe2 * g0 or np.isnan(
-            gtd):  # second condition violated, not gone far enough
-            alpha = t
-            xalpha = x
-            falpha = f
-            galpha = g
-        else:  # quit, both conditions are satisfied
-            fail = 0
-            alpha = t
-            xalpha = x
-            falpha = f
-            galpha = g
-            beta = t
-            gbeta = g
-            return (alpha, xalpha, falpha, galpha, fail, beta,
-                    gbeta, fevalrec)
-
-        # setup next function evaluation
-        if beta < np.inf:
-            if nbisect < nbisectmax:
-                nbisect = nbisect + 1
-                t = (alpha + beta) / 2.  # bisection
+    trials = {}  # steps evaluated ahead of time -> (f, g), see speculate
+    nspeculative = 0
+    if hasattr(line, 'weak_wolfe'):
+        # piecewise linear along d (e.g a MaxAffineOracle): step to the
+        # breakpoint satisfying the conditions, instead of bisecting
+        alpha, falpha, beta, fail, fevalrec = line.weak_wolfe(
+            func0, g0, wolfe1=wolfe1, wolfe2=wolfe2, fvalquit=fvalquit,
+            nexpandmax=nexpandmax)
+        xalpha = x0 + alpha * d
+        galpha, gbeta = _gradients()
+        _record()
+        return alpha, xalpha, falpha, galpha, fail, beta, gbeta, fevalrec
+    pool = bundle_pool(executor, speculate) if speculate > 1 and isinstance(
+        executor, basestring) else executor
+    try:
+        while not done:
+            x = x0 + t * d
+            nfeval = nfeval + 1
+            if line is None:
+                if speculate > 1 and t not in trials:
+                    nspeculative += _speculate()
+                f, g = trials.pop(t) if speculate > 1 else oracle(x)
+                gtd = np.dot(g.T, d)
             else:
-                done = 1
-        else:
-            if nexpand < nexpandmax:
-                nexpand = nexpand + 1
-                t = 2 * alpha  # still in expansion mode
+                f = line.value(t)
+                gtd = None  # see below
+                g = None  # see _gradients
+            fevalrec.append(f)
+            if f < fvalquit:  # nothing more to do, quit
+                fail = 0
+                alpha = t  # normally beta is inf
+                xalpha = x
+                falpha = f
+                galpha = g
+                galpha, gbeta = _gradients()
+                _record()
+                return (alpha, xalpha, falpha, galpha, fail, beta,
+                        gbeta, fevalrec)
+
+            # the first condition must be checked first. NOTE THE >=.
+            toofar = f >= func0 + wolfe1 * t * g0 or np.isnan(f)
+            if gtd is None and (interpolate or not toofar):
+                gtd = line.slope(t)  # only needed past the first condition
+            if toofar:
+                # first condition violated, gone too far
+                beta = t
+                gbeta = g  # discard f
+                fbeta = f  # (but for interpolate)
+                dbeta = gtd
+            # now the second condition.  NOTE THE <=
+            elif gtd <= wolfe2 * g0 or np.isnan(
+                gtd):  # second condition violated, not gone far enough
+                alpha = t
+                xalpha = x
+                falpha = f
+                galpha = g
+                dalpha = gtd
+            else:  # quit, both conditions are satisfied
+                fail = 0
+                alpha = t
+                xalpha = x
+                falpha = f
+                galpha = g
+                beta = t
+                gbeta = g
+                galpha, gbeta = _gradients()
+                _record()
+                return (alpha, xalpha, falpha, galpha, fail, beta,
+                        gbeta, fevalrec)
+
+            # setup next function evaluation
+            if beta < np.inf:
+                if nbisect < nbisectmax:
+                    nbisect = nbisect + 1
+                    t = None
+                    if interpolate and beta - alpha <= .5 * width:
+                        t = interpolate_step(alpha, falpha, dalpha, beta,
+                                             fbeta, dbeta)
+                    width = beta - alpha
+                    if t is None:
+                        t = (alpha + beta) / 2.  # bisection
+                else:
+                    done = 1
             else:
-                done = 1
+                if nexpand < nexpandmax:
+                    nexpand = nexpand + 1
+                    t = 2 * alpha  # still in expansion mode
+                else:
+                    done = 1
+    finally:
+        if pool is not executor:
+            pool.close()
+            pool.join()
 
     # end loop
     # Wolfe conditions not satisfied: there are two cases
@@ -250,8 +396,75 @@ def linesch_ww(func, x0, d, grad=None, func0=None, grad0=None, wolfe1=0,
             _log('Line search failed to satisfy weak Wolfe conditions'
                  ' although point satisfying conditions was bracketed')
 
+    galpha, gbeta = _gradients()
+    _record()
     return alpha, xalpha, falpha, galpha, fail, beta, gbeta, fevalrec
 
+
+def interpolate_step(a, fa, da, b, fb, db, safeguard=.1):
+    """
+    Safeguarded interpolation step in the bracket [a, b] (or [b, a]): the
+    minimizer of the cubic interpolating the function values fa, fb and
+    the directional derivatives da, db at a and b, or, if the cubic has no
+    minimizer, that of the quadratic interpolating fa, da and fb, moved
+    to within safeguard * |b - a| of the ends of the bracket if need be.
+
+    Returns
+    -------
+    t: float, or None
+        the step, or None if neither interpolant has a minimizer (e.g f
+        is infinite at b), in which case the caller should bisect
+
+    """
+
+    if not np.all(np.isfinite([a, fa, da, b, fb])) or a == b:
+        return None
+    t = None
+    if np.isfinite(db):
+        # Nocedal and Wright, Numerical Optimization, equation (3.59)
+        d1 = da + db - 3 * (fa - fb) / (a - b)
+        disc = d1 * d1 - da * db
+        if disc >= 0:
+            d2 = np.sign(b - a) * np.sqrt(disc)
+            denom = db - da + 2 * d2
+            if denom != 0:
+                t = b - (b - a) * (db + d2 - d1) / denom
+    if t is None or not np.isfinite(t):
+        curv = fb - fa - da * (b - a)
+        if curv <= 0:
+            return None
+        t = a - da * (b - a) ** 2 / (2 * curv)
+    lo, hi = min(a, b), max(a, b)
+    margin = safeguard * (hi - lo)
+    return min(max(t, lo + margin), hi - margin)
+
+
+def _midpoints(alpha, beta, depth):
+    """
+    Midpoints of the successive bisections of [alpha, beta], depth deep:
+    the midpoint t of [alpha, beta] first, then those of [alpha, t] and of
+    [t, beta], computed exactly as linesch_ww computes its bisections.
+
+    """
+
+    if depth == 0:
+        return []
+    t = (alpha + beta) / 2.
+    return [t] + _midpoints(alpha, t, depth - 1) + _midpoints(
+        t, beta, depth - 1)
+
+
+def _trial(args):
+    """
+    Task run by the workers of linesch_ww (see its speculate parameter):
+    evaluate the oracle at a trial point.
+
+    """
+
+    oracle, x = args
+    f, g = oracle(x)
+    return f, g, oracle
+
 if __name__ == '__main__':
     from example_functions import l1, grad_l1
     print linesch_ww([1, 1], [-1, -2], l1, grad_l1)
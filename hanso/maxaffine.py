@@ -0,0 +1,422 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+Max-of-affine objectives f(x) = sum_k max_{i in group k} (A * x + b)_i,
+e.g the l1 and l-infinity norms, total variation or the hinge loss. Along
+a line, such an f is convex and piecewise linear, so that the line search
+needs no trial steps: it computes the breakpoints and steps to the right
+one (see MaxAffineLine).
+
+"""
+
+import numpy as np
+from scipy import sparse
+
+from composite import CompositeOracle, CompositeLine
+from instrument import clock
+
+
+class MaxAffineOracle(CompositeOracle):
+    """
+    Oracle of a max-of-affine objective
+
+        f(x) = sum_k max_{i in group k} (A * x + b)_i,
+
+    i.e a sum of pointwise maxima of affine pieces (see max_affine_l1,
+    max_affine_linf, max_affine_tv, max_affine_hinge and max_affine_sum).
+    The gradient is A' * w, where w selects the maximizing piece of each
+    group.
+
+    Along a line search x0 + t * d, the line searches ask for a
+    MaxAffineLine (see `along`), which forms A * d once (A * x0 is cached,
+    as for CompositeOracle), finds the breakpoints of f along the line in
+    a few vectorized passes over the pieces, and steps to the first one
+    where the weak Wolfe conditions hold, instead of bisecting (see
+    MaxAffineLine.weak_wolfe). Each iteration of a solver then costs one
+    product by A and one by A', whatever the number of trial steps
+    linesch_ww would have made.
+
+    Parameters
+    ----------
+    A: 2D array of shape (m, nvar), or sparse matrix
+        the linear parts of the m affine pieces, one per row
+
+    b: 1D array of length m, optional (default zeros)
+        their constant parts
+
+    groups: 1D array of m ints, optional (default None)
+        group of each piece: f is the sum over the groups of the maximum
+        of their pieces; by default, all the pieces form a single group
+
+    cache_size: int, optional (default 3)
+        see CompositeOracle
+
+    refresh: int, optional (default 50)
+        see CompositeOracle
+
+    """
+
+    def __init__(self, A, b=None, groups=None, cache_size=3, refresh=50):
+        super(MaxAffineOracle, self).__init__(A, None, cache_size=cache_size,
+                                              refresh=refresh)
+        m = A.shape[0]
+        self.b = np.zeros(m) if b is None else np.asarray(b, dtype=float)
+        self.groups = np.zeros(m, dtype=int) if groups is None else \
+            np.asarray(groups)
+        # pieces sorted by group, and the extent of each group in that order
+        _, self._gid = np.unique(self.groups, return_inverse=True)
+        self._order = np.argsort(self._gid, kind='mergesort')
+        self._gsorted = self._gid[self._order]
+        self._starts = np.flatnonzero(np.r_[True, np.diff(self._gsorted)])
+        self._ends = np.r_[self._starts[1:], m]
+
+    def _pick(self, v, s=None):
+        """
+        Maximizing piece of each group, given the values v of the pieces,
+        and the maxima. Ties (up to rounding) go to the piece of largest
+        slope s, i.e the one which is maximal just after the point (along
+        the direction of the slopes).
+
+        """
+
+        vs = v[self._order]
+        vmax = np.maximum.reduceat(vs, self._starts)
+        near = vs >= (vmax - 1e-12 * (1. + np.abs(vmax)))[self._gsorted]
+        pos = np.lexsort((vs if s is None else s[self._order], near,
+                          self._gsorted))[self._ends - 1]
+        return self._order[pos], vmax
+
+    def _weights(self, v, vmax, rows, s=None):
+        """
+        Weights of the pieces in the gradient: the pieces tied (up to
+        rounding) with the maximizing ones rows, in value and in slope s,
+        share the unit weight of their group equally (e.g sign(0) = 0 for
+        the l1 norm).
+
+        """
+
+        vmax = vmax[self._gid]
+        tied = v >= vmax - 1e-12 * (1. + np.abs(vmax))
+        if s is not None:
+            smax = s[rows][self._gid]
+            tied &= s >= smax - 1e-12 * (1. + np.abs(smax))
+        return tied / np.bincount(self._gid, weights=tied)[self._gid]
+
+    def _evaluate(self, x):
+        start = clock()
+        key = self._key(x)
+        z, age = self._z(x, key=key)
+        v = z + self.b
+        rows, vmax = self._pick(v)
+        fg = vmax.sum(), self._rdot(self._weights(v, vmax, rows))
+        self._remember(key, z, age)
+        self.time += clock() - start
+        return fg
+
+    def batch(self, X):
+        """
+        Function values and gradients at the columns of X (see Oracle),
+        with one product of A by X and one of A' by the selections of the
+        pieces.
+
+        """
+
+        start = clock()
+        X = np.asarray(X, dtype=float)
+        n = X.shape[1]
+        self.ncall += n
+        self.nfeval += n
+        self.ngeval += n
+        Z = self.A.dot(X)
+        F = np.empty(n)
+        W = np.empty(Z.shape)
+        for j in xrange(n):
+            v = Z[:, j] + self.b
+            rows, vmax = self._pick(v)
+            F[j] = vmax.sum()
+            W[:, j] = self._weights(v, vmax, rows)
+        self.nmatvec += n
+        self.nrmatvec += n
+        G = self.A.T.dot(W)
+        self.time += clock() - start
+        return F, np.asarray(G)
+
+    def copy(self):
+        return MaxAffineOracle(self.A, b=self.b, groups=self.groups,
+                               cache_size=self.cache_size,
+                               refresh=self.refresh)
+
+    def along(self, x0, d):
+        """
+        The restriction of the objective to the line x0 + t * d, as a
+        MaxAffineLine.
+
+        """
+
+        return MaxAffineLine(self, x0, d)
+
+
+class MaxAffineLine(CompositeLine):
+    """
+    Restriction t -> f(x0 + t * d) of a max-of-affine objective to a line
+    (see MaxAffineOracle), with the protocol of CompositeLine: `value(t)`,
+    `slope(t)` and `gradient(t)`. At a breakpoint, the slope and gradient
+    are those of the pieces which are maximal just after it (i.e the right
+    derivative), so that a step to a breakpoint has the slope of the next
+    linear piece.
+
+    Since f is convex and piecewise linear along the line, the weak Wolfe
+    step can be computed exactly (see `weak_wolfe`), which linesch_ww
+    does instead of its expansions and bisections.
+
+    """
+
+    def _at(self, t):
+        if t != self._t:
+            x = self.x0 + t * self.d
+            z = self.z0 + t * self.Ad
+            v = z + self.oracle.b
+            rows, vmax = self.oracle._pick(v, self.Ad)
+            self._t = t
+            self._point = x, z, vmax.sum(), rows, v, vmax
+        return self._point
+
+    def slope(self, t):
+        """
+        Directional derivative (from the right) at x0 + t * d.
+
+        """
+
+        start = clock()
+        gtd = self.Ad[self._at(t)[3]].sum()
+        self.oracle.time += clock() - start
+        return gtd
+
+    def gradient(self, t):
+        """
+        Gradient at x0 + t * d, of the pieces which are maximal just after
+        it, averaged over those which stay tied along the line (one product
+        by A'). The point, its function value, gradient and image by A are
+        then cached by the oracle.
+
+        """
+
+        start = clock()
+        oracle = self.oracle
+        x, z, f, rows, v, vmax = self._at(t)
+        key = oracle._key(x)
+        if key in oracle._cache:
+            g = oracle._cache[key][1]
+        else:
+            oracle.ngeval += 1
+            g = oracle._rdot(oracle._weights(v, vmax, rows, s=self.Ad))
+            oracle._remember(key, z, self.age, fg=(f, g))
+        oracle.time += clock() - start
+        return g
+
+    def breakpoints(self):
+        """
+        Breakpoints of f along the line, computed by advancing every group
+        from breakpoint to breakpoint of the upper envelope of its pieces,
+        all groups at once: this takes as many vectorized passes over the
+        pieces as the largest number of breakpoints of a group (one for l1,
+        tv or the hinge loss).
+
+        Returns
+        -------
+        t: 1D array
+            the breakpoints t > 0, in increasing order
+
+        slopes: 1D array of same length
+            slope of f just after each of them
+
+        slope0: float
+            slope of f just after 0
+
+        """
+
+        oracle = self.oracle
+        gid = oracle._gid
+        order, gsorted, ends = oracle._order, oracle._gsorted, oracle._ends
+        z = self.z0 + oracle.b
+        s = self.Ad
+        rows = oracle._pick(z, s)[0]  # maximal pieces just after 0
+        slope0 = s[rows].sum()
+        tk = np.zeros(len(rows))  # last breakpoint of each group
+        going = np.ones(len(rows), dtype=bool)
+        ts, jumps = [], []
+        while np.any(going):
+            # where the pieces of larger slope overtake the maximal ones
+            za, sa = z[rows][gid], s[rows][gid]
+            ahead = (s > sa) & going[gid]
+            cross = np.inf * np.ones(len(s))
+            cross[ahead] = (za[ahead] - z[ahead]) / (s[ahead] - sa[ahead])
+            cross = np.maximum(cross, tk[gid])
+            # the first one to take over, or of largest slope if several
+            pos = np.lexsort((s[order], -cross[order], gsorted))[ends - 1]
+            after = order[pos]
+            tnext = cross[after]
+            going = np.isfinite(tnext)
+            ts.append(tnext[going])
+            jumps.append(s[after][going] - s[rows][going])
+            rows = np.where(going, after, rows)
+            tk = np.where(going, tnext, tk)
+        ts = np.concatenate(ts)
+        jumps = np.concatenate(jumps)
+        keep = ts > 0  # (pieces tied at 0 are picked by slope)
+        order = np.argsort(ts[keep], kind='mergesort')
+        return (ts[keep][order], slope0 + np.cumsum(jumps[keep][order]),
+                slope0 + jumps[~keep].sum())
+
+    def weak_wolfe(self, func0, g0, wolfe1=0, wolfe2=.5, fvalquit=-np.inf,
+                   nexpandmax=10):
+        """
+        Step satisfying the weak Wolfe conditions (see linesch_ww), from
+        the breakpoints of f along the line rather than by bisection.
+
+        The unit step is tried first, as in linesch_ww. Otherwise, since
+        the slope of f only increases along the line, the first point where
+        it exceeds wolfe2 * g0 is the breakpoint where it jumps over that
+        value, and f decreased at least as fast as wolfe2 * g0 (so, as
+        fast as wolfe1 * g0) before it: that breakpoint satisfies both
+        conditions (with wolfe2 = 0, it is the exact minimizer along the
+        line). At a kink x0, this may be the first breakpoint: the slope
+        just after 0 may exceed wolfe2 * g0, since g0 is the slope of
+        the gradient at x0, which may be that of any of the maximal pieces.
+        The search only fails if f does not decrease fast enough (as
+        wolfe1 * g0) just after 0.
+
+        The step is then moved a little past the breakpoint, into the next
+        linear piece (at most halfway to the next breakpoint, and giving
+        back at most a tenth of the decrease made at the breakpoint), so
+        that the next iterate does not sit on a kink, where its gradient
+        would only describe f on one side.
+
+        Returns
+        -------
+        alpha, falpha, beta, fail, fevalrec:
+            as returned by linesch_ww (alpha is 0, and falpha func0, if no
+            step decreases f)
+
+        """
+
+        c = wolfe2 * g0
+        f = self.value(1.)
+        fevalrec = [f]
+        if f < fvalquit:
+            return 1., f, np.inf, 0, fevalrec
+        if f < func0 + wolfe1 * g0 and self.slope(1.) > c:
+            return 1., f, 1., 0, fevalrec
+
+        ts, slopes, slope0 = self.breakpoints()
+        if slope0 >= wolfe1 * g0:
+            # no sufficient decrease, even for tiny steps: return a point
+            # of the first linear piece, for its gradient
+            beta = (min(1., ts[0]) if len(ts) else 1.) / 2.
+            fevalrec.append(self.value(beta))
+            return 0, func0, beta, 1, fevalrec
+        above = np.flatnonzero(slopes > c)
+        if not len(above):
+            # unbounded below along d: as far as linesch_ww would expand
+            alpha = 2. ** nexpandmax
+            f = self.value(alpha)
+            fevalrec.append(f)
+            return alpha, f, np.inf, -1, fevalrec
+        k = above[0]
+        tau = ts[k]
+        # step a little past tau, into the next linear piece, so that the
+        # gradient there is that of f near the step, not of a kink
+        ftau = func0 + np.dot(np.diff(np.r_[0., ts[:k + 1]]),
+                              np.r_[slope0, slopes[:k]])
+        later = ts[ts > tau]
+        h = (later[0] - tau) / 2. if len(later) else tau
+        rise = slopes[k] - wolfe1 * g0
+        if rise > 0:
+            h = min(h, .1 * (func0 + wolfe1 * tau * g0 - ftau) / rise)
+        for alpha in (tau + max(h, 0.), tau):
+            f = self.value(alpha)
+            fevalrec.append(f)
+            if f < func0 + wolfe1 * alpha * g0 or f < fvalquit:
+                return alpha, f, alpha, 0, fevalrec
+        return 0, func0, tau, 1, fevalrec  # lost to rounding
+
+
+def max_affine_l1(nvar, lambd=1.):
+    """
+    lambd * l1(x), as a MaxAffineOracle: |x_j| = max(x_j, -x_j).
+
+    """
+
+    eye = lambd * sparse.identity(nvar, format='csr')
+    return MaxAffineOracle(sparse.vstack((eye, -eye), format='csr'),
+                           groups=np.tile(np.arange(nvar), 2))
+
+
+def max_affine_linf(nvar, lambd=1.):
+    """
+    lambd * max_j |x_j|, as a MaxAffineOracle (a single group).
+
+    """
+
+    eye = lambd * sparse.identity(nvar, format='csr')
+    return MaxAffineOracle(sparse.vstack((eye, -eye), format='csr'))
+
+
+def max_affine_tv(nvar, lambd=1.):
+    """
+    lambd * tv(x) = lambd * l1(diff(x)) (see example_functions), as a
+    MaxAffineOracle.
+
+    """
+
+    D = lambd * sparse.diags([-np.ones(nvar - 1), np.ones(nvar - 1)], [0, 1],
+                             shape=(nvar - 1, nvar), format='csr')
+    return MaxAffineOracle(sparse.vstack((D, -D), format='csr'),
+                           groups=np.tile(np.arange(nvar - 1), 2))
+
+
+def max_affine_hinge(X, y):
+    """
+    Hinge loss sum_i max(0, 1 - y_i * X_i' * w) of a linear classifier w,
+    for samples X (one per row) with labels y in {-1, 1}, as a
+    MaxAffineOracle.
+
+    """
+
+    X = np.asarray(X, dtype=float)
+    n = X.shape[0]
+    A = np.vstack((np.zeros(X.shape), -np.asarray(y)[:, np.newaxis] * X))
+    return MaxAffineOracle(A, b=np.r_[np.zeros(n), np.ones(n)],
+                           groups=np.tile(np.arange(n), 2))
+
+
+def max_affine_sum(*objectives):
+    """
+    Sum of MaxAffineOracles (on the same variables), e.g
+    max_affine_sum(max_affine_hinge(X, y), max_affine_l1(nvar, .1)) for an
+    l1-penalized linear SVM.
+
+    """
+
+    A = [objective.A for objective in objectives]
+    A = sparse.vstack(A, format='csr') if any(
+        sparse.issparse(a) for a in A) else np.vstack(A)
+    groups, offset = [], 0
+    for objective in objectives:
+        groups.append(objective._gid + offset)
+        offset += objective._gid.max() + 1
+    return MaxAffineOracle(A, b=np.concatenate(
+            [objective.b for objective in objectives]),
+                           groups=np.concatenate(groups))
+
+
+if __name__ == '__main__':
+    from linesch_ww import linesch_ww
+    # a kink at x0, where the slope just after 0 is larger than that of
+    # the gradient at x0, but f still decreases along d
+    oracle = max_affine_l1(2)
+    x0 = np.array([0., 1.])
+    alpha, _, falpha, _, fail = linesch_ww(oracle, x0, [2., -3.],
+                                           verbose=0)[:5]
+    print alpha, falpha, fail
+    assert fail == 0 and falpha < oracle(x0)[0]
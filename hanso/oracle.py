@@ -0,0 +1,339 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+from instrument import clock
+
+
+class Oracle(object):
+    """
+    Function/gradient oracle: evaluates f(x) and grad f(x) together,
+    remembering the last few points evaluated, so that no point is ever
+    evaluated twice in a row by the solvers (e.g the starting point of a
+    line search, which is the end point of the previous one).
+
+    Parameters
+    ----------
+    func : callable func(x)
+        function to minimise. If grad is None, then func(x) must return
+        the function value and the gradient at x, as a tuple (f, g)
+
+    grad : callable grad(x), optional (default None)
+        the gradient of `func`
+
+    cache_size: int, optional (default 3)
+        number of points whose function value and gradient are kept;
+        0 disables caching
+
+    vectorized: boolean, optional (default False)
+        if set, func and grad accept a 2D array X of shape (nvar, n), with
+        one point per column, and return respectively the 1D array of the
+        n function values and the (nvar, n) array of the gradients (or
+        both as a tuple, if grad is None). Batches of points (see `batch`)
+        are then evaluated with a single call, e.g through matrix-matrix
+        products instead of n matrix-vector products
+
+    lazy: boolean, optional (default False)
+        if set (grad must then be given), the line searches evaluate their
+        trial steps lazily, through an OracleLine (see `along`): the
+        function value first, the directional derivative only for the
+        steps which pass the sufficient decrease test, and the full
+        gradient only at the steps they return. This pays off when the
+        gradient costs about as much as the function value, and more so
+        with jvp
+
+    jvp: callable jvp(x, d), optional (default None)
+        directional derivative grad f(x)' * d, e.g by forward mode
+        differentiation, or from intermediate results which func cached;
+        implies lazy. Without it, the directional derivatives are computed
+        from the full gradient (which is kept, in case the step is
+        returned)
+
+    Attributes
+    ----------
+    nfeval: int
+        number of times func was actually called
+
+    ngeval: int
+        number of times the gradient was actually computed
+
+    ncall: int
+        number of evaluations requested to the oracle (ncall - nfeval
+        were served from the cache)
+
+    njvp: int
+        number of times jvp was called
+
+    time: float
+        seconds spent in func and grad
+
+    Notes
+    -----
+    The points are keyed on the contents of the arrays, so modifying an
+    array in place after it has been evaluated is harmless. The returned
+    gradients must not be modified in place, since they are shared with
+    the cache.
+
+    """
+
+    def __init__(self, func, grad=None, cache_size=3, vectorized=False,
+                 lazy=False, jvp=None):
+        self.func = func
+        self.grad = grad
+        self.cache_size = cache_size
+        self.vectorized = vectorized
+        self.lazy = lazy or jvp is not None
+        self.jvp = jvp
+        if self.lazy and grad is None:
+            raise ValueError("a lazy oracle needs func and grad separately")
+        self.nfeval = 0
+        self.ngeval = 0
+        self.ncall = 0
+        self.njvp = 0
+        self.time = 0.
+        self._cache = OrderedDict()
+
+    def _key(self, x):
+        return x.shape, x.tobytes()
+
+    def _evaluate(self, x):
+        start = clock()
+        if self.grad is None:
+            fg = self.func(x)
+        else:
+            fg = self.func(x), self.grad(x)
+        self.time += clock() - start
+        return fg
+
+    def __call__(self, x):
+        """
+        Function value and gradient at x.
+
+        Returns
+        -------
+        f: float
+            function value at x
+
+        g: 1D array of same length as x
+            gradient at x
+
+        """
+
+        x = np.ascontiguousarray(x, dtype=float)
+        self.ncall += 1
+        key = self._key(x)
+        if key in self._cache:
+            return self._cache[key]
+
+        self.nfeval += 1
+        self.ngeval += 1
+        if self.vectorized:
+            f, g = self._evaluate(x.reshape((-1, 1)))
+            f, g = np.ravel(f)[0], np.asarray(g)[:, 0]
+        else:
+            f, g = self._evaluate(x)
+
+        self._store(key, (f, g))
+        return f, g
+
+    def _store(self, key, fg):
+        if self.cache_size > 0 and key not in self._cache:
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)  # forget the oldest point
+            self._cache[key] = fg
+
+    def _call(self, func, x, *args):
+        # func, grad or jvp at the single point x
+        start = clock()
+        if self.vectorized:
+            value = func(x.reshape((-1, 1)), *[
+                    arg.reshape((-1, 1)) for arg in args])
+            value = np.asarray(value)[:, 0] if func is self.grad else \
+                np.ravel(value)[0]
+        else:
+            value = func(x, *args)
+        self.time += clock() - start
+        return value
+
+    def along(self, x0, d):
+        """
+        The restriction of the objective to the line x0 + t * d, as an
+        OracleLine, if the oracle is lazy; None otherwise (the line
+        searches then evaluate f and its gradient together).
+
+        """
+
+        return OracleLine(self, x0, d) if self.lazy else None
+
+    def copy(self):
+        """
+        New oracle on the same func and grad, with an empty cache and zero
+        counters (e.g for a worker thread or process); see `merge`.
+
+        """
+
+        return Oracle(self.func, grad=self.grad, cache_size=self.cache_size,
+                      vectorized=self.vectorized, lazy=self.lazy,
+                      jvp=self.jvp)
+
+    def cache_state(self):
+        """
+        Contents of the cache, e.g for a checkpoint (see checkpoint.py).
+
+        """
+
+        return dict(cache=self._cache.copy())
+
+    def restore_cache(self, state):
+        """
+        Restore the cache from the output of `cache_state`.
+
+        """
+
+        self._cache = state['cache'].copy()
+
+    def merge(self, other):
+        """
+        Add the evaluation counters of other (e.g a copy used by a worker)
+        to those of this oracle.
+
+        """
+
+        self.nfeval += other.nfeval
+        self.ngeval += other.ngeval
+        self.ncall += other.ncall
+        self.njvp += getattr(other, 'njvp', 0)
+        self.time += other.time
+
+    def batch(self, X):
+        """
+        Function values and gradients at the points X[:, 0], X[:, 1], ...
+        With a vectorized oracle, this costs a single call to func and
+        grad; otherwise the points are evaluated one at a time. Batch
+        evaluations bypass the cache.
+
+        Parameters
+        ----------
+        X: 2D array of shape (nvar, n)
+            points to evaluate, one per column
+
+        Returns
+        -------
+        F: 1D array of length n
+            function values
+
+        G: 2D array of shape (nvar, n)
+            gradients, one per column
+
+        """
+
+        X = np.asarray(X, dtype=float)
+        n = X.shape[1]
+        self.ncall += n
+        self.nfeval += n
+        self.ngeval += n
+        if self.vectorized:
+            F, G = self._evaluate(X)
+            return np.ravel(F).astype(float), np.asarray(G, dtype=float)
+        F = np.empty(n)
+        G = np.empty(X.shape)
+        for j in xrange(n):
+            F[j], G[:, j] = self._evaluate(X[:, j])
+        return F, G
+
+
+class OracleLine(object):
+    """
+    Restriction t -> f(x0 + t * d) of the objective of a lazy Oracle to a
+    line, for the line searches: `value(t)` only calls func, `slope(t)`
+    returns the directional derivative at x0 + t * d (by jvp, or from the
+    gradient), and `gradient(t)` the gradient there. The points whose
+    gradient is formed go into the cache of the oracle, with their
+    function value.
+
+    The trial points are computed as x0 + t * d, exactly as the line
+    searches do, so that the accepted point is found in the cache of the
+    oracle afterwards.
+
+    """
+
+    def __init__(self, oracle, x0, d):
+        self.oracle = oracle
+        self.x0 = np.asarray(x0, dtype=float)
+        self.d = np.asarray(d, dtype=float)
+        self._values = {}  # t -> f, for the steps evaluated so far
+
+    def value(self, t):
+        """
+        Function value at x0 + t * d.
+
+        """
+
+        oracle = self.oracle
+        oracle.ncall += 1
+        x = self.x0 + t * self.d
+        key = oracle._key(x)
+        if key in oracle._cache:
+            f = oracle._cache[key][0]
+        else:
+            oracle.nfeval += 1
+            f = oracle._call(oracle.func, x)
+        self._values[t] = f
+        return f
+
+    def slope(self, t):
+        """
+        Directional derivative at x0 + t * d (whose value was asked for).
+
+        """
+
+        oracle = self.oracle
+        x = self.x0 + t * self.d
+        if oracle.jvp is None or oracle._key(x) in oracle._cache:
+            return np.dot(self.gradient(t), self.d)
+        oracle.njvp += 1
+        return oracle._call(oracle.jvp, x, self.d)
+
+    def gradient(self, t):
+        """
+        Gradient at x0 + t * d (whose value was asked for). The point, its
+        function value and gradient are then cached by the oracle.
+
+        """
+
+        oracle = self.oracle
+        x = self.x0 + t * self.d
+        key = oracle._key(x)
+        if key in oracle._cache:
+            return oracle._cache[key][1]
+        oracle.ngeval += 1
+        g = oracle._call(oracle.grad, x)
+        oracle._store(key, (self._values[t], g))
+        return g
+
+    def __call__(self, t):
+        """
+        Function value and directional derivative at x0 + t * d.
+
+        """
+
+        return self.value(t), self.slope(t)
+
+
+def make_oracle(func, grad=None, vectorized=False):
+    """
+    Wrap func and grad into an Oracle, unless func is already one (in
+    which case grad must be None, and vectorized is ignored). Solvers call
+    this on entry, so that an oracle created by the caller is shared across
+    all the solvers it is passed to.
+
+    """
+
+    if isinstance(func, Oracle):
+        assert grad is None, "grad must be None when func is an Oracle"
+        return func
+    return Oracle(func, grad=grad, vectorized=vectorized)
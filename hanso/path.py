@@ -0,0 +1,87 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import numpy as np
+
+from hanso import hanso
+from setx0 import setx0
+from warmstart import WarmStart
+from instrument import Stats, clock
+
+
+def hanso_path(funcs, x0=None, grads=None, nvar=None, nstart=None,
+               warm_start=True, verbose=1, **kwargs):
+    """
+    Solve a sequence of related problems with hanso, e.g the same
+    objective for a grid of values of a penalty parameter (regularization
+    path), each solve being warm-started from the previous one: it starts
+    from the previous solution, and its BFGS phase from the previous
+    limited memory pairs (or, optionally, inverse Hessian approximation)
+    and bundle of gradients (see WarmStart), instead of H0 and an empty
+    bundle. Order the problems so that successive solutions are close,
+    e.g by decreasing penalty.
+
+    Parameters
+    ----------
+    funcs: sequence of callables, or of Oracles
+        the objectives (see hanso)
+
+    x0: 2D array of shape (nvar, nstart), optional (default None)
+        starting points of the first problem, one per column; by default,
+        nstart points drawn by setx0
+
+    grads: sequence of callables, optional (default None)
+        their gradients (see hanso)
+
+    warm_start: boolean or WarmStart, optional (default True)
+        if not set, every problem is solved from x0, from scratch (e.g to
+        measure what warm starts save); a WarmStart sets how they are done
+        (e.g WarmStart(hessian=True) to reuse the inverse Hessian
+        approximation of full BFGS)
+
+    **kwargs: param-value dict
+        passed to hanso, for every problem (e.g maxit, nvec, sampgrad,
+        cpumax)
+
+    Returns
+    -------
+    path: list of dicts, one per problem, with keys
+        x, f: final iterate and function value
+        loc: local optimality certificate (see hanso)
+        time: seconds spent in the solve
+        nfeval, ngeval: numbers of function and gradient evaluations
+        niter: number of line searches (BFGS and gradient sampling
+        iterations)
+        stats: all the statistics of the solve (see Stats)
+
+    """
+
+    def _log(msg, level=0):
+        if verbose > level:
+            print msg
+
+    grads = [None] * len(funcs) if grads is None else grads
+    if x0 is None:
+        x0 = setx0(nvar, nstart)
+    if warm_start is True:
+        warm_start = WarmStart()
+    warm = warm_start if warm_start else None
+
+    path = []
+    x = x0
+    for k, (func, grad) in enumerate(zip(funcs, grads)):
+        stats = Stats()
+        start = clock()
+        x, f, loc = hanso(func, x0=x, grad=grad, warm_start=warm,
+                          stats=stats, verbose=verbose - 1, **kwargs)[:3]
+        path.append(dict(x=x, f=f, loc=loc, time=clock() - start,
+                         nfeval=stats.get('nfeval', 0),
+                         ngeval=stats.get('ngeval', 0),
+                         niter=stats.get('nlinesearch', 0), stats=stats))
+        _log("hanso_path: problem %i/%i: f = %g, nfeval = %i, niter = %i, "
+             "time = %.3fs" % (k + 1, len(funcs), f, path[-1]['nfeval'],
+                               path[-1]['niter'], path[-1]['time']))
+        x = np.reshape(x, (-1, 1)) if warm is not None else x0
+    return path
@@ -6,10 +6,10 @@
 import numpy as np
 from scipy import linalg
 
-from qpspecial import qpspecial
+from bundleqp import BundleQP
 
 
-def postprocess(x, g, dnorm, X, G, w, verbose=1):
+def postprocess(x, g, dnorm, X, G, w, verbose=1, qp=None):
     """
     postprocessing of set of sampled or bundled gradients
     if x is not one of the columns of X, prepend it to X and
@@ -19,6 +19,10 @@ def postprocess(x, g, dnorm, X, G, w, verbose=1):
     note: w is needed as input argument for the usual case that
     w is not recomputed but is just passed back to output
 
+    qp: BundleQP instance, optional (default None)
+        holds the Gram matrix of G, if already available; otherwise it is
+        computed here, when w has to be recomputed
+
     """
 
     dist = [linalg.norm(x - X[..., j], 2) for j in xrange(X.shape[1])]
@@ -27,25 +31,31 @@ def postprocess(x, g, dnorm, X, G, w, verbose=1):
     indx = np.argmin(dist)  # for checking if x is a column of X
     mindist = dist[indx]
 
-    if mindist == 0 and indx == 1:
+    if mindist == 0 and indx == 0:
         # nothing to do
         pass
-    elif mindist == 0 and indx > 1:
+    elif mindist == 0 and indx > 0:
         # this should not happen in HANSO 2.0
         # swap x and g into first positions of X and G
         # might be necessary after local bundle, which is not used in HANSO 2.0
-        X[..., [1, indx]] = X[..., [indx, 1]]
-        G[..., [1, indx]] = G[..., [indx, 1]]
-        w[..., [1, indx]] = w[..., [indx, 1]]
+        X[..., [0, indx]] = X[..., [indx, 0]]
+        G[..., [0, indx]] = G[..., [indx, 0]]
+        w[[0, indx], ...] = w[[indx, 0], ...]
     else:
         # this cannot happen after BFGS, but it may happen after gradient
         # sampling, for example if max iterations exceeded: line search found a
         # lower point but quit before solving new QP
         # prepend x to X and g to G and recompute w
+        # the QP is warm-started from w, and the new gradient only costs a
+        # new row and column of the Gram matrix
+        if qp is None:
+            qp = BundleQP(G.shape[1] + 1)
+            qp.fit(G, w=w)
         X = np.vstack((x, X.T)).T
         if not np.any(np.isnan(g)):
-            G = np.hstack((g, G))
-        w, d, _, _ = qpspecial(G, verbose=verbose)  # Anders Skajaa's QP code
+            G = np.hstack((np.reshape(g, (-1, 1)), G))
+            qp.insert(G, 0)
+        w, d, _, _ = qp.solve(G, verbose=verbose)  # Anders Skajaa's QP code
         dnorm = linalg.norm(d, 2)
 
     return {"dnorm": dnorm, "evaldist": evaldist}, X, G, w
@@ -6,20 +6,84 @@
 import numpy as np
 from scipy import linalg
 
+from instrument import clock
 
-def qpspecial(G, maxit=100, x=None, verbose=1):
+
+# bundles with more gradients than this are left to the interior point
+# method by the automatic solver selection
+WOLFE_MAXN = 100
+
+# ... as are Gram matrices whose diagonal spans more orders of magnitude
+# than this (gradients of wildly different lengths)
+WOLFE_MAXDIAGRATIO = 1e12
+
+
+def qpspecial(G, maxit=100, x=None, verbose=1, Q=None, solver="auto",
+              stats=None):
     """
     Solves the QP Problem:
     min q(x) = || G * x ||_2^2 = x' * (G' * G) * x
     s.t. sum(X) = 1
              x >= 0
 
+    i.e finds the shortest vector d = G * x in the convex hull of the
+    columns of G.
+
+    Parameters
+    ----------
+    G: 2D array of shape (nvar, n)
+        bundle of gradients, one per column
+
+    maxit: int, optional (default 100)
+        maximum number of iterations of the solver
+
+    x: 2D array of shape (n, 1), optional (default None)
+        guess of the solution (warm start), e.g the solution for a
+        previous bundle; must be nonnegative and nonzero, otherwise ignored
+
+    Q: 2D array of shape (n, n), optional (default None)
+        precomputed Gram matrix G' * G (see BundleQP)
+
+    solver: string, optional (default "auto")
+        backend used to solve the QP. Possible values are:
+        "closed": closed-form solution, for n <= 3 only
+        "wolfe": Wolfe's active-set minimum-norm-point algorithm
+        "ipm": Mehrotra predictor-corrector interior point method
+        "auto": "closed" if n <= 3, otherwise "wolfe" for bundles of
+        moderate size (at most WOLFE_MAXN gradients) with a reasonably
+        scaled Gram matrix, and "ipm" for the rest; "ipm" is also used
+        whenever "wolfe" fails to converge
+
+    stats: Stats, optional (default None)
+        if provided, the QP time, the number of QPs and of solver
+        iterations, and the bundle size are recorded in it (see Stats)
+
+    Returns
+    -------
+    x: 2D array of shape (n, 1)
+        optimal weights
+
+    d: 1D array of length nvar
+        G * x
+
+    q: float
+        d' * d
+
+    info: list [flag, iterations]
+        flag is 0 if the solution is optimal, 1 if maxit was reached,
+        and 2 on failure
+
+    Raises
+    ------
+    ValueError
+
     """
 
     def _log(msg, level=0):
         if verbose > level:
             print msg
 
+    start = clock()
     G = np.array(G)
     if G.ndim == 1:
         G = G.reshape((-1, 1))
@@ -29,32 +93,238 @@ def qpspecial(G, maxit=100, x=None, verbose=1):
         print "qpspecial: G is empty!"
         return [2, 0], [], [], np.inf
 
-    e = np.ones((n, 1)) * 1.
+    Q = np.dot(G.T, G) if Q is None else np.asarray(Q)
 
-    if x is None:
-        x = np.array(e)
+    if x is not None:
+        x = np.array(x, dtype=float).reshape((-1, 1))
+        if x.shape[0] != n or np.any(x < 0) or not np.sum(x) > 0:
+            x = None
+
+    fallback = solver == "auto"
+    if solver == "auto":
+        solver = _select_solver(Q)
+
+    if solver == "closed":
+        if n > 3:
+            raise ValueError(
+                "qpspecial: closed-form solver is for n <= 3, got n = %i" % n)
+        x, info = _qp_closed(Q)
+    elif solver == "wolfe":
+        xwolfe, info = _qp_wolfe(Q, x=x, maxit=maxit)
+        if info[0] == 2 and x is not None:
+            # the warm start was degenerate: start again from scratch
+            xwolfe, info = _qp_wolfe(Q, maxit=maxit)
+        if info[0] != 0 and fallback:
+            _log("qpspecial: wolfe did not converge, falling back to ipm")
+            x, info = _qp_ipm(Q, x=x, maxit=maxit, log=_log)
+        else:
+            x = xwolfe
+    elif solver == "ipm":
+        x, info = _qp_ipm(Q, x=x, maxit=maxit, log=_log)
+    else:
+        raise ValueError("qpspecial: unknown solver: %s" % solver)
+
+    x = np.maximum(x, 0)
+    x = x / np.sum(x)
+
+    d = np.dot(G, x).ravel()
+    q = np.dot(d.T, d)
+
+    if verbose > 0:
+        reason = "result: optimal."
+        if info[0] == 1:
+            reason = 'maxit reached.'
+        elif info[0] == 2:
+            reason = "Failed."
+        _log("---------------------------------")
+        _log(reason)
+        _log("---------------------------------")
+
+    if stats is not None:
+        stats.add('nqp')
+        stats.add('qpiter', info[1])
+        stats.append('bundle_sizes', n)
+        stats.maximum('max_bundle_size', n)
+        stats.add_time('qp', clock() - start)
+
+    return x, d, q, info
+
+
+def _select_solver(Q):
+    """
+    Automatic choice of the qpspecial backend, by bundle size and scaling
+    of the Gram matrix Q.
+
+    """
+
+    n = Q.shape[0]
+    if n <= 3:
+        return "closed"
+    diag = np.diag(Q)
+    if n <= WOLFE_MAXN and np.max(diag) <= WOLFE_MAXDIAGRATIO * max(
+        np.min(diag), np.finfo(float).tiny):
+        return "wolfe"
+    return "ipm"
+
+
+def _qp_closed(Q):
+    """
+    Closed-form solution of the qpspecial QP, for n <= 3 gradients.
+
+    """
+
+    n = Q.shape[0]
+    if n == 1:
+        return np.ones((1, 1)), [0, 0]
+    elif n == 2:
+        # minimize ||g1 + t * (g2 - g1)||^2 over t in [0, 1]
+        denom = Q[0, 0] - 2 * Q[0, 1] + Q[1, 1]
+        t = (Q[0, 0] - Q[0, 1]) / denom if denom > 0 else 0.
+        t = min(max(t, 0.), 1.)
+        return np.array([[1. - t], [t]]), [0, 0]
+
+    # n == 3: try the minimizer on the affine hull of the 3 gradients,
+    # it is the solution if it lies inside the triangle
+    K = np.ones((4, 4))
+    K[:3, :3] = Q
+    K[3, 3] = 0.
+    rhs = np.array([0., 0., 0., 1.])
+    try:
+        x = linalg.solve(K, rhs)[:3]
+    except linalg.LinAlgError:
+        x = None  # degenerate triangle
+    if x is not None and np.all(x >= 0) and np.all(np.isfinite(x)):
+        return x.reshape((-1, 1)), [0, 0]
+
+    # otherwise the solution lies on one of the edges
+    best = None
+    for i, j in [(0, 1), (0, 2), (1, 2)]:
+        y, _ = _qp_closed(Q[np.ix_([i, j], [i, j])])
+        q = np.dot(y.T, np.dot(Q[np.ix_([i, j], [i, j])], y))
+        if best is None or q < best[0]:
+            x = np.zeros((3, 1))
+            x[[i, j]] = y
+            best = q, x
+    return best[1], [0, 0]
+
+
+def _qp_wolfe(Q, x=None, maxit=100, tol=1e-12):
+    """
+    Wolfe's active-set minimum-norm-point algorithm, working on the Gram
+    matrix Q only.
+
+    Reference
+    ---------
+    P. Wolfe, Finding the nearest point in a polytope, Math Programming 11
+    (1976), pp. 128-149
+
+    """
+
+    n = Q.shape[0]
+    scale = np.max(np.diag(Q))
+    if x is not None:
+        # warm start from the support of x, which is not necessarily a
+        # corral (set of affinely independent points whose affine
+        # minimizer has positive weights): start with a minor cycle
+        lam = np.ravel(x) / np.sum(x)
+        S = list(np.nonzero(lam > 1e-8)[0])
+        lam = lam[S] / np.sum(lam[S])
+        minor = True
     else:
-        x = np.array(x) * 1.
-        if np.any(x < 0) or x.shape[0] != n:
-            x = np.array(e)
+        S = [np.argmin(np.diag(Q))]
+        lam = np.ones(1)
+        minor = False
+
+    info = [1, maxit]
+    for k in xrange(maxit):
+        if not minor:
+            # major cycle: add the point which most decreases the norm
+            Qlam = np.dot(Q[:, S], lam)
+            j = np.argmin(Qlam)
+            if np.dot(lam, Qlam[S]) - Qlam[j] <= tol * scale or j in S:
+                info = [0, k]
+                break
+            S.append(j)
+            lam = np.append(lam, 0.)
+        minor = False
+
+        # minor cycles: move towards the minimizer on the affine hull of
+        # S, dropping the points which get a zero weight on the way
+        while True:
+            m = len(S)
+            K = np.ones((m + 1, m + 1))
+            K[:m, :m] = Q[np.ix_(S, S)]
+            K[m, m] = 0.
+            rhs = np.zeros(m + 1)
+            rhs[m] = 1.
+            try:
+                mu = linalg.solve(K, rhs)[:m]
+            except linalg.LinAlgError:
+                mu = np.array([np.nan])
+            if not np.all(np.isfinite(mu)):
+                # points numerically affinely dependent
+                info = [2, k]
+                break
+            if np.all(mu > tol):
+                lam = mu
+                break
+            neg = mu <= tol
+            theta = np.min(lam[neg] / (lam[neg] - mu[neg]))
+            lam = theta * mu + (1. - theta) * lam
+            # drop (at least) the point which blocked the step
+            keep = lam > tol
+            keep[np.argmin(np.where(neg, lam, np.inf))] = False
+            S = [i for i, b in zip(S, keep) if b]
+            lam = lam[keep] / np.sum(lam[keep])
+        if info[0] == 2:
+            break
+
+    x = np.zeros((n, 1))
+    x[S, 0] = lam
+    return x, info
+
+
+def _qp_ipm(Q, x=None, maxit=100, log=None):
+    """
+    Mehrotra predictor-corrector interior point method for the qpspecial
+    QP (Anders Skajaa's QP code). Each iteration costs one Cholesky
+    factorization of an n x n matrix, and triangular solves.
+
+    """
+
+    def _log(msg, level=0):
+        if log is not None:
+            log(msg, level=level)
 
+    n = Q.shape[0]
+    e = np.ones((n, 1)) * 1.
     idx = np.arange(0, n ** 2, n + 1)
-    Q = np.dot(G.T, G)
-    z = np.array(x)
-    y = 0
+
+    if x is None:  # cold start
+        x = np.array(e)
+        z = np.array(x)
+        y = 0
+    else:
+        # warm start: x is taken as a guess of the solution, pulled
+        # halfway towards the center of the simplex to make it strictly
+        # feasible. Start close to the central path, with a small duality
+        # measure mu = x' * z / n
+        x = .5 * x / np.sum(x) + .5 / n
+        z = 1e-2 / x
+        y = float(np.dot(x.T, np.dot(Q, x)))
     eta = .9995
     delta = 3
     mu0 = np.dot(x.T, z) / n
     tolmu = 1e-5
     tolrs = 1e-5
-    kmu = tolmu * mu0
+    kmu = tolmu  # relative to mu0 = 1 for a cold start
     nQ = linalg.norm(Q, np.inf) + 2
     krs = tolrs * nQ
     ap = 0
     ad = 0
     _log("k     mu       stpsz      res")
     _log("---------------------------------")
-    aborted_loop = False
+    info = [1, maxit]
     for k in xrange(maxit):
         r1 = -np.dot(Q, x) + e * y + z
         r2 = -1 + np.sum(x)
@@ -68,22 +338,22 @@ def qpspecial(G, maxit=100, x=None, verbose=1):
         if mu < kmu:
             if rs < krs:
                 info = [0, k - 1]
-                aborted_loop = True
                 break
 
         zdx = z / x
         QD = np.array(Q).ravel() * 1.
         QD[idx] = QD[idx] + zdx.ravel()
         QD = QD.reshape(Q.shape)
+        # QD = C' * C: this factorization is reused for all the solves
         C = linalg.cholesky(QD, lower=False)
-        KT = linalg.solve(C.T, e, lower=True)
+        KT = linalg.solve_triangular(C, e, trans='T')
         M = np.dot(KT.T, KT)
         r4 = r1 + r3 / x
-        r5 = np.dot(KT.T, linalg.solve(C.T, r4, lower=True))
+        r5 = np.dot(KT.T, linalg.solve_triangular(C, r4, trans='T'))
         r6 = r2 + r5
         dy = -r6 / M
         r7 = r4 + e * dy
-        dx = linalg.solve(QD, r7, sym_pos=True)
+        dx = linalg.cho_solve((C, False), r7)
         dz = (r3 - z * dx) / x
 
         p = -x / dx
@@ -98,11 +368,11 @@ def qpspecial(G, maxit=100, x=None, verbose=1):
         r3 = r3 + sig * mu
         r3 = r3 - dx * dz
         r4 = r1 + r3 / x
-        r5 = np.dot(KT.T, linalg.solve(C.T, r4, lower=True))
+        r5 = np.dot(KT.T, linalg.solve_triangular(C, r4, trans='T'))
         r6 = r2 + r5
         dy = -r6 / M
         r7 = r4 + e * dy
-        dx = linalg.solve(QD, r7, sym_pos=True)
+        dx = linalg.cho_solve((C, False), r7)
         dz = (r3 - z * dx) / x
 
         p = -x / dx
@@ -115,25 +385,7 @@ def qpspecial(G, maxit=100, x=None, verbose=1):
         y = y + eta * ad * dy
         z = z + eta * ad * dz
 
-    if not aborted_loop:
-        info = [1, maxit]
-    x = np.maximum(x, 0)
-    x = x / np.sum(x)
-
-    d = np.dot(G, x).ravel()
-    q = np.dot(d.T, d)
-
-    if verbose > 0:
-        reason = "result: optimal."
-        if info[0] == 1:
-            reason = 'maxit reached.'
-        elif info[0] == 2:
-            reason = "Failed."
-        _log("---------------------------------")
-        _log(reason)
-        _log("---------------------------------")
-
-    return x, d, q, info
+    return x, info
 
 
 if __name__ == '__main__':
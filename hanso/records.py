@@ -0,0 +1,333 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+Sinks for the execution records of bfgs1run (function values evaluated in
+the line searches, iterates x and inverse Hessian approximations H).
+
+A sink is passed to bfgs / bfgs1run via the `records` parameter. For each
+run, bfgs1run calls `sink.open(run, nvar, maxit, H0=H0)` to get a recorder,
+calls `recorder.append(x, fevalrec, H)` once per iteration (and, for full
+BFGS, `recorder.update(s, y, scale)` after each update of H), and finally
+`recorder.close()`, which returns the fevalrec, xrec and Hrec sequences
+returned by bfgs1run.
+
+"""
+
+import os
+import json
+import numpy as np
+
+from hessianhistory import HessianHistory
+
+FIELDS = ('feval', 'x', 'H')
+
+
+class NullSink(object):
+    """
+    Discard all the records (default). bfgs1run then returns empty
+    fevalrec, xrec and Hrec lists.
+
+    """
+
+    def open(self, run, nvar, maxit, H0=1.):
+        return MemoryRecorder(fields=())
+
+
+class MemorySink(object):
+    """
+    Keep the records in memory, as lists (one entry per iteration).
+
+    Parameters
+    ----------
+    fields: sequence of strings, optional (default ('feval', 'x', 'H'))
+        records to keep, among 'feval' (function values evaluated in the
+        line search), 'x' (iterate) and 'H' (a full copy of the inverse
+        Hessian approximation: nvar x nvar floats per iteration, for full
+        BFGS!); the lists of the other records are left empty
+
+    Hcompact: boolean, optional (default False)
+        if set, the H record of full BFGS is a HessianHistory instead of a
+        list of dense matrices: only the initial H, its scaling and the
+        (s, y) pairs are stored, i.e O(nvar) floats per iteration, and
+        each Hrec[k] is reconstructed on access
+
+    """
+
+    def __init__(self, fields=FIELDS, Hcompact=False):
+        self.fields = _check_fields(fields)
+        self.Hcompact = Hcompact
+
+    def open(self, run, nvar, maxit, H0=1.):
+        return MemoryRecorder(fields=self.fields, history=HessianHistory(
+                nvar, H0=H0) if self.Hcompact else None)
+
+
+class MemmapSink(object):
+    """
+    Stream the records into .npy files, memory-mapped and preallocated for
+    maxit iterations, in the given directory. Each record costs a write
+    into the page cache, so memory doesn't grow with the number of
+    iterations. The per-run results are RecordReaders.
+
+    The files of run k are runk_x.npy (shape (maxit, nvar)), runk_H.npy
+    (shape (maxit,) + H.shape), runk_feval.npy (all the function values,
+    concatenated) and runk_fevalptr.npy (offsets of the iterations in the
+    latter), and runk.json (number of iterations actually recorded).
+
+    Parameters
+    ----------
+    directory: string
+        where to write the files; created if need be
+
+    fields: sequence of strings, optional (default ('feval', 'x', 'H'))
+        records to keep (see MemorySink)
+
+    """
+
+    def __init__(self, directory, fields=FIELDS):
+        self.directory = directory
+        self.fields = _check_fields(fields)
+
+    def open(self, run, nvar, maxit, H0=1.):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:  # created meanwhile by another worker
+                if not os.path.isdir(self.directory):
+                    raise
+        return MemmapRecorder(self.directory, run, nvar, maxit,
+                              fields=self.fields)
+
+
+class MemoryRecorder(object):
+    """
+    Recorder of MemorySink (and NullSink).
+
+    """
+
+    def __init__(self, fields=FIELDS, history=None):
+        self.fields = fields
+        self.history = history
+        self.fevalrec = []
+        self.xrec = []
+        self.Hrec = []
+
+    def append(self, x, fevalrec, H):
+        if 'feval' in self.fields:
+            self.fevalrec.append(fevalrec)
+        if 'x' in self.fields:
+            self.xrec.append(np.array(x))
+        if 'H' in self.fields:
+            if self.history is not None and hasattr(H, 'toarray'):
+                # full BFGS: H is entirely determined by the updates
+                self.history.snapshot()
+                self.Hrec = self.history
+            else:
+                self.Hrec.append(_dense(H))
+
+    def update(self, s, y, scale=1.):
+        if self.history is not None and 'H' in self.fields:
+            self.history.update(s, y, scale=scale)
+
+    def close(self):
+        return self.fevalrec, self.xrec, self.Hrec
+
+
+class MemmapRecorder(object):
+    """
+    Recorder of MemmapSink.
+
+    """
+
+    def __init__(self, directory, run, nvar, maxit, fields=FIELDS):
+        self.fields = fields
+        self.directory = directory
+        self.run = run
+        self.prefix = os.path.join(directory, "run%i" % run)
+        self.maxit = maxit
+        self.niter = 0
+        self.nfeval = 0
+        self._H = None  # allocated on first record, when H.shape is known
+        if 'x' in fields:
+            self._x = self._create('x', (maxit, nvar))
+        if 'feval' in fields:
+            self._feval = self._create('feval', (4 * maxit,))
+            self._fevalptr = self._create('fevalptr', (maxit + 1,),
+                                          dtype=np.int64)
+            self._fevalptr[0] = 0
+
+    def _create(self, field, shape, dtype=np.float64):
+        return np.lib.format.open_memmap("%s_%s.npy" % (self.prefix, field),
+                                         mode='w+', dtype=dtype, shape=shape)
+
+    def __getstate__(self):
+        # e.g for a checkpoint: the files are flushed, and reopened when
+        # unpickled, rather than copied into the pickle
+        state = self.__dict__.copy()
+        for field in ('x', 'feval', 'fevalptr', 'H'):
+            mm = state.get('_' + field)
+            if mm is not None:
+                mm.flush()
+                state['_' + field] = True
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for field in ('x', 'feval', 'fevalptr', 'H'):
+            if getattr(self, '_' + field, None) is True:
+                setattr(self, '_' + field, np.lib.format.open_memmap(
+                        "%s_%s.npy" % (self.prefix, field), mode='r+'))
+
+    def append(self, x, fevalrec, H):
+        k = self.niter
+        if 'x' in self.fields:
+            self._x[k] = x
+        if 'feval' in self.fields:
+            fevalrec = np.ravel(fevalrec)
+            stop = self.nfeval + len(fevalrec)
+            if stop > len(self._feval):
+                # reallocate with twice the capacity (this is rare)
+                old = self._feval
+                self._feval = self._create('feval.tmp', (2 * stop,))
+                self._feval[:self.nfeval] = old[:self.nfeval]
+                del old
+                os.rename("%s_feval.tmp.npy" % self.prefix,
+                          "%s_feval.npy" % self.prefix)
+            self._feval[self.nfeval:stop] = fevalrec
+            self._fevalptr[k + 1] = stop
+            self.nfeval = stop
+        if 'H' in self.fields:
+            if self._H is None:
+                self._H = self._create('H', (self.maxit,) + _shape(H))
+            if hasattr(H, 'toarray'):
+                H.toarray(out=self._H[k])  # no temporary copy
+            else:
+                self._H[k] = H
+        self.niter = k + 1
+
+    def update(self, s, y, scale=1.):
+        pass
+
+    def close(self):
+        for field in ('x', 'feval', 'fevalptr', 'H'):
+            mm = getattr(self, '_' + field, None)
+            if mm is not None:
+                mm.flush()
+                setattr(self, '_' + field, None)
+        with open(self.prefix + ".json", 'w') as fd:
+            json.dump(dict(niter=self.niter, nfeval=self.nfeval,
+                           fields=list(self.fields)), fd)
+        reader = RecordReader(self.directory, self.run)
+        return reader.fevalrec, reader.xrec, reader.Hrec
+
+
+class RecordReader(object):
+    """
+    Lazy reader for the records of a run written by MemmapSink. The
+    records are sequences which only memory-map the files (read-only) when
+    indexed or iterated over; they are cheap to pickle, e.g to send them
+    back from a worker process.
+
+    Parameters
+    ----------
+    directory: string
+        directory of the MemmapSink
+
+    run: int
+        index of the run
+
+    Attributes
+    ----------
+    fevalrec: sequence of 1D arrays
+        function values evaluated in the line search of each iteration
+
+    xrec: sequence of 1D arrays
+        iterates x (np.asarray(xrec) has shape (niter, nvar))
+
+    Hrec: sequence of arrays
+        inverse Hessian approximations
+
+    """
+
+    def __init__(self, directory, run):
+        self.prefix = os.path.join(directory, "run%i" % run)
+        with open(self.prefix + ".json") as fd:
+            meta = json.load(fd)
+        self.niter = meta['niter']
+        self.fields = tuple(meta['fields'])
+
+    def _record(self, field, cls):
+        if field not in self.fields or self.niter == 0:
+            return []
+        return cls(self.prefix, field, self.niter)
+
+    @property
+    def fevalrec(self):
+        return self._record('feval', RaggedRecord)
+
+    @property
+    def xrec(self):
+        return self._record('x', LazyRecord)
+
+    @property
+    def Hrec(self):
+        return self._record('H', LazyRecord)
+
+
+class LazyRecord(object):
+    """
+    Sequence of the per-iteration arrays of a record written by
+    MemmapSink, read lazily from disk.
+
+    """
+
+    def __init__(self, prefix, field, niter):
+        self.prefix = prefix
+        self.field = field
+        self.niter = niter
+
+    def _load(self):
+        return np.load("%s_%s.npy" % (self.prefix, self.field),
+                       mmap_mode='r')[:self.niter]
+
+    def __len__(self):
+        return self.niter
+
+    def __getitem__(self, k):
+        return self._load()[k]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __array__(self, dtype=None):
+        return np.asarray(self._load(), dtype=dtype)
+
+
+class RaggedRecord(LazyRecord):
+    """
+    Sequence of the per-iteration 1D arrays of function values written by
+    MemmapSink, read lazily from disk.
+
+    """
+
+    def _load(self):
+        feval = np.load("%s_feval.npy" % self.prefix, mmap_mode='r')
+        ptr = np.load("%s_fevalptr.npy" % self.prefix, mmap_mode='r')
+        return [feval[ptr[k]:ptr[k + 1]] for k in xrange(self.niter)]
+
+
+def _check_fields(fields):
+    fields = tuple(fields)
+    for field in fields:
+        if field not in FIELDS:
+            raise ValueError("Unknown record field: %s (expecting one of %s)"
+                             % (field, FIELDS))
+    return fields
+
+
+def _shape(H):
+    return (H.n, H.n) if hasattr(H, 'toarray') else np.shape(H)
+
+
+def _dense(H):
+    return H.toarray() if hasattr(H, 'toarray') else np.array(H)
@@ -0,0 +1,87 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    Fixed-capacity buffer of vectors, stored as the columns of a single
+    Fortran-ordered 2D array which is allocated once and for all.
+
+    Columns are written into slots 0, 1, ..., capacity - 1, and then
+    cyclically over the oldest column. Thus, the occupied slots are always
+    the first `size` ones, and data[:, :size] is a contiguous view of the
+    stored vectors (albeit not in chronological order; see `order`).
+
+    Parameters
+    ----------
+    nrows: int
+        length of the stored vectors
+
+    capacity: int
+        maximum number of vectors stored; once full, appending a vector
+        evicts the oldest one
+
+    dtype: numpy dtype, optional (default float)
+        data type of the stored vectors
+
+    """
+
+    def __init__(self, nrows, capacity, dtype=float):
+        self.data = np.empty((nrows, capacity), dtype=dtype, order='F')
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # slot of the next vector to write
+
+    def append(self, v):
+        """
+        Store v in the buffer, evicting the oldest vector if the buffer
+        is full. This costs O(nrows).
+
+        Returns
+        -------
+        slot: int
+            index of the column in which v was stored
+
+        """
+
+        slot = self.head
+        self.data[:, slot] = v
+        self.head = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return slot
+
+    def reset(self):
+        """
+        Empty the buffer (the memory is kept).
+
+        """
+
+        self.size = 0
+        self.head = 0
+
+    def order(self):
+        """
+        Slots of the stored vectors, from oldest to newest.
+
+        """
+
+        if self.size < self.capacity:
+            return np.arange(self.size)
+        else:
+            return np.roll(np.arange(self.capacity), -self.head)
+
+    def view(self):
+        """
+        Contiguous (nrows, size) view of the stored vectors, in slot order.
+
+        """
+
+        return self.data[:, :self.size]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
@@ -0,0 +1,144 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import numpy as np
+from scipy.linalg.blas import get_blas_funcs
+
+
+class SymMatrix(object):
+    """
+    Symmetric matrix, stored as its upper triangle and updated in place
+    through level-2 BLAS (symv/syr2, or spmv/spr2 for packed storage), so
+    that no temporary of the size of the matrix is ever allocated.
+
+    Parameters
+    ----------
+    n: int
+        number of rows (and columns) of the matrix
+
+    A: float, 1D array of length n, or 2D array of shape (n, n),
+    optional (default 1.)
+        initial value: a multiple of the identity, a diagonal, or a full
+        symmetric matrix (only its upper triangle is read)
+
+    packed: boolean, optional (default False)
+        if set, the upper triangle is packed column by column into a 1D
+        array of length n * (n + 1) / 2, which halves the memory;
+        otherwise it is stored in a Fortran-ordered (n, n) array, whose
+        lower triangle is only filled in by `toarray`
+
+    dtype: numpy dtype, optional (default np.float64)
+        precision of the storage: np.float64 or np.float32 (which halves
+        the memory again); products are returned in double precision
+
+    """
+
+    def __init__(self, n, A=1., packed=False, dtype=np.float64):
+        self.n = n
+        self.packed = packed
+        if packed:
+            self.data = np.zeros(n * (n + 1) // 2, dtype=dtype)
+        else:
+            self.data = np.zeros((n, n), dtype=dtype, order='F')
+        self._get_blas_funcs()
+
+        if np.ndim(A) < 2:
+            # multiple of the identity, or diagonal
+            diag = np.arange(n)
+            if packed:
+                diag = diag * (diag + 1) // 2 + diag
+                self.data[diag] = A
+            else:
+                self.data[diag, diag] = A
+        else:
+            for j in xrange(n):
+                self._column(j)[:] = A[:j + 1, j]
+
+    def _get_blas_funcs(self):
+        self._symv, self._syr2, self._spmv, self._spr2 = get_blas_funcs(
+            ('symv', 'syr2', 'spmv', 'spr2'), (self.data,))
+
+    def __getstate__(self):
+        # the BLAS wrappers can't be pickled (e.g for a checkpoint)
+        return dict(n=self.n, packed=self.packed, data=self.data)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._get_blas_funcs()
+
+    def _column(self, j):
+        """
+        View of the (upper triangle) column j, i.e entries 0..j.
+
+        """
+
+        if self.packed:
+            start = j * (j + 1) // 2
+            return self.data[start:start + j + 1]
+        else:
+            return self.data[:j + 1, j]
+
+    def dot(self, v):
+        """
+        Product of the matrix by the vector v.
+
+        """
+
+        v = np.asarray(v, dtype=self.data.dtype).ravel()
+        if self.packed:
+            r = self._spmv(self.n, 1., self.data, v)
+        else:
+            r = self._symv(1., self.data, v)
+        return np.asarray(r, dtype=float)
+
+    def syr2(self, alpha, x, y):
+        """
+        Symmetric rank-two update A += alpha * (x * y' + y * x'), in place.
+
+        """
+
+        x = np.asarray(x, dtype=self.data.dtype).ravel()
+        y = np.asarray(y, dtype=self.data.dtype).ravel()
+        # the storage is contiguous and of the right type, so it is
+        # overwritten (rather than copied) by the BLAS wrappers
+        if self.packed:
+            self.data = self._spr2(self.n, alpha, x, y, self.data,
+                                   overwrite_ap=1)
+        else:
+            self.data = self._syr2(alpha, x, y, a=self.data, overwrite_a=1)
+
+    def scale(self, c):
+        """
+        A *= c, in place.
+
+        """
+
+        self.data *= c
+
+    def toarray(self, copy=True, out=None):
+        """
+        The matrix, as a full symmetric (n, n) array in double precision,
+        written into out if given (e.g a row of a memory-mapped file).
+        With copy=False and unpacked double precision storage, the lower
+        triangle is filled in place and the storage itself is returned
+        (the matrix must then no longer be updated).
+
+        """
+
+        if out is not None:
+            A = out
+        elif copy or self.packed or self.data.dtype != np.float64:
+            A = np.empty((self.n, self.n), order='F')
+        else:
+            A = self.data
+        for j in xrange(self.n):
+            column = self._column(j)
+            A[:j + 1, j] = column
+            A[j, :j] = column[:-1]
+        return A
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
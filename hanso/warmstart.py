@@ -0,0 +1,115 @@
+"""
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import copy
+import numpy as np
+
+from symmatrix import SymMatrix
+
+
+class WarmStart(object):
+    """
+    State handed over from a BFGS solve to the next one, for a sequence of
+    related problems (e.g a regularization path, see path.py).
+
+    A WarmStart is passed to bfgs1run (or to bfgs and hanso, which pass
+    it on) via the `warm_start` parameter. If it is not empty, the run
+    starts from its limited memory pairs (limited memory BFGS) or, if
+    `hessian` is set, its inverse Hessian approximation (full BFGS),
+    instead of H0, and from its bundle of points, whose gradients are
+    re-evaluated (in a single batch, see Oracle.batch) for the termination
+    test. On exit, the run leaves its own final state in it (for bfgs, the
+    state of the best run).
+
+    Parameters
+    ----------
+    hessian: boolean, optional (default False)
+        if set, full BFGS starts from the previous inverse Hessian
+        approximation (see `inverse_hessian`); on nonsmooth objectives,
+        this is usually slower than starting from H0
+
+    cond: float, optional (default 1e2)
+        bound on the condition number of that inverse Hessian
+        approximation: its eigenvalues are raised to at least its largest
+        one divided by cond; None for no bound
+
+    Attributes
+    ----------
+    H: SymMatrix, or None
+        final inverse Hessian approximation of full BFGS
+
+    S, Y: 2D arrays of shape (nvar, k), or None
+        final (s, y) pairs of limited memory BFGS, oldest first
+
+    rho: 1D array of length k, or None
+        the corresponding 1 / s'y
+
+    Hdiag: float or 1D array, or None
+        final scaled H0 of limited memory BFGS
+
+    X: 2D array of shape (nvar, nG), or None
+        points where the saved gradients were evaluated, oldest first
+
+    f: float
+        final function value
+
+    """
+
+    def __init__(self, hessian=False, cond=1e2):
+        self.hessian = hessian
+        self.cond = cond
+        self.H = None
+        self.S = None
+        self.Y = None
+        self.rho = None
+        self.Hdiag = None
+        self.X = None
+        self.f = np.inf
+
+    @property
+    def empty(self):
+        return self.X is None
+
+    def inverse_hessian(self, packed=False, dtype=np.float64):
+        """
+        The inverse Hessian approximation H to start full BFGS from, as a
+        SymMatrix with the given storage.
+
+        On a nonsmooth objective, BFGS drives some eigenvalues of H towards
+        0 (along the directions in which f is nonsmooth at the solution),
+        so that the final H is extremely ill-conditioned. Those directions
+        change with the problem (e.g some coefficients leave 0 as the
+        penalty decreases), and handing H over unchanged makes the next
+        solves slower than cold ones, increasingly so along a path. Hence
+        the eigenvalues of H are first raised to at least 1 / cond of the
+        largest one, at the cost of an eigendecomposition. This only goes
+        so far: when H is small in every direction (f being nonsmooth in
+        all of them), the solves remain slower than cold ones.
+
+        """
+
+        H = self.H.toarray()
+        if self.cond is not None:
+            w, V = np.linalg.eigh(H)
+            w = np.maximum(w, w[-1] / self.cond)
+            H = np.dot(V * w, V.T)
+        return SymMatrix(len(H), H, packed=packed, dtype=dtype)
+
+    def copy(self):
+        """
+        Shallow copy, e.g for one of several runs started from the same
+        state (the runs never modify the arrays of a WarmStart in place).
+
+        """
+
+        return copy.copy(self)
+
+    def update(self, other):
+        """
+        Take over the state of other.
+
+        """
+
+        self.__dict__.update(other.__dict__)
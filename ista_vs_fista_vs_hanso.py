@@ -1,136 +1,479 @@
+"""
+Benchmark of HANSO against proximal methods (ISTA and FISTA), on penalized
+linear regression problems:
+
+    min_x .5 * ||A * x - b||^2 + penalty(x)
+
+with a random or convolutional design A (or one read from a .npy file,
+possibly larger than memory), and an l1, TV, or TV + l1 penalty. The
+solvers produce time-to-accuracy curves (time and objective value after
+each iteration), returned as data, so that they can be tracked across
+problem sizes and versions.
+
+Usage:
+
+    PYTHONPATH=. python ista_vs_fista_vs_hanso.py
+    PYTHONPATH=. python ista_vs_fista_vs_hanso.py --design convolutional \\
+        --penalty tv --m 1000 --n 10000 -o curves.json
+    PYTHONPATH=. python ista_vs_fista_vs_hanso.py --plot
+    PYTHONPATH=. python ista_vs_fista_vs_hanso.py --m 100000 --n 10000 \\
+        --save-design design.npy
+    PYTHONPATH=. python ista_vs_fista_vs_hanso.py --m 100000 --n 10000 \\
+        --design design.npy --penalty l1
+
+or, from python:
+
+    >>> problem = RegressionProblem(100, 300, design="convolutional",
+    ...                             penalty="tv")
+    >>> results = run_benchmark(problem, maxit=1000)
+
+:Author: DOHMATOB Elvis Dopgima <gmdopp@gmail.com> <elvis.dohmatob@inria.fr>
+
+"""
+
+import sys
+import json
 import time
 from math import sqrt
 import numpy as np
-from scipy import linalg, signal
-import pylab as pl
-from pyHANSO.example_functions import l1, grad_l1, tv, grad_tv
-
-penalty_model = "tv"
-
-rng = np.random.RandomState(42)  # pseudo-random number generator
-m, n, k = 100, 300, 10
-design = "convolutional"
-alpha = 1.  # param for tv+l1
-rho = .7  # param for tv+l1
-lambd = 0.01  # param for tv or l1 only
-
-# random design
-if design.lower() == "random":
-    A = rng.randn(m, n)  # random design
-    A = np.tile(rng.randn(m), (n, 1)).T + 0.0001 * rng.randn(m, n)
-# convolutional design
-elif design.lower() == "convolutional":
-    h = signal.gaussian(50, 5)
-    A = signal.convolve2d(np.eye(n), h[:, np.newaxis], 'same')
-    A = A[::n // m]
-else:
-    raise ValueError("Unknown design: %s" % design)
-
-# l1-sparse betamap
-x0 = rng.rand(n)
-x0[x0 < 0.3] = 0
-
-# tv+l1 sparse betamap
-# if penalty_model == "tv":
-#     x0 = signal.waveforms.square(rng.randn(n))
-if penalty_model in ['tv', 'tv+l1']:
-    x0 = np.zeros(n)
-    x0[10:80] = 1.
-    x0[n // 2: n // 2 + 51] = 2.
-    x0[230:280] = -np.pi
-
-# observed signal
-b = np.dot(A, x0)
-b += rng.randn(len(b)) * 1e-1  # add noise
+from scipy import linalg
+from scipy.sparse.linalg import LinearOperator, aslinearoperator
 
+from hanso.hanso import hanso as _hanso
+from hanso.setx0 import setx0
+from hanso.chunked import ChunkedMatrix
+from hanso.example_functions import l1, grad_l1, tv, grad_tv
+from hanso.composite import (CompositeOracle, squared_loss, l1_penalty,
+                             tv_penalty, sum_penalties)
 
-def concat_times(times1, times2):
-    if len(times2) == 0:
-        return times1
-    elif len(times1) > 0:
-        return np.hstack((times1, times1[-1] + np.array(times2)))
-    else:
-        return times2
+DESIGNS = ("random", "correlated", "convolutional")
+PENALTIES = ("l1", "tv", "tv+l1")
+HANSO_X0_INIT_MODES = ("fista", "random")
+
+# full BFGS stores n x n floats: above this size, HANSO runs limited
+# memory BFGS
+MAX_FULL_NVAR = 5000
+
+
+def make_design(m, n, design="convolutional", rng=None, width=50, std=5.):
+    """
+    Design matrix of a regression problem, as a LinearOperator.
+
+    Parameters
+    ----------
+    m: int
+        number of samples (rows)
+
+    n: int
+        number of features (columns)
+
+    design: string, optional (default "convolutional")
+        kind of design. Possible values are:
+        "random": i.i.d standard normal entries (stored densely: m * n
+        floats)
+        "correlated": nearly collinear columns (a common random column
+        plus small noise; stored densely)
+        "convolutional": convolution of the signal by a gaussian kernel,
+        followed by a subsampling to m samples; the matrix is never formed
+        (O(n * width) per product), so this is the design for large sizes
+        "*.npy": path of a file holding the matrix (e.g written by
+        save_design), which is memory-mapped; the products stream its rows
+        (see ChunkedMatrix), so it needn't fit in memory
+
+    rng: np.random.RandomState, optional (default None)
+        random number generator
+
+    width: int, optional (default 50)
+        length of the kernel of the convolutional design
+
+    std: float, optional (default 5.)
+        standard deviation of the kernel of the convolutional design
+
+    Returns
+    -------
+    A: LinearOperator of shape (m, n)
 
+    Raises
+    ------
+    ValueError
 
-def unpenalized_loss_func(A, b, x):
-    return .5 * linalg.norm(np.dot(A, x) - b) ** 2
+    """
+
+    rng = np.random.RandomState(42) if rng is None else rng
+    if design == "random":
+        return aslinearoperator(rng.randn(m, n))
+    elif design == "correlated":
+        return aslinearoperator(np.tile(rng.randn(m), (n, 1)).T +
+                                0.0001 * rng.randn(m, n))
+    elif design == "convolutional":
+        # scipy.signal.gaussian(width, std)
+        h = np.exp(-.5 * ((np.arange(width) - (width - 1) / 2.) / std) ** 2)
+        step = max(n // m, 1)
+        rows = np.arange(0, n, step)[:m]
+        if len(rows) < m:
+            raise ValueError("convolutional design needs m <= n, got m = %i, "
+                             "n = %i" % (m, n))
+
+        def matvec(x):
+            return np.convolve(np.ravel(x), h, 'same')[rows]
+
+        def rmatvec(z):
+            u = np.zeros(n)
+            u[rows] = np.ravel(z)
+            return np.convolve(u, h[::-1], 'full')[width // 2:width // 2 + n]
+
+        return LinearOperator((m, n), matvec=matvec, rmatvec=rmatvec,
+                              dtype=np.float64)
+    elif design.endswith(".npy"):
+        A = ChunkedMatrix(design)
+        if A.shape != (m, n):
+            raise ValueError("%s has shape %s, expecting (%i, %i)" % (
+                    design, A.shape, m, n))
+        return A
+    else:
+        raise ValueError("Unknown design: %s (expecting one of %s)" % (
+                design, DESIGNS))
 
 
-def l1_pernalized_loss_function(A, b, x):
+def save_design(filename, m, n, rng=None, dtype=np.float32, chunksize=1000):
     """
-    Frobenius + l1 penalty
+    Write an m x n random design (i.i.d standard normal entries) to a .npy
+    file, chunksize rows at a time, so that it needn't fit in memory.
 
     """
 
-    return .5 * linalg.norm(np.dot(A, x) - b) ** 2 + lambd * l1(x)
+    rng = np.random.RandomState(42) if rng is None else rng
+    A = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                  shape=(m, n))
+    for start in xrange(0, m, chunksize):
+        stop = min(start + chunksize, m)
+        A[start:stop] = rng.randn(stop - start, n)
+    A.flush()
+    del A
 
 
-def tv_pernalized_loss_function(A, b, x):
+def lipschitz_constant(A, maxit=100, tol=1e-6, rng=None):
     """
-    Frobenius + TV penalty
+    Squared spectral norm of A (the Lipschitz constant of the gradient of
+    .5 * ||A * x - b||^2), by power iteration on A' * A. The iteration
+    converges from below, so the estimate is inflated by 0.1%, to keep the
+    proximal steps 1 / L safe.
 
     """
 
-    return .5 * linalg.norm(np.dot(A, x) - b) ** 2 + lambd * tv(x)
+    rng = np.random.RandomState(0) if rng is None else rng
+    x = rng.randn(A.shape[1])
+    x /= linalg.norm(x)
+    L = 0.
+    for _ in xrange(maxit):
+        y = A.rmatvec(A.matvec(x))
+        Lold, L = L, linalg.norm(y)
+        x = y / L
+        if abs(L - Lold) <= tol * L:
+            break
+    return 1.001 * L
+
+
+def soft_thresh(x, l):
+    return np.sign(x) * np.maximum(np.abs(x) - l, 0.)
 
 
-def tv_plus_l1_pernalized_loss_function(A, b, x):
+def tv_prox(y, l):
     """
-    Frobenius + TV penalty + l1 penalty
+    Proximal operator of l * tv, i.e the solution of the 1D TV denoising
+    problem min_x .5 * ||x - y||^2 + l * tv(x), by Condat's direct
+    algorithm (exact, O(n) in practice).
+
+    Reference
+    ---------
+    L. Condat, A Direct Algorithm for 1D Total Variation Denoising, IEEE
+    Signal Processing Letters 20 (2013), pp. 1054-1057
 
     """
 
-    return .5 * linalg.norm(np.dot(A, x) - b) ** 2 + alpha * (
-        rho * tv(x) + (1 - alpha) * l1(x))
+    y = np.ravel(y)
+    n = len(y)
+    x = np.empty(n)
+    if n == 0:
+        return x
+    k = k0 = kplus = kminus = 0
+    umin, umax = l, -l
+    vmin, vmax = y[0] - l, y[0] + l
+    while True:
+        while k == n - 1:
+            if umin < 0.:
+                x[k0:kminus + 1] = vmin
+                k = k0 = kminus = kminus + 1
+                vmin = y[k]
+                umin = l
+                umax = vmin + umin - vmax
+            elif umax > 0.:
+                x[k0:kplus + 1] = vmax
+                k = k0 = kplus = kplus + 1
+                vmax = y[k]
+                umax = -l
+                umin = vmax + umax - vmin
+            else:
+                vmin += umin / (k - k0 + 1)
+                x[k0:] = vmin
+                return x
+        umin += y[k + 1] - vmin
+        if umin < -l:
+            # negative jump
+            x[k0:kminus + 1] = vmin
+            k = k0 = kminus = kplus = kminus + 1
+            vmin = y[k]
+            vmax = vmin + 2 * l
+            umin, umax = l, -l
+            continue
+        umax += y[k + 1] - vmax
+        if umax > l:
+            # positive jump
+            x[k0:kplus + 1] = vmax
+            k = k0 = kminus = kplus = kplus + 1
+            vmax = y[k]
+            vmin = vmax - 2 * l
+            umin, umax = l, -l
+            continue
+        k += 1
+        if umin >= l:
+            kminus = k
+            vmin += (umin - l) / (kminus - k0 + 1)
+            umin = l
+        if umax <= -l:
+            kplus = k
+            vmax += (umax + l) / (kplus - k0 + 1)
+            umax = -l
+
+
+class RegressionProblem(object):
+    """
+    Penalized linear regression problem, with a sparse (l1) or piecewise
+    constant (tv, tv+l1) ground truth, and noisy observations.
 
+    Parameters
+    ----------
+    m: int
+        number of samples
 
-# define loss function according to penalty model (l1, tv, tv+l1, etc.)
-if penalty_model == 'l1':
-    loss_function = l1_pernalized_loss_function
-elif penalty_model == "tv":
-    # l = .05
-    loss_function = tv_pernalized_loss_function
-elif penalty_model == 'tv+l1':
-    loss_function = tv_plus_l1_pernalized_loss_function
-else:
-    raise ValueError("Unknown penalty model: %s" % penalty_model)
+    n: int
+        number of features
 
+    design: string, optional (default "convolutional")
+        see make_design
 
-def soft_thresh(x, l):
-    return np.sign(x) * np.maximum(np.abs(x) - l, 0.)
+    penalty: string, optional (default "tv")
+        penalty model: "l1" (lambd * l1(x)), "tv" (lambd * tv(x)) or
+        "tv+l1" (alpha * (rho * tv(x) + (1 - rho) * l1(x)))
+
+    lambd: float, optional (default .01)
+        regularization parameter of the l1 and tv penalties
+
+    alpha: float, optional (default 1.)
+        regularization parameter of the tv+l1 penalty
+
+    rho: float, optional (default .7)
+        tv / l1 trade-off of the tv+l1 penalty
 
+    noise: float, optional (default .1)
+        standard deviation of the noise on the observations
+
+    seed: int, optional (default 42)
+        seed of the random design, ground truth and noise
+
+    Attributes
+    ----------
+    A: LinearOperator of shape (m, n)
+        design
+
+    b: 1D array of length m
+        observations
+
+    x_true: 1D array of length n
+        ground truth
+
+    L: float
+        Lipschitz constant of the gradient of the smooth part
+
+    Raises
+    ------
+    ValueError
+
+    """
+
+    def __init__(self, m, n, design="convolutional", penalty="tv",
+                 lambd=.01, alpha=1., rho=.7, noise=.1, seed=42):
+        if penalty not in PENALTIES:
+            raise ValueError("Unknown penalty model: %s (expecting one of "
+                             "%s)" % (penalty, PENALTIES))
+        self.m, self.n = m, n
+        self.design = design
+        self.penalty = penalty
+        self.lambd, self.alpha, self.rho = lambd, alpha, rho
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self.A = make_design(m, n, design=design, rng=rng)
+
+        if penalty == "l1":
+            # l1-sparse betamap
+            x_true = rng.rand(n)
+            x_true[x_true < 0.3] = 0
+        else:
+            # piecewise constant betamap (same as for n = 300 originally)
+            x_true = np.zeros(n)
+            x_true[n * 10 // 300:n * 80 // 300] = 1.
+            x_true[n // 2:n // 2 + n * 51 // 300] = 2.
+            x_true[n * 230 // 300:n * 280 // 300] = -np.pi
+        self.x_true = x_true
+
+        # observed signal
+        self.b = self.A.matvec(x_true) + rng.randn(m) * noise
+        self.L = lipschitz_constant(self.A)
+
+    def _weights(self):
+        """
+        Weights of the tv and l1 terms of the penalty.
+
+        """
+
+        if self.penalty == "l1":
+            return 0., self.lambd
+        elif self.penalty == "tv":
+            return self.lambd, 0.
+        return self.alpha * self.rho, self.alpha * (1. - self.rho)
+
+    def loss(self, x):
+        """
+        Objective value at x.
+
+        """
+
+        wtv, wl1 = self._weights()
+        return .5 * linalg.norm(self.A.matvec(x) - self.b) ** 2 + (
+            wtv * tv(x) if wtv else 0.) + (wl1 * l1(x) if wl1 else 0.)
+
+    def oracle(self):
+        """
+        The objective, as a CompositeOracle for HANSO: along the line
+        searches, A * x is updated rather than recomputed, so that each
+        iteration costs one product by A and one by A'.
+
+        """
+
+        wtv, wl1 = self._weights()
+        penalties = []
+        if wtv:
+            penalties.append(tv_penalty(wtv))
+        if wl1:
+            penalties.append(l1_penalty(wl1))
+        return CompositeOracle(self.A, squared_loss(self.b),
+                               penalty=sum_penalties(*penalties))
+
+    def fg(self, x):
+        """
+        Objective value and (sub)gradient at x (one product by A and one
+        by A').
+
+        """
+
+        wtv, wl1 = self._weights()
+        z = self.A.matvec(x) - self.b
+        f = .5 * linalg.norm(z) ** 2
+        g = self.A.rmatvec(z)
+        if wtv:
+            f += wtv * tv(x)
+            g += wtv * grad_tv(x)
+        if wl1:
+            f += wl1 * l1(x)
+            g += wl1 * grad_l1(x)
+        return f, g
+
+    def prox(self, x, step):
+        """
+        Proximal operator of step * penalty: soft-thresholding for l1,
+        Condat's algorithm for tv, and both in turn for tv+l1 (which is
+        exact in 1D).
+
+        """
+
+        wtv, wl1 = self._weights()
+        if wtv:
+            x = tv_prox(x, step * wtv)
+        if wl1:
+            x = soft_thresh(x, step * wl1)
+        return x
+
+    def params(self):
+        return dict(m=self.m, n=self.n, design=self.design,
+                    penalty=self.penalty, lambd=self.lambd,
+                    alpha=self.alpha, rho=self.rho, seed=self.seed)
 
-def ista(A, b, maxit):
-    x = np.zeros(A.shape[1])
+
+def concat_times(times1, times2):
+    if len(times2) == 0:
+        return times1
+    elif len(times1) > 0:
+        return np.hstack((times1, times1[-1] + np.array(times2)))
+    else:
+        return times2
+
+
+def ista(problem, maxit):
+    """
+    ISTA (proximal gradient descent), from 0.
+
+    Returns
+    -------
+    x: 1D array
+        final iterate
+
+    pobj: 1D array
+        objective value after each iteration
+
+    times: 1D array
+        time elapsed after each iteration
+
+    """
+
+    A, b, L = problem.A, problem.b, problem.L
+    x = np.zeros(problem.n)
     pobj = []
-    L = linalg.norm(A) ** 2
     t0 = time.time()
     for _ in xrange(maxit):
-        x = soft_thresh(x + np.dot(A.T, b - A.dot(x)) / L, lambd / L)
-        pobj.append((time.time() - t0,
-                     loss_function(A, b, x)))
+        x = problem.prox(x + A.rmatvec(b - A.matvec(x)) / L, 1. / L)
+        pobj.append((time.time() - t0, problem.loss(x)))
 
     times, pobj = map(np.array, zip(*pobj))
     return x, pobj, times
 
 
-def fista(A, b, maxit, stop_if_energy_rises=False):
-    x = np.zeros(A.shape[1])
+def fista(problem, maxit, stop_if_energy_rises=False):
+    """
+    FISTA (accelerated proximal gradient descent), from 0. With
+    stop_if_energy_rises, it stops as soon as the objective increases
+    (this is used to initialize HANSO).
+
+    Returns
+    -------
+    Same as ista.
+
+    """
+
+    A, b, L = problem.A, problem.b, problem.L
+    x = np.zeros(problem.n)
     pobj = []
     t = 1
     z = x.copy()
-    L = linalg.norm(A) ** 2
     time0 = time.time()
     old_energy = np.inf
     for _ in xrange(maxit):
         xold = x.copy()
-        z = z + A.T.dot(b - A.dot(z)) / L
-        x = soft_thresh(z, lambd / L)
+        z = z + A.rmatvec(b - A.matvec(z)) / L
+        x = problem.prox(z, 1. / L)
         t0 = t
         t = (1 + sqrt(1 + 4 * t ** 2)) / 2.
         z = x + ((t0 - 1.) / t) * (x - xold)
-        energy = loss_function(A, b, x)
+        energy = problem.loss(x)
 
         if old_energy < energy and stop_if_energy_rises:
             break
@@ -144,158 +487,220 @@ def fista(A, b, maxit, stop_if_energy_rises=False):
     return x, pobj, times
 
 
-def hanso(A, b, maxit, x0_init="random"):
+def hanso(problem, maxit, x0_init="random", nvec=None, sampgrad=True,
+          verbose=0):
     """
-    Runs a flovor HANSO (customizable via the x0_init parameter).
+    Runs a flavor of HANSO (customizable via the x0_init parameter).
 
     Parameters
     ----------
-    x0_init: string, optional (defautl "random")
+    x0_init: string, optional (default "random")
         initialization mode for HANSO: Possible values are:
         "fista": run FISTA, and then switch to HANSO once energy starts
         to increase
         "random": initialize as usual (multivariate standard normal)
 
+    nvec: int, optional (default None)
+        param passed to bfgs; by default, full BFGS (0) up to
+        MAX_FULL_NVAR features, and limited memory BFGS (10) above
+
+    Returns
+    -------
+    Same as ista; the time and objective value of the gradient sampling
+    phase (if any) are appended as a last point.
+
     Raises
     ------
     ValueError
 
     """
 
-    from hanso.hanso import hanso
-    from hanso.setx0 import setx0
-
     nstart = 1
-
-    def fg_with_tv_plus_l1_penalty(x):
-        z = np.dot(A, x) - b
-        return (.5 * linalg.norm(z) ** 2 + lambd * l1(x),
-                 np.dot(A.T, z) + lambd * grad_l1(x))
-
-    def fg_with_l1_penalty(x):
-        z = np.dot(A, x) - b
-        return (.5 * linalg.norm(z) ** 2 + lambd * l1(x),
-                 np.dot(A.T, z) + lambd * grad_l1(x))
-
-    def fg_with_tv_penalty(x):
-        z = np.dot(A, x) - b
-        return (.5 * linalg.norm(z) ** 2 + lambd * tv(x),
-                 np.dot(A.T, z) + lambd * grad_tv(x))
-
     pobj = []
     times = []
-
-    # penalty dependent gradient definition
-    if penalty_model == "l1":
-        fg = fg_with_l1_penalty
-    elif penalty_model == "tv":
-        fg = fg_with_tv_penalty
-    elif penalty_model == "tv+l1":
-        fg = fg_with_tv_plus_l1_penalty
-    else:
-        raise ValueError("Unknown penalty model: %s" % penalty_model)
+    if nvec is None:
+        nvec = 0 if problem.n <= MAX_FULL_NVAR else 10
 
     if x0_init == "fista":
-        x0, pobj, times = fista(A, b, maxit=maxit,
+        x0, pobj, times = fista(problem, maxit=maxit,
                                 stop_if_energy_rises=True)
     elif x0_init == "random":
-        x0 = setx0(A.shape[1], nstart)
+        np.random.seed(problem.seed)
+        x0 = setx0(problem.n, nstart)
     else:
         raise ValueError("Unknown value for x0_init parameter: %s" % x0_init)
 
     maxit = maxit - len(pobj)
-    results = hanso(fg,
-                    x0=x0,
-                    sampgrad=True,
-                    maxit=maxit,
-                    nvec=0,
-                    verbose=2
-                    )
-    x = results[0]
+    if maxit <= 0:
+        # FISTA used up all the iterations
+        return x0, np.array(pobj), np.array(times)
+    time0 = time.time()
+    results = _hanso(problem.oracle(),
+                     x0=x0,
+                     sampgrad=sampgrad,
+                     maxit=maxit,
+                     nvec=nvec,
+                     verbose=verbose
+                     )
+    duration = time.time() - time0
+    x, f = results[0], results[1]
     _pobj = results[-1]
 
-    _times, _pobj = map(np.array, zip(*_pobj))
+    _times, _pobj = map(list, zip(*_pobj)) if _pobj else ([], [])
+    if not _pobj or f < _pobj[-1]:
+        # the gradient sampling phase is not in the BFGS trajectory
+        _times.append(duration)
+        _pobj.append(f)
     _times = concat_times(times, _times)
     _pobj = list(pobj) + list(_pobj)
 
-    return x, _pobj, _times
-
-
-maxit = 1000
-
-# HANSO
-hanso_x0_init_modes = [
-    "fista",  # uncomment if penalty is l1 only
-    'random'
-    ]
-pobj_hanso = []
-times_hanso = []
-for x0_init in hanso_x0_init_modes:
-    optimizer = "HANSO (%s x0 init)" % x0_init
-    x_hanso, pobj, times = hanso(A, b, maxit, x0_init=x0_init)
-    pobj_hanso.append(pobj)
-    times_hanso.append(times)
-    fmin_hanso = loss_function(A, b, x_hanso)
-    print "fmin %s: %s" % (optimizer, fmin_hanso)
-    print
-
-if penalty_model == "l1":
-    # ISTA
-    x_ista, pobj_ista, times_ista = ista(A, b, maxit)
-    fmin_ista = loss_function(A, b, x_ista)
-    print "xopt ISTA:", x_ista
-    print "fmin ISTA:", fmin_hanso
-    print
-
-    # FISTA
-    x_fista, pobj_fista, times_fista = fista(A, b, maxit)
-    fmin_fista = loss_function(A, b, x_fista)
-    print "xopt FISTA:", x_fista
-    print "fmin FISTA:", fmin_fista
-    print
-
-# repare for reporting
-pl.close('all')
-if penalty_model in ['l1', 'tv']:
-    params = "lambda = %g" % lambd
-elif penalty_model == "tv+l1":
-    params = "alpha = %g, rho = %g" % (alpha, rho)
-
-# plot time perfomance
-pl.figure()
-pl.title("Linear regression on %s design with %s penalty model (%s)" % (
-        design, penalty_model, params))
-for x0_init, times, pobj in zip(hanso_x0_init_modes,
-                                times_hanso, pobj_hanso):
-    optimizer = "HANSO (%s x0 init)" % x0_init
-    pl.plot(times, pobj, label=optimizer)
-
-if penalty_model == "l1":
-    pl.plot(times_ista, pobj_ista, label='ista')
-    pl.plot(times_fista, pobj_fista, label='fista')
-
-pl.xlabel('Time')
-pl.ylabel('Primal')
-pl.gca().set_xscale('log')
-pl.gca().set_yscale('log')
-pl.legend()
-
-# plot betamaps
-pl.figure()
-
-if penalty_model in ['tv+l1', 'tv']:
-    pl.plot(x0, label='True betamap')
-else:
-    pl.plot(x0, label='True betamap')
-
-pl.plot(x_hanso, label='HANSO estimated betamap')
-if penalty_model == "l1":
-    pl.plot(x_ista, '*-', label='ISTA estimated betamap')
-    pl.plot(x_fista, '^-', label='FISTA estimated betamap')
-pl.ylabel("beta values (i.e regression coffients)")
-pl.xlabel("conditions")
-pl.legend()
-pl.title(("Linear regression on %s design with %s penalty model "
-          "(%s)" % (design, penalty_model.upper(), params)))
-
-pl.show()
+    return x, np.array(_pobj), np.array(_times)
+
+
+def time_to_accuracy(times, pobj, fopt, eps):
+    """
+    Time after which the relative suboptimality (pobj - fopt) / |fopt|
+    stays below each eps (None if never reached).
+
+    """
+
+    times = np.asarray(times)
+    gap = (np.minimum.accumulate(pobj) - fopt) / max(abs(fopt), 1e-300)
+    result = []
+    for e in eps:
+        reached = np.nonzero(gap <= e)[0]
+        result.append(float(times[reached[0]]) if len(reached) else None)
+    return result
+
+
+def run_benchmark(problem, maxit=1000, hanso_x0_init_modes=None,
+                  proximal=True, eps=(1e-2, 1e-4, 1e-6), verbose=0,
+                  **kwargs):
+    """
+    Run ISTA, FISTA and HANSO (once per initialization mode) on a problem.
+
+    Parameters
+    ----------
+    problem: RegressionProblem
+        the problem
+
+    maxit: int, optional (default 1000)
+        number of iterations of each solver
+
+    hanso_x0_init_modes: list of strings, optional (default ("fista",
+    "random"))
+        initialization modes of HANSO (see hanso)
+
+    proximal: boolean, optional (default True)
+        if not set, ISTA and FISTA are not run
+
+    eps: list of floats, optional (default (1e-2, 1e-4, 1e-6))
+        relative accuracies for the time-to-accuracy table
+
+    **kwargs: param-value dict
+        passed to hanso (nvec, sampgrad)
+
+    Returns
+    -------
+    results: dict
+        'problem': parameters of the problem; 'fopt': best objective
+        value found by any solver, used as a proxy for the optimum; 'eps';
+        and 'solvers': for each solver, a dict with its 'times' and
+        'pobj' curves (lists), the final objective 'fmin', and
+        'time_to_accuracy' (one entry per eps)
+
+    """
+
+    if hanso_x0_init_modes is None:
+        hanso_x0_init_modes = HANSO_X0_INIT_MODES
+    curves = []
+    if proximal:
+        curves.append(("ISTA",) + ista(problem, maxit)[1:])
+        curves.append(("FISTA",) + fista(problem, maxit)[1:])
+    for x0_init in hanso_x0_init_modes:
+        curves.append(("HANSO (%s x0 init)" % x0_init,) + hanso(
+                problem, maxit, x0_init=x0_init, verbose=verbose,
+                **kwargs)[1:])
+
+    fopt = min(np.min(pobj) for _, pobj, _ in curves)
+    solvers = {}
+    for name, pobj, times in curves:
+        solvers[name] = dict(times=list(times), pobj=list(pobj),
+                             fmin=float(np.min(pobj)),
+                             time_to_accuracy=time_to_accuracy(
+                times, pobj, fopt, eps))
+        if verbose:
+            print >> sys.stderr, "%-24s fmin = %.6e  time to accuracy %s" % (
+                name, solvers[name]['fmin'], solvers[name]['time_to_accuracy'])
+    return dict(problem=problem.params(), maxit=maxit, fopt=fopt,
+                eps=list(eps), solvers=solvers)
+
+
+def plot(results):
+    """
+    Plot the time-to-accuracy curves of run_benchmark.
+
+    """
+
+    import pylab as pl
+
+    problem = results['problem']
+    pl.figure()
+    pl.title("Linear regression on %s design with %s penalty model "
+             "(m = %i, n = %i)" % (problem['design'], problem['penalty'],
+                                   problem['m'], problem['n']))
+    for name, curve in sorted(results['solvers'].items()):
+        pl.plot(curve['times'], np.array(curve['pobj']) - results['fopt'],
+                label=name)
+    pl.xlabel('Time')
+    pl.ylabel('Primal - best primal')
+    pl.gca().set_xscale('log')
+    pl.gca().set_yscale('log')
+    pl.legend()
+    pl.show()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark HANSO against ISTA and FISTA on penalized "
+        "linear regression")
+    parser.add_argument("--m", type=int, default=100)
+    parser.add_argument("--n", type=int, default=300)
+    parser.add_argument("--design", default="convolutional",
+                        help="one of %s, or the path of a .npy file" % (
+            ", ".join(DESIGNS)))
+    parser.add_argument("--save-design", metavar="FILENAME",
+                        help="write a random m x n design to a .npy file, "
+                        "and exit")
+    parser.add_argument("--penalty", default="tv", choices=PENALTIES)
+    parser.add_argument("--lambd", type=float, default=.01)
+    parser.add_argument("--alpha", type=float, default=1.)
+    parser.add_argument("--rho", type=float, default=.7)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--maxit", type=int, default=1000)
+    parser.add_argument("--modes", default=",".join(HANSO_X0_INIT_MODES),
+                        help="HANSO initialization modes")
+    parser.add_argument("-o", "--output", help="JSON file for the curves "
+                        "(default: standard output)")
+    parser.add_argument("--plot", action="store_true",
+                        help="plot the curves (needs matplotlib)")
+    args = parser.parse_args()
+
+    if args.save_design:
+        save_design(args.save_design, args.m, args.n,
+                    rng=np.random.RandomState(args.seed))
+        sys.exit(0)
+    problem = RegressionProblem(args.m, args.n, design=args.design,
+                                penalty=args.penalty, lambd=args.lambd,
+                                alpha=args.alpha, rho=args.rho,
+                                seed=args.seed)
+    results = run_benchmark(problem, maxit=args.maxit,
+                            hanso_x0_init_modes=args.modes.split(","),
+                            verbose=1)
+    output = open(args.output, "w") if args.output else sys.stdout
+    json.dump(results, output, sort_keys=True)
+    output.write("\n")
+    if args.plot:
+        plot(results)